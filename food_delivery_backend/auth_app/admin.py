@@ -7,4 +7,5 @@ admin.site.register(Vendor)
 admin.site.register(Notification)
 admin.site.register(FoodListing)
 admin.site.register(Order)
-admin.site.register(OTPStore)
\ No newline at end of file
+admin.site.register(OTPStore)
+admin.site.register(Promotion)
@@ -0,0 +1,19 @@
+from core_app.jwt_auth import ClaimsJWTAuthentication, ClaimsPrincipal
+
+from .models import Vendor
+
+
+class VendorPrincipal(ClaimsPrincipal):
+    """request.user for vendor tokens; request.user.load() returns the Vendor."""
+    id_claim = 'vendor_id'
+    model = Vendor
+    lookup_field = 'vendor_id'
+
+    @property
+    def vendor_id(self):
+        return self.id
+
+
+class VendorJWTAuthentication(ClaimsJWTAuthentication):
+    """Validates tokens from generate_vendor_jwt without a database query."""
+    principal_class = VendorPrincipal
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0010_remove_vendorcategory_vendor_order_delivery_lat_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vendor',
+            name='vendor_id',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+    ]
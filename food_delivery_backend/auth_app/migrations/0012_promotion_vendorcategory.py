@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0011_alter_vendor_vendor_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('discount_type', models.CharField(choices=[('percent', 'Percent off'), ('flat', 'Flat amount off each unit')], default='percent', max_length=10)),
+                ('discount_value', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('max_discount', models.DecimalField(blank=True, decimal_places=2, help_text='Cap on the discount per order', max_digits=10, null=True)),
+                ('min_order_amount', models.DecimalField(decimal_places=2, default=0, help_text='Items subtotal needed for the promotion to apply', max_digits=10)),
+                ('category', models.CharField(blank=True, default='', max_length=100)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('food', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='promotions', to='auth_app.foodlisting')),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promotions', to='auth_app.vendor')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VendorCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='categories', to='auth_app.vendor')),
+            ],
+        ),
+    ]
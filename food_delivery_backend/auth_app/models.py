@@ -2,6 +2,7 @@ from django.db import models
 from django.db import models
 from django.core.cache import cache
 from datetime import timedelta
+from core_app.ids import new_vendor_id
 
 class OTPStore(models.Model):
     phone = models.CharField(max_length=15)
@@ -23,7 +24,7 @@ class User(models.Model):
     
 
 class Vendor(models.Model):
-    vendor_id = models.CharField(max_length=10, unique=True) 
+    vendor_id = models.CharField(max_length=20, unique=True) 
     phone = models.CharField(max_length=15, unique=True)
     restaurant_name = models.CharField(max_length=255)
     email = models.EmailField(unique=True)
@@ -42,15 +43,7 @@ class Vendor(models.Model):
     def save(self, *args, **kwargs):
         # Only generate vendor_id if not provided
         if not self.vendor_id:
-            last_vendor = Vendor.objects.all().order_by('-vendor_id').first()
-            if last_vendor and last_vendor.vendor_id:
-                try:
-                    last_num = int(last_vendor.vendor_id[1:])
-                    self.vendor_id = f'V{str(last_num + 1).zfill(3)}'
-                except ValueError:
-                    self.vendor_id = f'V{str(Vendor.objects.count() + 1).zfill(3)}'
-            else:
-                self.vendor_id = 'V001'
+            self.vendor_id = new_vendor_id()
         super().save(*args, **kwargs)
 
     def add_image(self, image_url):
@@ -108,3 +101,6 @@ class Order(models.Model):
     def __str__(self):
         return f"Order {self.order_number} for {self.vendor.restaurant_name}"
 
+
+# Registered here so Django picks them up; they import Vendor from this module
+from .models_promo_category import Promotion, VendorCategory  # noqa: E402,F401
@@ -2,11 +2,30 @@ from django.db import models
 from .models import Vendor
 
 class Promotion(models.Model):
+    """
+    A discount on a vendor's menu between start_date and end_date (inclusive;
+    either may be open). Applied at pricing time by auth_app/promotions.py.
+    """
+    PERCENT = 'percent'
+    FLAT = 'flat'
+    DISCOUNT_TYPE_CHOICES = [
+        (PERCENT, 'Percent off'),
+        (FLAT, 'Flat amount off each unit'),
+    ]
+
     vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name="promotions")
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     start_date = models.DateField(blank=True, null=True)
     end_date = models.DateField(blank=True, null=True)
+    discount_type = models.CharField(max_length=10, choices=DISCOUNT_TYPE_CHOICES, default=PERCENT)
+    discount_value = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    max_discount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Cap on the discount per order")
+    min_order_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Items subtotal needed for the promotion to apply")
+    # Scope: one listing, one menu category, or (neither set) the whole menu
+    food = models.ForeignKey('FoodListing', on_delete=models.CASCADE, null=True, blank=True, related_name="promotions")
+    category = models.CharField(max_length=100, blank=True, default='')
+    is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -0,0 +1,183 @@
+"""
+Promotion pricing.
+
+Active promotions are indexed per vendor and day: every promotion is put
+into a bucket for each day it runs within a horizon around today, so the
+promotions that apply to a vendor's cart are one dict lookup instead of a
+query or a scan of every promotion. Dates beyond the horizon (scheduled
+orders far ahead) fall back to filtering that vendor's promotions.
+
+Each process builds the index once and rebuilds it when a promotion is
+saved or deleted (a version number in the shared cache, checked at most
+every PROMOTION_INDEX_CHECK_SECONDS) or when the horizon has moved on.
+
+apply() prices a whole cart in one pass: every line gets the single best
+promotion that covers it (promotions do not stack on a line), caps are
+then enforced per promotion, and the result carries a line-level
+breakdown. Cart, checkout and PlaceOrderView all price through it.
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+VERSION_KEY = 'promotions:version'
+CENT = Decimal('0.01')
+ZERO = Decimal('0')
+
+Rule = namedtuple('Rule', 'id vendor_pk title discount_type discount_value max_discount min_order_amount food_id category start end')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _covers(rule, day):
+    return (rule.start is None or rule.start <= day) and (rule.end is None or day <= rule.end)
+
+
+def _applies_to(rule, line):
+    if rule.food_id is not None and rule.food_id != line['food']:
+        return False
+    return not rule.category or rule.category == line.get('category')
+
+
+def _line_discount(rule, line):
+    if rule.discount_type == 'flat':
+        return min(rule.discount_value, line['price']) * line['quantity']
+    return line['price'] * line['quantity'] * rule.discount_value / 100
+
+
+class PromotionIndex:
+    def __init__(self, rules, today, horizon_days, version=None):
+        self.first = today - timedelta(days=1)  # Yesterday too, for requests around midnight
+        self.last = today + timedelta(days=horizon_days)
+        self.version = version
+        self.built_at = time.monotonic()
+        self.by_vendor = {}
+        self.buckets = {}  # (vendor pk, date) -> rules active that day
+        for rule in rules:
+            self.by_vendor.setdefault(rule.vendor_pk, []).append(rule)
+            day = max(rule.start or self.first, self.first)
+            end = min(rule.end or self.last, self.last)
+            while day <= end:
+                self.buckets.setdefault((rule.vendor_pk, day), []).append(rule)
+                day += timedelta(days=1)
+
+    def active(self, vendor_pk, day):
+        if self.first <= day <= self.last:
+            return self.buckets.get((vendor_pk, day), ())
+        return [r for r in self.by_vendor.get(vendor_pk, ()) if _covers(r, day)]
+
+
+def _load_rules(today):
+    from .models import Promotion
+
+    rows = Promotion.objects.filter(is_active=True).filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=today - timedelta(days=1))
+    ).values_list(
+        'id', 'vendor_id', 'title', 'discount_type', 'discount_value', 'max_discount',
+        'min_order_amount', 'food_id', 'category', 'start_date', 'end_date',
+    )
+    return [Rule(*row) for row in rows]
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def get_index():
+    """The process's PromotionIndex, rebuilt if promotions changed or the date moved on."""
+    global _index
+    index = _index
+    now = time.monotonic()
+    today = timezone.localdate()
+    if index is not None and index.first < today <= index.last - timedelta(days=1):
+        if now - index.built_at < _setting('PROMOTION_INDEX_CHECK_SECONDS', 5):
+            return index
+        if cache.get(VERSION_KEY) == index.version:
+            index.built_at = now
+            return index
+    with _lock:
+        if _index is not None and _index is not index:
+            return _index  # Rebuilt by another thread meanwhile
+        version = cache.get(VERSION_KEY)
+        _index = PromotionIndex(_load_rules(today), today, _setting('PROMOTION_INDEX_DAYS', 30), version)
+        return _index
+
+
+def invalidate():
+    """Called when a promotion changes: rebuild here now, elsewhere within the check interval."""
+    global _index
+    if not cache.add(VERSION_KEY, 1, timeout=None):
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, timeout=None)  # Evicted between add and incr
+    with _lock:
+        _index = None
+
+
+def active_promotions(vendor_pk, day=None):
+    return list(get_index().active(vendor_pk, day or timezone.localdate()))
+
+
+def apply(vendor_pk, lines, day=None):
+    """
+    Price lines of one vendor's cart. Each line is a dict with 'food'
+    (listing id), 'quantity', 'price' (unit price) and optionally
+    'category'. Returns
+        {'subtotal', 'discount', 'total',
+         'lines': [{'food', 'discount', 'promotion_id', 'promotion_title'} in input order],
+         'promotions': [{'id', 'title', 'discount'}]}
+    with Decimal amounts.
+    """
+    lines = [dict(line, price=Decimal(str(line['price']))) for line in lines]
+    subtotal = sum((line['price'] * line['quantity'] for line in lines), ZERO)
+    rules = [r for r in active_promotions(vendor_pk, day) if subtotal >= r.min_order_amount]
+
+    chosen = []  # (rule or None, discount) per line
+    totals = {}  # rule id -> uncapped discount
+    for line in lines:
+        best, best_discount = None, ZERO
+        for rule in rules:
+            if _applies_to(rule, line):
+                discount = _line_discount(rule, line)
+                if discount > best_discount:
+                    best, best_discount = rule, discount
+        chosen.append((best, best_discount))
+        if best is not None:
+            totals[best.id] = totals.get(best.id, ZERO) + best_discount
+
+    # A capped promotion's discount is shared out over its lines pro rata
+    scale = {}
+    for rule in rules:
+        if rule.id in totals and rule.max_discount is not None and totals[rule.id] > rule.max_discount:
+            scale[rule.id] = rule.max_discount / totals[rule.id]
+
+    breakdown, applied = [], {}
+    for line, (rule, discount) in zip(lines, chosen):
+        if rule is not None:
+            discount = (discount * scale.get(rule.id, 1)).quantize(CENT, rounding=ROUND_HALF_UP)
+            entry = applied.setdefault(rule.id, {'id': rule.id, 'title': rule.title, 'discount': ZERO})
+            entry['discount'] += discount
+        breakdown.append({
+            'food': line['food'],
+            'discount': discount if rule is not None else ZERO,
+            'promotion_id': rule.id if rule is not None else None,
+            'promotion_title': rule.title if rule is not None else None,
+        })
+    discount = sum((b['discount'] for b in breakdown), ZERO)
+    return {
+        'subtotal': subtotal,
+        'discount': discount,
+        'total': subtotal - discount,
+        'lines': breakdown,
+        'promotions': list(applied.values()),
+    }
@@ -1,6 +1,6 @@
 
 from rest_framework import serializers
-from .models import Vendor, Notification, FoodListing, Order
+from .models import Vendor, Notification, FoodListing, Order, Promotion, VendorCategory
 
 class VendorSerializer(serializers.ModelSerializer):
     class Meta:
@@ -45,4 +45,30 @@ class FoodListingSerializer(serializers.ModelSerializer):
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class PromotionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Promotion
+        fields = '__all__'
+        read_only_fields = ['vendor']  # Set from the URL by the view
+
+    def validate(self, data):
+        start = data.get('start_date', getattr(self.instance, 'start_date', None))
+        end = data.get('end_date', getattr(self.instance, 'end_date', None))
+        if start and end and end < start:
+            raise serializers.ValidationError({'end_date': 'End date must not be before the start date.'})
+        discount_type = data.get('discount_type', getattr(self.instance, 'discount_type', Promotion.PERCENT))
+        value = data.get('discount_value', getattr(self.instance, 'discount_value', 0))
+        if value < 0 or (discount_type == Promotion.PERCENT and value > 100):
+            raise serializers.ValidationError({'discount_value': 'Must be between 0 and 100 for a percent discount, and not negative.'})
+        vendor = data.get('vendor', getattr(self.instance, 'vendor', None))
+        food = data.get('food', getattr(self.instance, 'food', None))
+        if food is not None and vendor is not None and food.vendor_id != vendor.id:
+            raise serializers.ValidationError({'food': "The food item is not on this vendor's menu."})
+        return data
+
+class VendorCategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VendorCategory
+        fields = '__all__'
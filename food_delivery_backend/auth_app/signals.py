@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import promotions
+from .models import Promotion
+
+
+@receiver([post_save, post_delete], sender=Promotion)
+def rebuild_promotion_index(sender, instance, **kwargs):
+    promotions.invalidate()
@@ -1,3 +1,153 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from customer_app.models import Customer, Order
+from notification_app.models import DeviceToken
+
+from . import promotions
+from .models import FoodListing, Vendor
+from .models_promo_category import Promotion
+from .views import generate_vendor_jwt
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'auth-app-tests'}}
+
+
+def make_vendor(n, **fields):
+    return Vendor.objects.create(
+        phone=f"80000000{n:02d}", restaurant_name=f"Restaurant {n}", email=f"v{n}@example.com",
+        address='Somewhere', contact_number='0', open_hours='9-5', **fields,
+    )
+
+
+def client_for(vendor):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {generate_vendor_jwt(vendor)['access']}")
+    return client
+
+
+@override_settings(CACHES=LOCMEM, ID_WORKER_ID=1, RATE_LIMIT_ENABLED=False)
+class VendorTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+
+class FCMTokenRegistrationTests(VendorTestCase):
+    def test_requires_a_vendor_token(self):
+        vendor = make_vendor(1)
+        response = APIClient().post(f'/auth/vendors/{vendor.vendor_id}/fcm-token/', {'fcm_token': 'tok'}, format='json')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_only_for_own_vendor(self):
+        me, other = make_vendor(1), make_vendor(2)
+        response = client_for(me).post(f'/auth/vendors/{other.vendor_id}/fcm-token/', {'fcm_token': 'tok'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        response = client_for(me).post(f'/auth/vendors/{me.vendor_id}/fcm-token/', {'fcm_token': 'tok'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DeviceToken.objects.get(token='tok').user_id, me.vendor_id)
+
+
+class PromotionOwnershipTests(VendorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.me, self.other = make_vendor(1), make_vendor(2)
+        self.promo = Promotion.objects.create(vendor=self.other, title='10% off', discount_value=10)
+
+    def test_requires_a_vendor_token(self):
+        response = APIClient().get(f'/auth/vendors/{self.other.vendor_id}/promotions/')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_cannot_touch_another_vendors_promotions(self):
+        client = client_for(self.me)
+        base = f'/auth/vendors/{self.other.vendor_id}/promotions/'
+        self.assertEqual(client.get(base).status_code, 403)
+        self.assertEqual(client.post(base, {'title': 'x', 'discount_value': 5}, format='json').status_code, 403)
+        self.assertEqual(client.put(f'{base}{self.promo.id}/', {'discount_value': 90}, format='json').status_code, 403)
+        self.assertEqual(client.delete(f'{base}{self.promo.id}/').status_code, 403)
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.discount_value, 10)
+
+    def test_vendor_comes_from_the_url_not_the_body(self):
+        client = client_for(self.me)
+        base = f'/auth/vendors/{self.me.vendor_id}/promotions/'
+        response = client.post(base, {'title': 'Mine', 'discount_value': 5, 'vendor': self.other.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        promo = Promotion.objects.get(id=response.data['id'])
+        self.assertEqual(promo.vendor_id, self.me.id)
+        response = client.put(f'{base}{promo.id}/', {'vendor': self.other.id, 'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        promo.refresh_from_db()
+        self.assertEqual((promo.vendor_id, promo.title), (self.me.id, 'Renamed'))
+
+
+class ApplyPromotionsTests(VendorTestCase):
+    def setUp(self):
+        super().setUp()
+        promotions.invalidate()
+        self.vendor = make_vendor(1)
+        self.dosa = FoodListing.objects.create(vendor=self.vendor, name='Dosa', price=100, category='South')
+        self.lassi = FoodListing.objects.create(vendor=self.vendor, name='Lassi', price=50, category='Drinks')
+
+    def lines(self, dosas=2, lassis=1):
+        return [
+            {'food': self.dosa.id, 'quantity': dosas, 'price': '100.00', 'category': 'South'},
+            {'food': self.lassi.id, 'quantity': lassis, 'price': '50.00', 'category': 'Drinks'},
+        ]
+
+    def promote(self, **fields):
+        promo = Promotion.objects.create(vendor=self.vendor, title=fields.pop('title', 'Promo'), **fields)
+        promotions.invalidate()
+        return promo
+
+    def test_no_promotions(self):
+        priced = promotions.apply(self.vendor.id, self.lines())
+        self.assertEqual((priced['subtotal'], priced['discount'], priced['total']), (Decimal('250'), 0, Decimal('250')))
+        self.assertEqual(priced['promotions'], [])
+
+    def test_best_promotion_per_line_without_stacking(self):
+        menu = self.promote(title='10% off', discount_value=10)
+        drinks = self.promote(title='Drinks 20 off', discount_type=Promotion.FLAT, discount_value=20, category='Drinks')
+        priced = promotions.apply(self.vendor.id, self.lines())
+        self.assertEqual([line['promotion_id'] for line in priced['lines']], [menu.id, drinks.id])
+        self.assertEqual([line['discount'] for line in priced['lines']], [Decimal('20.00'), Decimal('20.00')])
+        self.assertEqual(priced['total'], Decimal('210.00'))
+
+    def test_cap_is_shared_over_the_lines(self):
+        self.promote(title='Half off, at most 60', discount_value=50, max_discount=60)
+        priced = promotions.apply(self.vendor.id, self.lines())
+        self.assertEqual([line['discount'] for line in priced['lines']], [Decimal('48.00'), Decimal('12.00')])
+        self.assertEqual(priced['discount'], Decimal('60.00'))
+
+    def test_minimum_order_and_dates(self):
+        self.promote(title='Big orders', discount_value=10, min_order_amount=300)
+        yesterday = timezone.localdate() - timedelta(days=1)
+        self.promote(title='Ended', discount_value=10, end_date=yesterday)
+        self.promote(title='Inactive', discount_value=10, is_active=False)
+        self.assertEqual(promotions.apply(self.vendor.id, self.lines())['discount'], 0)
+        self.assertEqual(promotions.apply(self.vendor.id, self.lines(dosas=3))['discount'], Decimal('35.00'))
+        self.assertEqual(promotions.apply(self.vendor.id, self.lines(), day=yesterday)['promotions'][0]['title'], 'Ended')
+
+
+class OrderReadyTests(VendorTestCase):
+    def test_ready_time_is_recorded_once(self):
+        vendor = make_vendor(1)
+        customer = Customer.objects.create_user(phone='9000000001', full_name='Customer', email='c@example.com')
+        order = Order.objects.create(customer=customer, vendor=vendor, total_amount=100, delivery_address='x')
+        url = f'/auth/orders/{order.order_number}/status/'
+
+        self.assertEqual(APIClient().patch(url, {'status': 'preparing'}, format='json').status_code, 200)
+        order.refresh_from_db()
+        self.assertIsNone(order.ready_at)
+
+        self.assertEqual(APIClient().patch(url, {'status': 'ready'}, format='json').status_code, 200)
+        order.refresh_from_db()
+        ready_at = order.ready_at
+        self.assertIsNotNone(ready_at)
+
+        self.assertEqual(APIClient().patch(url, {'status': 'Ready for Pickup'}, format='json').status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.ready_at, ready_at)
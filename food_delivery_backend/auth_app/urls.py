@@ -8,16 +8,22 @@ from .views import (
 )
 
 from .views import TestSendVendorNotificationView
+from .views_vendor_features import VendorAnalyticsView, VendorPromotionsView
+from core_app.views import TokenLogoutView
 
 urlpatterns = [
     path('send-otp/', SendOTP.as_view(), name='send-otp'),
     path('verify-otp/', VerifyOTP.as_view(), name='verify-otp'),
     path('signup/', SignupView.as_view(), name='signup'),
+    path('logout/', TokenLogoutView.as_view(), name='vendor-logout'),
     path('vendors/', VendorListView.as_view(), name='vendor-list'),
     path('vendors/<str:vendor_id>/', RestaurantDetailView.as_view(), name='vendor-detail'),
     path('vendors/<str:vendor_id>/notifications/', NotificationListView.as_view(), name='notification-list'),
     path('vendors/<str:vendor_id>/fcm-token/', UpdateFCMTokenView.as_view(), name='update-fcm-token'),
     path('vendors/<str:vendor_id>/test-notification/', TestSendVendorNotificationView.as_view(), name='test-send-vendor-notification'),
+    path('vendors/<str:vendor_id>/analytics/', VendorAnalyticsView.as_view(), name='vendor-analytics'),
+    path('vendors/<str:vendor_id>/promotions/', VendorPromotionsView.as_view(), name='vendor-promotions'),
+    path('vendors/<str:vendor_id>/promotions/<int:promo_id>/', VendorPromotionsView.as_view(), name='vendor-promotion-detail'),
     path('profile/<str:vendor_id>/', ProfileView.as_view(), name='profile'),
     path('food-listings/<str:vendor_id>/', FoodListingView.as_view(), name='food-listings'),
     path('food-listings/<str:vendor_id>/<int:food_id>/', FoodListingView.as_view(), name='food-listing-detail'),
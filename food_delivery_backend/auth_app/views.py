@@ -2,21 +2,13 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Vendor
+from .authentication import VendorJWTAuthentication
+from .permissions import IsAuthenticatedVendor
 from .serializers import *
-import firebase_admin
-from firebase_admin import credentials, messaging
 from .utils import OTPManager
+from core_app.otp import OTPUnavailable
 import os
 
-# Initialize Firebase Admin SDK with explicit service account JSON
-try:
-    firebase_admin.get_app()
-except ValueError:
-    cred_path = os.path.join(os.path.dirname(__file__), '..', 'foodondoor-9d46b-fe4f07a4039b.json')
-    cred_path = os.path.abspath(cred_path)
-    cred = credentials.Certificate(cred_path)
-    firebase_admin.initialize_app(cred)
-
 from django.conf import settings
 import os
 from datetime import datetime
@@ -24,15 +16,23 @@ from django.utils import timezone
 from datetime import timedelta
 import logging
 from django.db.models import Prefetch, Q
+from django.db import transaction
 from .models import Vendor, FoodListing, Notification
 from customer_app.models import Banner, FoodCategory, Order, OrderItem
+from customer_app import rollups
 import json
 import traceback
-import random
+from core_app.ids import new_vendor_id
+from notification_app.outbox import enqueue_push
+from customer_app.tracking import publish_status
+from notification_app.dispatch import PushMessage, get_dispatcher
+from notification_app.registry import register_token, remove_tokens, tokens_for
 
 logger = logging.getLogger(__name__)
 
 class SendOTP(APIView):
+    authentication_classes = []  # Issues tokens; a stale Authorization header must not block it
+
     def post(self, request):
         try:
             phone = request.data.get('phone')
@@ -54,6 +54,8 @@ class SendOTP(APIView):
                 status=status.HTTP_200_OK
             )
             
+        except OTPUnavailable as e:
+            return Response({'error': str(e.detail)}, status=e.status_code)
         except Exception as e:
             logger.error(f"Error in SendOTP: {str(e)}")
             return Response(
@@ -62,6 +64,7 @@ class SendOTP(APIView):
             )
 
 import jwt
+import uuid
 from datetime import datetime, timedelta
 
 # ...
@@ -73,12 +76,14 @@ def generate_vendor_jwt(vendor):
         'vendor_id': vendor.vendor_id,
         'exp': now + timedelta(hours=2),
         'iat': now,
+        'jti': uuid.uuid4().hex,  # Revocation key (core_app.revocation)
         'token_type': 'access',
     }
     refresh_payload = {
         'vendor_id': vendor.vendor_id,
         'exp': now + timedelta(days=30),
         'iat': now,
+        'jti': uuid.uuid4().hex,
         'token_type': 'refresh',
     }
     access_token = jwt.encode(access_payload, settings.SECRET_KEY, algorithm='HS256')
@@ -86,6 +91,8 @@ def generate_vendor_jwt(vendor):
     return {'access': access_token, 'refresh': refresh_token}
 
 class VerifyOTP(APIView):
+    authentication_classes = []  # Issues tokens; a stale Authorization header must not block it
+
     def post(self, request):
         try:
             phone = request.data.get('phone')
@@ -123,6 +130,8 @@ class VerifyOTP(APIView):
                     'vendor_id': new_vendor_id
                 }, status=status.HTTP_200_OK)
                 
+        except OTPUnavailable as e:
+            return Response({'error': str(e.detail)}, status=e.status_code)
         except Exception as e:
             logger.error(f"Error in VerifyOTP: {str(e)}")
             return Response(
@@ -132,18 +141,7 @@ class VerifyOTP(APIView):
 
     def generate_vendor_id(self):
         """Generate unique vendor ID"""
-        try:
-            last_vendor = Vendor.objects.all().order_by('-vendor_id').first()
-            if last_vendor and last_vendor.vendor_id:
-                try:
-                    last_num = int(last_vendor.vendor_id[1:])
-                    return f'V{str(last_num + 1).zfill(3)}'
-                except ValueError:
-                    return f'V{str(Vendor.objects.count() + 1).zfill(3)}'
-            return 'V001'
-        except Exception as e:
-            logger.error(f"Error generating vendor ID: {str(e)}")
-            return f'V{str(random.randint(1, 999)).zfill(3)}'
+        return new_vendor_id()
 
 class VendorListView(APIView):
     def get(self, request):
@@ -152,6 +150,8 @@ class VendorListView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class SignupView(APIView):
+    authentication_classes = []  # Issues tokens; a stale Authorization header must not block it
+
     def post(self, request):
         try:
             phone = request.data.get('phone')
@@ -162,20 +162,9 @@ class SignupView(APIView):
                     'error': 'Vendor with this phone number already exists'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Generate new vendor_id
-            last_vendor = Vendor.objects.all().order_by('-vendor_id').first()
-            if last_vendor and last_vendor.vendor_id:
-                try:
-                    last_num = int(last_vendor.vendor_id[1:])
-                    new_vendor_id = f'V{str(last_num + 1).zfill(3)}'
-                except ValueError:
-                    new_vendor_id = f'V{str(Vendor.objects.count() + 1).zfill(3)}'
-            else:
-                new_vendor_id = 'V001'
-            
             # Add vendor_id to request data
             data = request.data.copy()
-            data['vendor_id'] = new_vendor_id
+            data['vendor_id'] = new_vendor_id()
             
             serializer = VendorSerializer(data=data)
             if serializer.is_valid():
@@ -378,18 +367,23 @@ class VendorOrderStatusUpdateView(APIView):
             new_status = request.data.get('status')
             if not new_status:
                 return Response({'error': 'Missing status'}, status=status.HTTP_400_BAD_REQUEST)
-            order = Order.objects.get(order_number=order_number)
-            order.status = new_status
-            order.save()
-            # Notify customer via FCM if customer FCM token exists (pseudo-code)
-            customer = getattr(order, 'customer', None)
-            if customer and hasattr(customer, 'fcm_token') and customer.fcm_token:
-                title = f"Order {order.order_number} Status Updated"
-                body = f"Your order status is now: {new_status}"
-                try:
-                    send_notification_to_device(customer.fcm_token, title, body)
-                except Exception as e:
-                    logger.error(f"Failed to send FCM notification: {e}")
+            with transaction.atomic():
+                order = Order.objects.select_for_update().get(order_number=order_number)
+                old_status = order.status
+                order.status = new_status
+                ready = getattr(settings, 'DISPATCH_READY_STATUSES', ['ready', 'Ready for Pickup'])
+                if new_status in ready and old_status not in ready:
+                    order.ready_at = timezone.now()  # Batching groups orders by when they became ready
+                order.save()
+                rollups.record_status_change(order, old_status, new_status)
+                # Queue customer push in the same transaction; drain_outbox delivers it
+                customer = getattr(order, 'customer', None)
+                if customer:
+                    title = f"Order {order.order_number} Status Updated"
+                    body = f"Your order status is now: {new_status}"
+                    enqueue_push('customer', customer.customer_id, title, body)
+                # Open tracking streams see the change once it is committed
+                transaction.on_commit(lambda: publish_status(order.order_number, new_status))
             return Response({'order_no': order.order_number, 'status': order.status}, status=status.HTTP_200_OK)
         except Order.DoesNotExist:
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -467,17 +461,6 @@ class ImageUploadView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-def send_notification_to_device(token, title, body):
-    message = messaging.Message(
-        notification=messaging.Notification(
-            title=title,
-            body=body,
-        ),
-        token=token,
-    )
-    response = messaging.send(message)
-    print('Successfully sent message:', response)
-
 class ActiveRestaurantsView(APIView):
     def get(self, request):
         pincode = request.GET.get('pincode')
@@ -587,8 +570,13 @@ class SearchView(APIView):
         return Response(data, status=status.HTTP_200_OK)
 
 class UpdateFCMTokenView(APIView):
+    authentication_classes = [VendorJWTAuthentication]
+    permission_classes = [IsAuthenticatedVendor]
+
     def post(self, request, vendor_id):
         try:
+            if request.user.vendor_id.upper() != vendor_id.strip().upper():
+                return Response({'error': 'Not allowed for this vendor'}, status=status.HTTP_403_FORBIDDEN)
             fcm_token = request.data.get('fcm_token')
             if not fcm_token:
                 return Response(
@@ -607,8 +595,9 @@ class UpdateFCMTokenView(APIView):
                         {'error': f'Vendor not found for vendor_id: {vendor_id}'},
                         status=status.HTTP_404_NOT_FOUND
                     )
-                vendor.fcm_token = fcm_token
-                vendor.save()
+                register_token('vendor', vendor.vendor_id, fcm_token, request.data.get('platform'))
+                vendor.fcm_token = fcm_token  # Legacy single-token field, kept as "last registered device"
+                vendor.save(update_fields=['fcm_token'])
                 logger.info(f"FCM token updated for vendor_id: {vendor.vendor_id}")
                 return Response(
                     {'message': 'FCM token updated successfully'}, 
@@ -636,35 +625,34 @@ class TestSendVendorNotificationView(APIView):
         try:
             print(f"[DEBUG] Looking up vendor with id: '{vendor_id}' (normalized: '{vendor_id.strip()}')")
             vendor = Vendor.objects.get(vendor_id__iexact=vendor_id.strip())
-            print(f"[DEBUG] Vendor found: {vendor.vendor_id}, FCM token: {vendor.fcm_token}")
-            if not vendor.fcm_token:
+            tokens = tokens_for('vendor', vendor.vendor_id) or ([vendor.fcm_token] if vendor.fcm_token else [])
+            print(f"[DEBUG] Vendor found: {vendor.vendor_id}, {len(tokens)} device token(s)")
+            if not tokens:
                 print(f"[DEBUG] Vendor {vendor_id} has no FCM token.")
                 return Response({'error': 'Vendor has no FCM token.'}, status=status.HTTP_400_BAD_REQUEST)
             # Send notification with custom sound and channel (best practice)
-            # Construct FCM message with notification payload (not just data)
-            message = messaging.Message(
-                notification=messaging.Notification(
+            messages = [
+                PushMessage(
+                    token=token,
                     title=title,
                     body=body,
-                ),
-                android=messaging.AndroidConfig(
-                    priority='high',
-                    notification=messaging.AndroidNotification(
-                        channel_id='vendor_notifications',
-                        sound='vendor_delivery_ring.wav',
-                    ),
-                ),
-                token=vendor.fcm_token,
-                # Do not add unnecessary data fields unless needed for app logic
-            )
-            print(f"[DEBUG] Constructed FCM message (backend): {message}")
+                    android_channel_id='vendor_notifications',
+                    sound='vendor_delivery_ring.wav',
+                )
+                for token in tokens
+            ]
             # FLUTTER FRONTEND INSTRUCTIONS:
             # - Place 'vendor_delivery_ring.wav' in android/app/src/main/res/raw/ (Android) and iOS main bundle.
             # - Create NotificationChannel with id 'vendor_notifications' and sound 'vendor_delivery_ring.wav' in Flutter (see work_summary.md for example).
             # - For foreground notifications, use flutter_local_notifications to play sound and show alert.
-            print(f"[DEBUG] Constructed FCM message: {message}")
-            response = messaging.send(message)
-            print(f"[DEBUG] FCM send response: {response}")
+            print(f"[DEBUG] Constructed FCM messages: {messages}")
+            results = get_dispatcher().send(messages)
+            print(f"[DEBUG] FCM send results: {results}")
+            remove_tokens([r.token for r in results if r.is_permanent_failure])
+            delivered = [r.message_id for r in results if r.success]
+            if not delivered:
+                raise Exception(f"{results[0].error_code}: {results[0].error}")
+            response = delivered
             # Save notification to DB for notification tab
             Notification.objects.create(
                 vendor=vendor,
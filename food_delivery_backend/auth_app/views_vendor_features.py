@@ -1,59 +1,85 @@
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Sum
-from .models import Vendor
+from .authentication import VendorJWTAuthentication
+from .models import FoodListing, Vendor
 from .models_promo_category import Promotion, VendorCategory
+from .permissions import IsAuthenticatedVendor
 from .serializers import PromotionSerializer, VendorCategorySerializer
-from customer_app.models import Order
+from customer_app import popularity, rollups
 
 class VendorAnalyticsView(APIView):
+    """
+    Dashboard figures from the per-vendor rollups (customer_app/rollups.py):
+    all time, or the last ?days=N days.
+    """
     def get(self, request, vendor_id):
         try:
-            total_orders = Order.objects.filter(vendor__vendor_id=vendor_id).count()
-            total_revenue = Order.objects.filter(vendor__vendor_id=vendor_id).aggregate(Sum('total_price'))['total_price__sum'] or 0
-            pending_orders = Order.objects.filter(vendor__vendor_id=vendor_id, status='Pending').count()
-            completed_orders = Order.objects.filter(vendor__vendor_id=vendor_id, status='Fulfilled').count()
-            # Find most popular item (by count in items JSON)
-            orders = Order.objects.filter(vendor__vendor_id=vendor_id)
-            item_count = {}
-            for order in orders:
-                for item in order.items:
-                    name = item.get('name')
-                    if name:
-                        item_count[name] = item_count.get(name, 0) + item.get('quantity', 1)
-            popular_item = max(item_count, key=item_count.get) if item_count else ''
-            data = {
-                "total_orders": total_orders,
-                "total_revenue": float(total_revenue),
-                "pending_orders": pending_orders,
-                "completed_orders": completed_orders,
-                "popular_item": popular_item,
-            }
+            vendor_pk = Vendor.objects.filter(vendor_id=vendor_id).values_list('id', flat=True).first()
+            if vendor_pk is None:
+                return Response({'error': 'Vendor not found'}, status=404)
+            since = None
+            days = request.query_params.get('days')
+            if days:
+                try:
+                    since = timezone.localdate() - timedelta(days=int(days) - 1)
+                except ValueError:
+                    return Response({'error': 'days must be a number'}, status=400)
+            data = rollups.vendor_summary(vendor_pk, since)
+            # Decayed ranking of the last hours, next to the exact figures for the period
+            recent = popularity.popular(popularity.vendor_key(vendor_pk), 5)
+            names = dict(FoodListing.objects.filter(id__in=[f for f, _ in recent]).values_list('id', 'name'))
+            data['popular_now'] = [
+                {'food_id': f, 'name': names[f], 'score': round(score, 2)} for f, score in recent if f in names
+            ]
+            data['total_revenue'] = float(data['total_revenue'])
+            for row in data['daily'] + data['hourly']:
+                row['revenue'] = float(row['revenue'])
             return Response(data)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
+def _forbidden(request, vendor_id):
+    """A 403 response unless the authenticated vendor is vendor_id, else None."""
+    if request.user.vendor_id.upper() != vendor_id.strip().upper():
+        return Response({'error': 'Not allowed for this vendor'}, status=403)
+    return None
+
+
 class VendorPromotionsView(APIView):
+    """A vendor's own promotions; the vendor comes from the URL and must be the token's."""
+    authentication_classes = [VendorJWTAuthentication]
+    permission_classes = [IsAuthenticatedVendor]
+
     def get(self, request, vendor_id):
+        denied = _forbidden(request, vendor_id)
+        if denied:
+            return denied
         promos = Promotion.objects.filter(vendor__vendor_id=vendor_id).order_by('-created_at')
         serializer = PromotionSerializer(promos, many=True)
         return Response(serializer.data)
 
     def post(self, request, vendor_id):
+        denied = _forbidden(request, vendor_id)
+        if denied:
+            return denied
         try:
             vendor = Vendor.objects.get(vendor_id=vendor_id)
         except Vendor.DoesNotExist:
             return Response({'error': 'Vendor not found'}, status=404)
-        data = request.data.copy()
-        data['vendor'] = vendor.id
-        serializer = PromotionSerializer(data=data)
+        serializer = PromotionSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            serializer.save(vendor=vendor)
             return Response(serializer.data, status=201)
         return Response({'error': serializer.errors}, status=400)
 
     def put(self, request, vendor_id, promo_id):
+        denied = _forbidden(request, vendor_id)
+        if denied:
+            return denied
         try:
             promo = Promotion.objects.get(id=promo_id, vendor__vendor_id=vendor_id)
         except Promotion.DoesNotExist:
@@ -65,6 +91,9 @@ class VendorPromotionsView(APIView):
         return Response({'error': serializer.errors}, status=400)
 
     def delete(self, request, vendor_id, promo_id):
+        denied = _forbidden(request, vendor_id)
+        if denied:
+            return denied
         try:
             promo = Promotion.objects.get(id=promo_id, vendor__vendor_id=vendor_id)
         except Promotion.DoesNotExist:
@@ -0,0 +1,103 @@
+"""
+Small geometry helpers shared by location tracking and dispatch.
+
+Distances are in metres. For the short distances involved in delivery
+(a few km) a local equirectangular projection is accurate to well under a
+metre and much cheaper than repeated haversine calls.
+"""
+from math import asin, cos, radians, sin, sqrt
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points."""
+    dlat = radians(lat2 - lat1)
+    dlng = radians(lng2 - lng1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * asin(sqrt(a))
+
+
+class LocalProjection:
+    """Equirectangular projection around a reference latitude; x/y in metres."""
+
+    def __init__(self, ref_lat, ref_lng=0.0):
+        self.ref_lat = ref_lat
+        self.ref_lng = ref_lng
+        self.m_per_deg_lat = radians(1) * EARTH_RADIUS_M
+        self.m_per_deg_lng = self.m_per_deg_lat * cos(radians(ref_lat))
+
+    def project(self, lat, lng):
+        return (lng - self.ref_lng) * self.m_per_deg_lng, (lat - self.ref_lat) * self.m_per_deg_lat
+
+    def distance_sq(self, lat1, lng1, lat2, lng2):
+        dx = (lng2 - lng1) * self.m_per_deg_lng
+        dy = (lat2 - lat1) * self.m_per_deg_lat
+        return dx * dx + dy * dy
+
+
+class GridIndex:
+    """
+    Uniform grid over lat/lng for nearest-neighbour queries on moving points
+    (riders). Cells are roughly cell_size_m square near ref_lat; inserts and
+    removals are O(1) and a query only scans the rings of cells it needs.
+    """
+
+    def __init__(self, cell_size_m=1000, ref_lat=0.0):
+        proj = LocalProjection(ref_lat)
+        self.cell_size_m = cell_size_m
+        self.cell_lat = cell_size_m / proj.m_per_deg_lat
+        self.cell_lng = cell_size_m / max(proj.m_per_deg_lng, 1e-9)
+        self.cells = {}
+        self.points = {}  # key -> (lat, lng, cell)
+
+    def cell_of(self, lat, lng):
+        return int(lat // self.cell_lat), int(lng // self.cell_lng)
+
+    def insert(self, key, lat, lng):
+        self.remove(key)
+        cell = self.cell_of(lat, lng)
+        self.cells.setdefault(cell, set()).add(key)
+        self.points[key] = (lat, lng, cell)
+
+    def remove(self, key):
+        entry = self.points.pop(key, None)
+        if entry is not None:
+            bucket = self.cells.get(entry[2])
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.cells[entry[2]]
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, lat, lng, k=1, max_distance_m=None):
+        """Up to k (distance_m, key) pairs sorted by distance."""
+        if not self.points:
+            return []
+        proj = LocalProjection(lat)
+        ci, cj = self.cell_of(lat, lng)
+        max_ring = (int(max_distance_m // self.cell_size_m) + 1) if max_distance_m else None
+        found = []
+        ring = 0
+        while True:
+            for i in range(ci - ring, ci + ring + 1):
+                for j in range(cj - ring, cj + ring + 1):
+                    if ring and ci - ring < i < ci + ring and cj - ring < j < cj + ring:
+                        continue  # Interior cells were scanned in earlier rings
+                    for key in self.cells.get((i, j), ()):
+                        plat, plng, _ = self.points[key]
+                        found.append((proj.distance_sq(lat, lng, plat, plng) ** 0.5, key))
+            found.sort()
+            # Anything beyond this ring is at least ring * cell_size_m away
+            if len(found) >= k and found[k - 1][0] <= ring * self.cell_size_m:
+                break
+            if max_ring is not None and ring >= max_ring:
+                break
+            if len(found) == len(self.points):
+                break
+            ring += 1
+        if max_distance_m is not None:
+            found = [f for f in found if f[0] <= max_distance_m]
+        return found[:k]
@@ -0,0 +1,239 @@
+"""
+Central ID service for orders, customers and vendors.
+
+IDs are Snowflake-style 63-bit integers: 41 bits of milliseconds since
+ID_EPOCH_MS, 10 bits of worker id and 12 bits of per-millisecond sequence.
+They are rendered in Crockford base32 at a fixed width, so plain string
+comparison matches creation order and range scans on the CharField columns
+keep working. Generation is purely in-process; the only shared state is the
+worker id. Unless ID_WORKER_ID is configured, each process leases a free
+worker slot in the shared cache and renews the lease while it runs, so two
+live processes never hold the same worker id.
+"""
+import logging
+import os
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+ID_EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Crockford base32 is in ASCII order, so fixed-width strings sort numerically
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ENCODED_LENGTH = 13  # ceil(63 / 5)
+
+# Small backwards clock steps (NTP slew) are waited out instead of failing
+MAX_CLOCK_DRIFT_MS = 50
+
+WORKER_SLOT_KEY = 'idgen:worker:{}'
+WORKER_HINT_KEY = 'idgen:worker_seq'  # Where the next process starts looking for a free slot
+
+ORDER_PREFIX = 'ORD'
+CUSTOMER_PREFIX = 'C'
+VENDOR_PREFIX = 'V'
+
+
+class ClockMovedBackwardsError(Exception):
+    pass
+
+
+class WorkerIdUnavailableError(Exception):
+    pass
+
+
+def encode(value):
+    """Encode a non-negative integer as fixed-width Crockford base32."""
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        value, rem = divmod(value, 32)
+        chars.append(ALPHABET[rem])
+    if value:
+        raise ValueError('Value does not fit in an ID')
+    return ''.join(reversed(chars))
+
+
+def decode(text):
+    """Decode an ID body (without prefix) back to its integer value."""
+    value = 0
+    for char in text.upper():
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+class IdGenerator:
+    """Thread-safe Snowflake generator bound to a single worker id."""
+
+    def __init__(self, worker_id, epoch_ms=ID_EPOCH_MS, clock=None):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f'worker_id must be between 0 and {MAX_WORKER_ID}')
+        self.worker_id = worker_id
+        self.epoch_ms = epoch_ms
+        self._clock = clock or (lambda: int(time.time() * 1000))
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _wait_until(self, target_ms):
+        now = self._clock()
+        while now < target_ms:
+            time.sleep((target_ms - now) / 1000.0)
+            now = self._clock()
+        return now
+
+    def next_int(self):
+        with self._lock:
+            now = self._clock()
+            if now < self._last_ms:
+                if self._last_ms - now > MAX_CLOCK_DRIFT_MS:
+                    raise ClockMovedBackwardsError(
+                        f'Clock moved backwards by {self._last_ms - now}ms'
+                    )
+                now = self._wait_until(self._last_ms)
+
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond
+                    now = self._wait_until(self._last_ms + 1)
+            else:
+                self._sequence = 0
+
+            self._last_ms = now
+            return (
+                ((now - self.epoch_ms) << (WORKER_BITS + SEQUENCE_BITS))
+                | (self.worker_id << SEQUENCE_BITS)
+                | self._sequence
+            )
+
+    def next_id(self, prefix=''):
+        return f'{prefix}{encode(self.next_int())}'
+
+
+def timestamp_of(id_value, prefix='', epoch_ms=ID_EPOCH_MS):
+    """Return the creation time (ms since the unix epoch) embedded in an ID."""
+    return (decode(id_value[len(prefix):]) >> (WORKER_BITS + SEQUENCE_BITS)) + epoch_ms
+
+
+def _lease_seconds():
+    return getattr(settings, 'ID_WORKER_LEASE_SECONDS', 600)
+
+
+class WorkerLease:
+    """
+    A worker slot held in the shared cache. The slot key holds this
+    process's token and expires after ID_WORKER_LEASE_SECONDS unless renewed;
+    renew() is called on every ID and touches the key every third of the
+    lease. If renewing fails for two thirds of the lease the slot may be
+    taken over, so IDs stop being issued rather than risk duplicates.
+    """
+
+    def __init__(self):
+        self.token = f"{os.getpid()}:{secrets.token_hex(8)}"
+        self.worker_id = self._acquire()
+        self.renewed_at = time.monotonic()
+
+    def _acquire(self):
+        ttl = _lease_seconds()
+        cache.add(WORKER_HINT_KEY, 0, timeout=None)
+        start = cache.incr(WORKER_HINT_KEY)
+        for offset in range(MAX_WORKER_ID + 1):
+            worker_id = (start + offset) & MAX_WORKER_ID
+            if cache.add(WORKER_SLOT_KEY.format(worker_id), self.token, timeout=ttl):
+                return worker_id
+        raise WorkerIdUnavailableError('All ID worker slots are leased')
+
+    def renew(self):
+        """Returns the worker id to use; a lost slot is replaced by a new lease."""
+        ttl = _lease_seconds()
+        elapsed = time.monotonic() - self.renewed_at
+        if elapsed < ttl / 3:
+            return self.worker_id
+        key = WORKER_SLOT_KEY.format(self.worker_id)
+        try:
+            if cache.get(key) == self.token:
+                cache.touch(key, ttl)
+            else:
+                logger.warning(f"ID worker slot {self.worker_id} was lost, leasing a new one")
+                self.worker_id = self._acquire()
+            self.renewed_at = time.monotonic()
+        except WorkerIdUnavailableError:
+            raise
+        except Exception as e:
+            if elapsed >= ttl * 2 / 3:
+                raise WorkerIdUnavailableError(f'Could not renew ID worker slot {self.worker_id}: {e}')
+            logger.warning(f"Could not renew ID worker slot {self.worker_id}, will retry: {e}")
+        return self.worker_id
+
+
+def _resolve_worker_id():
+    """
+    Pick the worker id for this process: (worker id, lease or None).
+
+    ID_WORKER_ID in settings wins (set it per host/container in production).
+    Otherwise a slot is leased from the shared cache. Without a cache the pid
+    is used, but only with DEBUG on: pids collide across hosts.
+    """
+    configured = getattr(settings, 'ID_WORKER_ID', None)
+    if configured is not None:
+        return int(configured) & MAX_WORKER_ID, None
+    try:
+        lease = WorkerLease()
+        return lease.worker_id, lease
+    except WorkerIdUnavailableError:
+        raise
+    except Exception as e:
+        if not settings.DEBUG:
+            raise WorkerIdUnavailableError(f'Could not lease an ID worker id; set ID_WORKER_ID: {e}')
+        logger.warning(f"Could not lease ID worker id from cache, using pid: {e}")
+        return os.getpid() & MAX_WORKER_ID, None
+
+
+_generator = None
+_generator_pid = None
+_lease = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    global _generator, _generator_pid, _lease
+    pid = os.getpid()
+    # Re-resolve after fork so pre-forked workers never share a worker id
+    if _generator is None or _generator_pid != pid:
+        with _generator_lock:
+            if _generator is None or _generator_pid != pid:
+                worker_id, _lease = _resolve_worker_id()
+                _generator = IdGenerator(worker_id)
+                _generator_pid = pid
+    if _lease is not None:
+        worker_id = _lease.renew()
+        if worker_id != _generator.worker_id:
+            with _generator_lock:
+                if worker_id != _generator.worker_id:
+                    _generator = IdGenerator(worker_id)
+    return _generator
+
+
+def new_id(prefix=''):
+    return get_generator().next_id(prefix)
+
+
+def new_order_number():
+    return new_id(ORDER_PREFIX)
+
+
+def new_customer_id():
+    return new_id(CUSTOMER_PREFIX)
+
+
+def new_vendor_id():
+    return new_id(VENDOR_PREFIX)
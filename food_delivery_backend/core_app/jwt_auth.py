@@ -0,0 +1,108 @@
+"""
+Stateless JWT authentication for customers and vendors.
+
+The tokens from generate_customer_jwt / generate_vendor_jwt are validated
+and turned into a lightweight principal built from the claims alone; no
+database query is made (the revocation check is an in-memory Bloom filter
+probe, see core_app.revocation). Views that need the full row call
+request.user.load(), which fetches it once per request.
+
+A bad bearer token (expired, invalid, revoked, or a refresh token) does not
+fail the request outright: the request stays anonymous, so AllowAny views
+still work, and the principal's permission class raises the failure with
+raise_deferred_failure(), so protected views answer 401 as before.
+"""
+import jwt
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication
+
+from .revocation import is_token_revoked
+
+
+def bearer_token(request):
+    """The token from an "Authorization: Bearer <token>" header, or None."""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        return None
+    try:
+        auth_type, token = auth_header.split(' ')
+    except ValueError:
+        return None
+    return token if auth_type.lower() == 'bearer' else None
+
+
+def decode_token(token):
+    try:
+        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.SIMPLE_JWT['ALGORITHM']])
+    except jwt.ExpiredSignatureError:
+        raise exceptions.AuthenticationFailed('Token expired')
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed('Invalid token')
+
+
+def raise_deferred_failure(request):
+    """Raise the AuthenticationFailed a ClaimsJWTAuthentication put off for this request, if any."""
+    detail = getattr(request, 'jwt_auth_failure', None)
+    if detail is not None:
+        raise exceptions.AuthenticationFailed(detail)
+
+
+class ClaimsPrincipal:
+    """An authenticated user known only by its token claims."""
+    id_claim = None
+    model = None
+    lookup_field = None
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, claims):
+        self.claims = claims
+        self.id = claims[self.id_claim]
+        self._instance = None
+
+    def load(self):
+        """The full model instance (one query, cached); raises AuthenticationFailed if it is gone."""
+        if self._instance is None:
+            try:
+                self._instance = self.model.objects.get(**{self.lookup_field: self.id})
+            except self.model.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Account not found')
+        return self._instance
+
+    def __str__(self):
+        return f"{self.__class__.__name__}({self.id})"
+
+
+class ClaimsJWTAuthentication(BaseAuthentication):
+    """
+    Authenticates access tokens that carry principal_class.id_claim. Tokens
+    of other kinds (another app's, or a delivery token) are left to the next
+    authentication class.
+    """
+    principal_class = None
+
+    def authenticate(self, request):
+        token = bearer_token(request)
+        if token is None:
+            return None
+        try:
+            return self.authenticate_token(token)
+        except exceptions.AuthenticationFailed as e:
+            request.jwt_auth_failure = e.detail  # See raise_deferred_failure()
+            return None
+
+    def authenticate_token(self, token):
+        """(principal, token), or None for another kind of token. Raises AuthenticationFailed."""
+        payload = decode_token(token)
+        if not payload.get(self.principal_class.id_claim):
+            return None
+        if payload.get('token_type') != 'access':
+            raise exceptions.AuthenticationFailed('Given token not valid for any token type')
+        if is_token_revoked(payload, token):
+            raise exceptions.AuthenticationFailed('Token has been revoked')
+        return (self.principal_class(payload), token)
+
+    def authenticate_header(self, request):
+        return 'Bearer'  # Makes DRF answer 401 rather than 403
@@ -0,0 +1,79 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from core_app import ratelimit
+from core_app.middleware import RateLimitMiddleware
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of the rate limiting middleware (no database access).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help='Requests per scenario.')
+        parser.add_argument('--clients', type=int, default=1000, help='Distinct client IPs / phones.')
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        import jwt
+
+        factory = RequestFactory()
+        token = jwt.encode({'customer_id': 'C00001', 'token_type': 'access', 'exp': time.time() + 3600},
+                           settings.SECRET_KEY, algorithm='HS256')
+        n, clients = options['requests'], options['clients']
+
+        def unmatched(i):
+            return factory.get('/customer/home-data/', REMOTE_ADDR=f"10.0.{i % clients // 256}.{i % 256}")
+
+        def by_ip(i):
+            return factory.get('/customer/search/', {'q': 'pizza'}, REMOTE_ADDR=f"10.0.{i % clients // 256}.{i % 256}")
+
+        def by_subject(i):
+            return factory.get('/customer/search/', {'q': 'pizza'}, HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        def by_phone(i):
+            body = json.dumps({'phone': f"9{i % clients:09d}"})
+            return factory.post('/customer/send-otp/', body, content_type='application/json',
+                                REMOTE_ADDR=f"10.1.{i % clients // 256}.{i % 256}")
+
+        # Limits high enough that every request is let through and the full path is timed
+        original = getattr(settings, 'RATE_LIMITS', [])
+        settings.RATE_LIMITS = [dict(p, limit=10 ** 9) for p in original]
+        try:
+            baseline = self.time(lambda r: HttpResponse(), unmatched, n, options['rounds'])
+            middleware = RateLimitMiddleware(lambda r: HttpResponse())
+            store = type(ratelimit.get_store()).__name__
+            self.stdout.write(f"Store: {store}; {len(middleware.policies)} policies; {n} requests x {options['rounds']} rounds")
+            self.stdout.write(f"{'scenario':<22}{'median us/request':>20}{'overhead us':>14}")
+            for name, make in (('no matching policy', unmatched), ('search, by IP', by_ip),
+                               ('search, by token', by_subject), ('OTP send, by phone', by_phone)):
+                median = self.time(middleware, make, n, options['rounds'])
+                self.stdout.write(f"{name:<22}{median:>20.2f}{median - baseline:>14.2f}")
+        finally:
+            settings.RATE_LIMITS = original
+
+        # Accuracy: a client sending twice the allowed rate for two periods gets ~limit per period
+        limit, period = 60, 60.0
+        start = time.time()
+        allowed = sum(
+            ratelimit.get_store().hit('ratelimit:bench:accuracy', start + i * period / (2 * limit), period / limit, period).allowed
+            for i in range(4 * limit)
+        )
+        self.stdout.write(f"Accuracy: {allowed} of {4 * limit} requests allowed over {2 * period:.0f}s "
+                          f"at twice a {limit}/{period:.0f}s limit (ideal {2 * limit} plus the initial burst)")
+
+    def time(self, handler, make_request, n, rounds):
+        """Median microseconds per request over the rounds; building the requests is not timed."""
+        requests = [make_request(i) for i in range(n)]
+        results = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for request in requests:
+                handler(request)
+            results.append((time.perf_counter() - started) / n * 1e6)
+        return statistics.median(results)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core_app.revocation import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked token records whose tokens have expired anyway (run daily from cron).'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(f"Purged {deleted} expired revocations")
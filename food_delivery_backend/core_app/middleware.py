@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.http import JsonResponse
+
+from . import ratelimit
+
+
+class RateLimitMiddleware:
+    """
+    Reject requests over the limits in settings.RATE_LIMITS with 429 and a
+    Retry-After header, before any view (and its database or geocoder work)
+    runs. Requests that match no policy only pay for the path regexes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.policies = ratelimit.load_policies()
+
+    def __call__(self, request):
+        if getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            denied = ratelimit.check(request, self.policies)
+            if denied is not None:
+                retry_after = ratelimit.retry_after_header(denied)
+                response = JsonResponse({
+                    'error': 'Too many requests',
+                    'detail': f"Rate limit exceeded. Try again in {retry_after} seconds.",
+                }, status=429)
+                response['Retry-After'] = retry_after
+                return response
+        return self.get_response(request)
@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class RevokedToken(models.Model):
+    """
+    A JWT that must no longer be accepted (logout, refresh rotation). Rows
+    are only needed until the token would have expired anyway; see
+    core_app/revocation.py for the in-process Bloom filter in front of this.
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    token_type = models.CharField(max_length=10, blank=True)  # access / refresh
+    user_type = models.CharField(max_length=20, blank=True)  # customer / vendor / delivery
+    user_id = models.CharField(max_length=64, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)  # Denylist pulls filter on it
+
+    def __str__(self):
+        return f"{self.token_type} {self.jti} ({self.user_type} {self.user_id})"
@@ -0,0 +1,228 @@
+"""
+One-time passwords for the customer, vendor and delivery apps.
+
+Issuing and checking a code are each one Lua script on Redis, so the
+cooldown, the per-window send cap and the attempt counter cannot be raced
+by concurrent requests (the old get/modify/set sequence could lose
+attempts) and each operation is a single round-trip. Codes are single use.
+Without Redis an in-process store with the same semantics is used, but only
+under DEBUG or OTP_MEMORY_FALLBACK (tests, local development): with several
+workers each would hold its own codes and attempt counters, so elsewhere
+issue() and verify() raise OTPUnavailable (503) until Redis is back.
+
+Every app passes its own scope, so a phone number registered as both a
+customer and a vendor has independent codes.
+
+Redis layout:
+    otp:{scope}:{phone}          hash code, attempts; expires after OTP_TTL_SECONDS
+    otp:{scope}:{phone}:cooldown set while a new code may not be requested
+    otp:{scope}:{phone}:sends    codes issued in the current send window
+"""
+import hmac
+import logging
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from rest_framework import exceptions, status
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER = 'customer'
+VENDOR = 'vendor'
+DELIVERY = 'delivery'
+
+# Outcomes shared by both stores
+ISSUED = 1
+COOLDOWN = 0
+SEND_LIMIT = -1
+
+VALID = 1
+EXPIRED = 0
+INVALID = 2
+TOO_MANY_ATTEMPTS = -1
+
+ISSUE_MESSAGES = {
+    COOLDOWN: 'Please wait before requesting another OTP',
+    SEND_LIMIT: 'Too many OTP requests. Please try again later',
+}
+VERIFY_MESSAGES = {
+    EXPIRED: 'OTP has expired',
+    INVALID: 'Invalid OTP',
+    TOO_MANY_ATTEMPTS: 'Too many attempts. Please request new OTP',
+}
+
+# KEYS: code, cooldown, sends. ARGV: code, ttl, cooldown seconds, max sends, window seconds.
+# Returns {outcome, seconds until a new code may be requested}.
+ISSUE_SCRIPT = """
+local wait = redis.call('TTL', KEYS[2])
+if wait > 0 then
+    return {0, wait}
+end
+local sends = redis.call('INCR', KEYS[3])
+if sends == 1 then
+    redis.call('EXPIRE', KEYS[3], ARGV[5])
+end
+if sends > tonumber(ARGV[4]) then
+    return {-1, redis.call('TTL', KEYS[3])}
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'code', ARGV[1], 'attempts', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('SET', KEYS[2], 1, 'EX', ARGV[3])
+return {1, tonumber(ARGV[3])}
+"""
+
+# KEYS: code. ARGV: submitted code, max attempts.
+VERIFY_SCRIPT = """
+local code = redis.call('HGET', KEYS[1], 'code')
+if not code then
+    return 0
+end
+local attempts = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+if attempts > tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+    return -1
+end
+if code == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 2
+"""
+
+
+class OTPUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'OTP service is temporarily unavailable. Please try again shortly'
+    default_code = 'otp_unavailable'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _key(scope, phone):
+    return f"otp:{scope}:{phone}"
+
+
+def new_code():
+    return str(secrets.randbelow(900000) + 100000)
+
+
+class RedisOTPStore:
+    def __init__(self, client):
+        self.client = client
+        self.issue_script = client.register_script(ISSUE_SCRIPT)
+        self.verify_script = client.register_script(VERIFY_SCRIPT)
+
+    def issue(self, key, code, ttl, cooldown, max_sends, window):
+        outcome, wait = self.issue_script(
+            keys=[key, f"{key}:cooldown", f"{key}:sends"],
+            args=[code, ttl, cooldown, max_sends, window],
+        )
+        return int(outcome), int(wait)
+
+    def verify(self, key, code, max_attempts):
+        return int(self.verify_script(keys=[key], args=[code, max_attempts]))
+
+
+class MemoryOTPStore:
+    """The scripts' logic under a lock, for a single process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> [expires_at, value]
+
+    def _get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self.entries[key]
+            return None
+        return entry
+
+    def issue(self, key, code, ttl, cooldown, max_sends, window):
+        now = time.monotonic()
+        with self.lock:
+            blocked = self._get(f"{key}:cooldown", now)
+            if blocked is not None:
+                return COOLDOWN, int(blocked[0] - now)
+            sends = self._get(f"{key}:sends", now)
+            if sends is None:
+                sends = self.entries[f"{key}:sends"] = [now + window, 0]
+            sends[1] += 1
+            if sends[1] > max_sends:
+                return SEND_LIMIT, int(sends[0] - now)
+            self.entries[key] = [now + ttl, {'code': code, 'attempts': 0}]
+            self.entries[f"{key}:cooldown"] = [now + cooldown, 1]
+            return ISSUED, cooldown
+
+    def verify(self, key, code, max_attempts):
+        with self.lock:
+            entry = self._get(key, time.monotonic())
+            if entry is None:
+                return EXPIRED
+            data = entry[1]
+            data['attempts'] += 1
+            if data['attempts'] > max_attempts:
+                del self.entries[key]
+                return TOO_MANY_ATTEMPTS
+            if hmac.compare_digest(data['code'], code):
+                del self.entries[key]
+                return VALID
+            return INVALID
+
+
+_memory_store = MemoryOTPStore()
+_redis_store = None
+
+
+def get_store():
+    global _redis_store
+    client = get_redis()
+    if client is None:
+        if settings.DEBUG or _setting('OTP_MEMORY_FALLBACK', False):
+            return _memory_store
+        logger.error("Redis is unavailable; refusing to issue or check OTPs")
+        raise OTPUnavailable()
+    store = _redis_store
+    if store is None or store.client is not client:
+        store = _redis_store = RedisOTPStore(client)
+    return store
+
+
+def issue(scope, phone):
+    """
+    Create and store a new code for the phone. Returns (code, None), or
+    (None, message) while the resend cooldown or the send cap applies.
+    Raises OTPUnavailable when there is no shared store.
+    """
+    code = new_code()
+    outcome, _ = get_store().issue(
+        _key(scope, phone), code,
+        _setting('OTP_TTL_SECONDS', 300),
+        _setting('OTP_RESEND_SECONDS', 60),
+        _setting('OTP_MAX_SENDS', 5),
+        _setting('OTP_SEND_WINDOW_SECONDS', 3600),
+    )
+    if outcome != ISSUED:
+        return None, ISSUE_MESSAGES[outcome]
+    return code, None
+
+
+def verify(scope, phone, submitted):
+    """
+    Check a submitted code; a correct code is consumed. Returns (True, None)
+    or (False, message). After OTP_MAX_ATTEMPTS wrong guesses the code is
+    discarded and a new one has to be requested. Raises OTPUnavailable
+    when there is no shared store.
+    """
+    outcome = get_store().verify(_key(scope, phone), str(submitted).strip(), _setting('OTP_MAX_ATTEMPTS', 3))
+    if outcome == VALID:
+        return True, None
+    return False, VERIFY_MESSAGES[outcome]
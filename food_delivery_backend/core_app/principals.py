@@ -0,0 +1,72 @@
+"""
+Principal cache for token authentication.
+
+Authenticating a request only needs a handful of fields about the user
+(id, phone, active flag). PrincipalCache keeps those in a small per-process
+LRU with a short TTL, in front of the shared cache, in front of the
+database. Saving or deleting the user must call invalidate() once the
+change has committed; other processes notice within
+AUTH_PRINCIPAL_LOCAL_TTL_SECONDS.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+_MISSING = {'__missing__': True}  # Cached "no such user", so bad ids don't hit the database every time
+
+
+class PrincipalCache:
+    def __init__(self, name, loader):
+        """loader(key) returns a small JSON-serialisable dict for the user, or None."""
+        self.prefix = f"principal:{name}:"
+        self.loader = loader
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+
+    def _local_ttl(self):
+        return getattr(settings, 'AUTH_PRINCIPAL_LOCAL_TTL_SECONDS', 5)
+
+    def _shared_ttl(self):
+        return getattr(settings, 'AUTH_PRINCIPAL_SHARED_TTL_SECONDS', 300)
+
+    def _remember(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self._local_ttl(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > getattr(settings, 'AUTH_PRINCIPAL_LOCAL_SIZE', 10000):
+                self.entries.popitem(last=False)
+
+    def get(self, key):
+        key = str(key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    return None if entry[1] is _MISSING else entry[1]
+                del self.entries[key]
+
+        value = cache.get(self.prefix + key)
+        if value is None:
+            value = self.loader(key)
+            if value is None:
+                cache.set(self.prefix + key, _MISSING, timeout=self._local_ttl())
+            else:
+                cache.set(self.prefix + key, value, timeout=self._shared_ttl())
+        elif value == _MISSING:
+            value = None
+        self._remember(key, _MISSING if value is None else value)
+        return value
+
+    def invalidate(self, key):
+        key = str(key)
+        with self.lock:
+            self.entries.pop(key, None)
+        cache.delete(self.prefix + key)
+
+    def clear_local(self):
+        with self.lock:
+            self.entries.clear()
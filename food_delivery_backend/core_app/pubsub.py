@@ -0,0 +1,128 @@
+"""
+Lightweight publish/subscribe for pushing live updates to async views.
+
+Subscribers always attach to an in-process fan-out. When Redis is available
+publish() goes through Redis PUBLISH and each process runs one listener
+task (a single pattern subscription) that feeds its local subscribers, so
+an update published by any web worker or management command reaches every
+open stream. Without Redis, publishing is process-local.
+
+publish() is safe to call from sync code in any thread.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+
+from .redis_client import get_redis
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = 'pubsub:'
+QUEUE_SIZE = 100  # Slow consumers drop updates rather than grow without bound
+
+_subscribers = {}  # channel -> set of (loop, queue)
+_lock = threading.Lock()
+_listener = None  # (loop, task) of the Redis listener for this process
+
+
+def _deliver_local(channel, message):
+    with _lock:
+        targets = list(_subscribers.get(channel, ()))
+    for loop, queue in targets:
+        try:
+            loop.call_soon_threadsafe(_put, queue, message)
+        except RuntimeError:
+            pass  # Loop already closed; the subscriber is going away
+
+
+def _put(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        pass
+
+
+def publish(channel, message):
+    """Publish a JSON-serialisable message to everyone subscribed to `channel`."""
+    client = get_redis()
+    if client is not None:
+        try:
+            client.publish(CHANNEL_PREFIX + channel, json.dumps(message))
+            return
+        except Exception as e:
+            logger.warning(f"Redis publish failed, delivering locally only: {e}")
+    _deliver_local(channel, message)
+
+
+async def _listen():
+    url = settings.CACHES['default'].get('LOCATION')
+    client = redis_asyncio.from_url(url)
+    pubsub = client.pubsub()
+    await pubsub.psubscribe(CHANNEL_PREFIX + '*')
+    try:
+        async for item in pubsub.listen():
+            if item.get('type') != 'pmessage':
+                continue
+            channel = item['channel'].decode()[len(CHANNEL_PREFIX):]
+            try:
+                _deliver_local(channel, json.loads(item['data']))
+            except ValueError:
+                continue
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
+
+
+def _ensure_listener():
+    global _listener
+    if redis_asyncio is None or get_redis() is None:
+        return
+    loop = asyncio.get_running_loop()
+    if _listener is not None and _listener[0] is loop and not _listener[1].done():
+        return
+    _listener = (loop, loop.create_task(_listen()))
+
+
+class Subscription:
+    """
+    Async context manager yielding messages for one channel:
+
+        async with Subscription('order:123') as sub:
+            message = await sub.get(timeout=15)
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.queue = None
+        self.entry = None
+
+    async def __aenter__(self):
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.entry = (asyncio.get_running_loop(), self.queue)
+        with _lock:
+            _subscribers.setdefault(self.channel, set()).add(self.entry)
+        _ensure_listener()
+        return self
+
+    async def __aexit__(self, *exc):
+        with _lock:
+            subscribers = _subscribers.get(self.channel)
+            if subscribers is not None:
+                subscribers.discard(self.entry)
+                if not subscribers:
+                    del _subscribers[self.channel]
+
+    async def get(self, timeout=None):
+        """Next message, or None after `timeout` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
@@ -0,0 +1,222 @@
+"""
+Request rate limiting.
+
+Limits use GCRA, the "virtual scheduling" form of a token bucket: a key
+allows `limit` requests per `period` seconds, spread smoothly (a sliding
+window, not a fixed one that resets and lets a double burst through at the
+boundary). The only state per key is one timestamp, the theoretical
+arrival time, so a check is a single atomic Lua script call on Redis that
+reads, decides and writes, and the time to wait comes straight out of it
+for Retry-After. Without Redis an in-process store is used.
+
+Policies come from settings.RATE_LIMITS and are matched on the request
+path; see RateLimitMiddleware in core_app/middleware.py. Timestamps come
+from the application servers, so their clocks must be kept in sync (NTP).
+"""
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+import jwt
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY = 'ratelimit:{}:{}'
+
+# KEYS: bucket. ARGV: now, emission interval (period / limit), period.
+# Returns {allowed, remaining, milliseconds until the next request is allowed}.
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local emission = tonumber(ARGV[2])
+local period = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+if tat < now then
+    tat = now
+end
+local new_tat = tat + emission
+local allow_at = new_tat - period
+if now < allow_at then
+    return {0, 0, math.ceil((allow_at - now) * 1000)}
+end
+redis.call('SET', KEYS[1], string.format('%.6f', new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, math.floor((now - allow_at) / emission), 0}
+"""
+
+Decision = namedtuple('Decision', 'allowed remaining retry_after')
+
+
+class RedisRateStore:
+    def __init__(self, client):
+        self.client = client
+        self.script = client.register_script(GCRA_SCRIPT)
+
+    def hit(self, key, now, emission, period):
+        allowed, remaining, retry_ms = self.script(keys=[key], args=[repr(now), repr(emission), period])
+        return Decision(bool(allowed), int(remaining), int(retry_ms) / 1000.0)
+
+
+class MemoryRateStore:
+    """The same algorithm for a single process."""
+
+    def __init__(self, max_keys=100000):
+        self.lock = threading.Lock()
+        self.tats = {}
+        self.max_keys = max_keys
+
+    def hit(self, key, now, emission, period):
+        with self.lock:
+            tat = max(self.tats.get(key, now), now)
+            new_tat = tat + emission
+            allow_at = new_tat - period
+            if now < allow_at:
+                return Decision(False, 0, allow_at - now)
+            self.tats[key] = new_tat
+            if len(self.tats) > self.max_keys:
+                # Keys whose TAT has passed are back at a full bucket; forgetting them changes nothing
+                self.tats = {k: t for k, t in self.tats.items() if t > now}
+            return Decision(True, int((now - allow_at) / emission), 0.0)
+
+
+_memory_store = MemoryRateStore()
+_redis_store = None
+
+
+def get_store():
+    global _redis_store
+    client = get_redis()
+    if client is None:
+        return _memory_store
+    store = _redis_store
+    if store is None or store.client is not client:
+        store = _redis_store = RedisRateStore(client)
+    return store
+
+
+def hit(bucket, limit, period, now=None):
+    """Count one request against bucket (limit per period seconds) and return the Decision."""
+    now = time.time() if now is None else now
+    return get_store().hit(bucket, now, period / limit, period)
+
+
+# --- Request identities -----------------------------------------------------
+
+def client_ip(request):
+    if getattr(settings, 'RATE_LIMIT_TRUST_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+@lru_cache(maxsize=4096)
+def _subject_of(token):
+    # Cached per token: verifying the signature costs far more than the rate check itself
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'], options={'verify_exp': False})
+    except jwt.InvalidTokenError:
+        return None
+    for claim, kind in (('customer_id', 'customer'), ('vendor_id', 'vendor'), ('user_id', 'delivery')):
+        if payload.get(claim):
+            return f"{kind}:{payload[claim]}"
+    return None
+
+
+def token_subject(request):
+    """
+    'customer:<id>', 'vendor:<id>' or 'delivery:<id>' from a bearer token
+    with a valid signature, else None. The signature is checked so a client
+    cannot spread its requests over made-up subjects; expiry is not, the
+    view's authentication rejects expired tokens anyway.
+    """
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not auth_header[:7].lower() == 'bearer ':
+        return None
+    return _subject_of(auth_header[7:].strip())
+
+
+def request_phone(request):
+    """The phone number an OTP request is about, from a JSON or form body."""
+    try:
+        if request.content_type == 'application/json':
+            data = json.loads(request.body or b'{}')
+        else:
+            data = request.POST
+        phone = data.get('phone') or data.get('phone_number')
+    except (ValueError, AttributeError):
+        return None
+    return str(phone).strip() if phone else None
+
+
+def _ip_identity(request):
+    return f"ip:{client_ip(request)}"
+
+
+def _subject_identity(request):
+    return token_subject(request) or _ip_identity(request)  # Anonymous callers are limited per IP
+
+
+def _phone_identity(request):
+    phone = request_phone(request)
+    return f"phone:{phone}" if phone else _ip_identity(request)
+
+
+IDENTITIES = {
+    'ip': _ip_identity,
+    'subject': _subject_identity,
+    'phone': _phone_identity,
+}
+
+
+class Policy:
+    __slots__ = ('name', 'pattern', 'methods', 'identity', 'limit', 'period')
+
+    def __init__(self, name, path, limit, period, key='ip', methods=None):
+        if key not in IDENTITIES:
+            raise ValueError(f"Unknown rate limit key {key!r} in policy {name!r}")
+        self.name = name
+        self.pattern = re.compile(path)
+        self.methods = {m.upper() for m in methods} if methods else None
+        self.identity = IDENTITIES[key]
+        self.limit = limit
+        self.period = period
+
+    def matches(self, request):
+        return (self.methods is None or request.method in self.methods) and self.pattern.match(request.path_info)
+
+
+def load_policies():
+    return [Policy(**spec) for spec in getattr(settings, 'RATE_LIMITS', [])]
+
+
+def check(request, policies):
+    """
+    Apply every matching policy. Returns None if the request may proceed,
+    else the Decision of the policy with the longest wait. Fails open if the
+    store is unreachable.
+    """
+    worst = None
+    now = time.time()
+    for policy in policies:
+        if not policy.matches(request):
+            continue
+        bucket = KEY.format(policy.name, policy.identity(request))
+        try:
+            decision = get_store().hit(bucket, now, policy.period / policy.limit, policy.period)
+        except Exception as e:
+            logger.error(f"Rate limit check failed for {policy.name}: {e}")
+            continue
+        if not decision.allowed and (worst is None or decision.retry_after > worst.retry_after):
+            worst = decision
+    return worst
+
+
+def retry_after_header(decision):
+    return str(max(1, math.ceil(decision.retry_after)))
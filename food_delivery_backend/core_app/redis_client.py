@@ -0,0 +1,52 @@
+"""
+Access to the raw Redis client behind the default cache.
+
+Hot paths (live locations, OTPs, rate limits) want Redis data structures and
+scripts rather than the plain get/set cache API. get_redis() returns the
+django_redis client when the cache is Redis and reachable, otherwise None so
+callers can fall back to an in-process implementation.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+RECHECK_SECONDS = 30  # How long a failed probe is trusted before trying again
+
+_client = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_redis():
+    global _client, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < RECHECK_SECONDS:
+        return _client
+    with _lock:
+        if now - _checked_at < RECHECK_SECONDS:
+            return _client
+        try:
+            from django_redis import get_redis_connection
+            client = get_redis_connection('default')
+            client.ping()
+        except ImportError:
+            client = None
+        except NotImplementedError:
+            client = None  # Default cache is not django_redis
+        except Exception as e:
+            if _client is not None:
+                logger.warning(f"Redis unavailable, falling back to in-process state: {e}")
+            client = None
+        _client = client
+        _checked_at = now
+    return _client
+
+
+def reset():
+    """Forget the cached client (after settings change, in workers after fork)."""
+    global _client, _checked_at
+    with _lock:
+        _client = None
+        _checked_at = 0.0
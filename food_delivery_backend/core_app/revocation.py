@@ -0,0 +1,188 @@
+"""
+JWT revocation keyed on the token's jti.
+
+Revoked ids are stored in RevokedToken (the authoritative list). Every
+process keeps a Bloom filter of them in memory and, every
+REVOCATION_SYNC_SECONDS, pulls the rows revoked since its last pull minus
+REVOCATION_SYNC_OVERLAP_SECONDS, so rows that commit late or out of order
+are still picked up. Checking a token that was never revoked (almost all of
+them) is a few hash probes with no network call. Only a Bloom hit is
+confirmed against the database.
+
+A revocation made in one process is visible there immediately and in the
+others after at most REVOCATION_SYNC_SECONDS.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import jwt
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        for pos in self._positions(item):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class _Denylist:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.pulled_at = None  # Wall-clock start of the last successful pull or rebuild
+        self.synced_at = -math.inf
+        self.built_at = -math.inf
+
+    def _rebuild(self):
+        """Load every unexpired revocation into a fresh filter sized for it."""
+        from .models import RevokedToken
+
+        started = timezone.now()
+        jtis = list(RevokedToken.objects.filter(expires_at__gt=started).values_list('jti', flat=True))
+        capacity = max(_setting('REVOCATION_BLOOM_CAPACITY', 100000), len(jtis) * 2)
+        bloom = BloomFilter(capacity, _setting('REVOCATION_BLOOM_ERROR_RATE', 0.001))
+        for jti in jtis:
+            bloom.add(jti)
+        self.bloom = bloom
+        self.pulled_at = started
+        self.built_at = time.monotonic()
+
+    def _pull(self):
+        """Add rows revoked since the last pull, re-reading an overlap window for late commits."""
+        from .models import RevokedToken
+
+        started = timezone.now()
+        since = self.pulled_at - timedelta(seconds=_setting('REVOCATION_SYNC_OVERLAP_SECONDS', 60))
+        for jti in RevokedToken.objects.filter(revoked_at__gte=since).values_list('jti', flat=True):
+            if jti not in self.bloom:  # Rows in the overlap were mostly added already
+                self.bloom.add(jti)
+        self.pulled_at = started
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.synced_at < _setting('REVOCATION_SYNC_SECONDS', 5):
+            return
+        with self.lock:
+            if not force and now - self.synced_at < _setting('REVOCATION_SYNC_SECONDS', 5):
+                return
+            self.synced_at = now
+            try:
+                # Rebuilding now and then drops expired ids and regrows a filter that filled up
+                if (self.bloom is None or self.bloom.count > self.bloom.capacity
+                        or now - self.built_at > _setting('REVOCATION_REBUILD_SECONDS', 3600)):
+                    self._rebuild()
+                else:
+                    self._pull()
+            except Exception as e:
+                logger.error(f"Failed to sync token denylist: {e}")
+
+    def might_contain(self, jti):
+        self.sync()
+        bloom = self.bloom
+        return bloom is None or jti in bloom  # No filter yet (database down): always confirm
+
+    def add(self, jti):
+        if self.bloom is not None:
+            self.bloom.add(jti)
+
+
+_denylist = _Denylist()
+
+
+def token_id(payload, token=None):
+    """The token's jti; tokens issued before jti existed are identified by a hash of the token."""
+    jti = payload.get('jti')
+    if jti:
+        return str(jti)
+    return hashlib.sha256(token.encode()).hexdigest()[:32] if token else None
+
+
+def is_revoked(jti):
+    if not jti or not _denylist.might_contain(jti):
+        return False
+    from .models import RevokedToken
+
+    return RevokedToken.objects.filter(jti=jti).exists()
+
+
+def is_token_revoked(payload, token=None):
+    return is_revoked(token_id(payload, token))
+
+
+def revoke(payload, token=None):
+    """
+    Revoke a decoded token until its exp. Returns (jti, created); created is
+    False if it was already revoked, e.g. by a concurrent request.
+    """
+    from .models import RevokedToken
+
+    jti = token_id(payload, token)
+    exp = payload.get('exp')
+    expires_at = datetime.fromtimestamp(exp, tz=dt_timezone.utc) if exp else timezone.now() + settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME']
+    user_type = payload.get('user_type') or ('customer' if 'customer_id' in payload else 'vendor' if 'vendor_id' in payload else '')
+    try:
+        _, created = RevokedToken.objects.get_or_create(jti=jti, defaults={
+            'token_type': payload.get('token_type') or '',
+            'user_type': user_type,
+            'user_id': str(payload.get('user_id') or payload.get('customer_id') or payload.get('vendor_id') or ''),
+            'expires_at': expires_at,
+        })
+    except IntegrityError:
+        created = False  # Revoked concurrently
+    _denylist.add(jti)
+    return jti, created
+
+
+def revoke_token(token):
+    """
+    Verify and revoke an encoded token. Expired or invalid tokens are
+    ignored (they are rejected anyway). Returns the jti or None.
+    """
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.SIMPLE_JWT['ALGORITHM']])
+    except jwt.InvalidTokenError:
+        return None
+    return revoke(payload, token)[0]
+
+
+def purge_expired():
+    """Delete revocations of tokens that have expired anyway. Returns the number removed."""
+    from .models import RevokedToken
+
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,213 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core_app import ids, otp, ratelimit, revocation
+from core_app.geo import GridIndex, LocalProjection, haversine_m
+from core_app.models import RevokedToken
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'core-app-tests',
+                       'OPTIONS': {'MAX_ENTRIES': 10000}}}
+
+
+@override_settings(CACHES=LOCMEM, ID_WORKER_ID=None)
+class WorkerLeaseTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_live_leases_never_share_a_worker_id(self):
+        leases = [ids.WorkerLease() for _ in range(50)]
+        self.assertEqual(len({lease.worker_id for lease in leases}), 50)
+
+    def test_slot_is_reused_only_after_its_lease_expires(self):
+        first = ids.WorkerLease()
+        # Wrap the hint counter around to the slot that is still held
+        cache.set(ids.WORKER_HINT_KEY, first.worker_id - 1 + ids.MAX_WORKER_ID + 1, timeout=None)
+        self.assertNotEqual(ids.WorkerLease().worker_id, first.worker_id)
+        cache.delete(ids.WORKER_SLOT_KEY.format(first.worker_id))
+        cache.set(ids.WORKER_HINT_KEY, first.worker_id - 1, timeout=None)
+        self.assertEqual(ids.WorkerLease().worker_id, first.worker_id)
+
+    def test_no_free_slot_raises(self):
+        for worker_id in range(ids.MAX_WORKER_ID + 1):
+            cache.set(ids.WORKER_SLOT_KEY.format(worker_id), 'taken', timeout=None)
+        with self.assertRaises(ids.WorkerIdUnavailableError):
+            ids.WorkerLease()
+
+    @override_settings(ID_WORKER_LEASE_SECONDS=30)
+    def test_lost_slot_is_replaced_on_renewal(self):
+        lease = ids.WorkerLease()
+        lost = lease.worker_id
+        cache.set(ids.WORKER_SLOT_KEY.format(lost), 'someone else', timeout=None)
+        lease.renewed_at -= 11
+        self.assertNotEqual(lease.renew(), lost)
+        self.assertEqual(cache.get(ids.WORKER_SLOT_KEY.format(lease.worker_id)), lease.token)
+
+    @override_settings(ID_WORKER_LEASE_SECONDS=30)
+    def test_stops_issuing_when_renewal_keeps_failing(self):
+        lease = ids.WorkerLease()
+        lease.renewed_at -= 21
+        with mock.patch.object(ids.cache, 'get', side_effect=ConnectionError('down')):
+            with self.assertRaises(ids.WorkerIdUnavailableError):
+                lease.renew()
+
+
+class IdGeneratorTests(SimpleTestCase):
+    def test_ids_are_unique_and_ordered(self):
+        generator = ids.IdGenerator(7)
+        values = [generator.next_id(ids.ORDER_PREFIX) for _ in range(5000)]
+        self.assertEqual(len(set(values)), len(values))
+        self.assertEqual(values, sorted(values))
+
+
+class DenylistTests(TestCase):
+    def row(self, jti, revoked_at):
+        row = RevokedToken.objects.create(jti=jti, expires_at=timezone.now() + timedelta(hours=1))
+        RevokedToken.objects.filter(pk=row.pk).update(revoked_at=revoked_at)
+
+    def test_pull_picks_up_rows_that_committed_late(self):
+        denylist = revocation._Denylist()
+        denylist.sync(force=True)
+        # Stamped before the last pull, committed after it
+        self.row('late', denylist.pulled_at - timedelta(seconds=5))
+        self.assertNotIn('late', denylist.bloom)
+        denylist.sync(force=True)
+        self.assertIn('late', denylist.bloom)
+
+    def test_revoke_reports_whether_it_created_the_row(self):
+        payload = {'jti': 'abc', 'token_type': 'refresh', 'customer_id': 'C1'}
+        self.assertEqual(revocation.revoke(payload), ('abc', True))
+        self.assertEqual(revocation.revoke(payload), ('abc', False))
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+
+class MemoryOTPStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.store = otp.MemoryOTPStore()
+
+    def test_code_is_single_use(self):
+        self.assertEqual(self.store.issue('k', '123456', 300, 60, 5, 3600), (otp.ISSUED, 60))
+        self.assertEqual(self.store.verify('k', '123456', 3), otp.VALID)
+        self.assertEqual(self.store.verify('k', '123456', 3), otp.EXPIRED)
+
+    def test_wrong_guesses_burn_the_code(self):
+        self.store.issue('k', '123456', 300, 60, 5, 3600)
+        self.assertEqual([self.store.verify('k', '000000', 2) for _ in range(2)], [otp.INVALID, otp.INVALID])
+        self.assertEqual(self.store.verify('k', '123456', 2), otp.TOO_MANY_ATTEMPTS)
+        self.assertEqual(self.store.verify('k', '123456', 2), otp.EXPIRED)
+
+    def test_cooldown_and_send_cap(self):
+        self.assertEqual(self.store.issue('k', '111111', 300, 60, 2, 3600)[0], otp.ISSUED)
+        self.assertEqual(self.store.issue('k', '222222', 300, 60, 2, 3600)[0], otp.COOLDOWN)
+        self.store.entries.pop('k:cooldown')
+        self.assertEqual(self.store.issue('k', '222222', 300, 60, 2, 3600)[0], otp.ISSUED)
+        self.store.entries.pop('k:cooldown')
+        self.assertEqual(self.store.issue('k', '333333', 300, 60, 2, 3600)[0], otp.SEND_LIMIT)
+        self.assertEqual(self.store.verify('k', '222222', 3), otp.VALID)
+
+    def test_scopes_are_independent(self):
+        with mock.patch('core_app.otp.get_store', return_value=self.store):
+            code, error = otp.issue(otp.CUSTOMER, '9000000001')
+            self.assertIsNone(error)
+            self.assertEqual(otp.verify(otp.VENDOR, '9000000001', code), (False, otp.VERIFY_MESSAGES[otp.EXPIRED]))
+            self.assertEqual(otp.verify(otp.CUSTOMER, '9000000001', code), (True, None))
+
+
+class MemoryRateStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.store = ratelimit.MemoryRateStore()
+
+    def test_allows_a_burst_of_limit_then_refills_one_per_interval(self):
+        # 3 per 60 s: one request every 20 s, bursts of up to 3
+        hits = [self.store.hit('k', 1000.0, 20.0, 60) for _ in range(4)]
+        self.assertEqual([h.allowed for h in hits], [True, True, True, False])
+        self.assertEqual([h.remaining for h in hits[:3]], [2, 1, 0])
+        self.assertAlmostEqual(hits[3].retry_after, 20.0)
+        self.assertFalse(self.store.hit('k', 1019.0, 20.0, 60).allowed)
+        self.assertTrue(self.store.hit('k', 1020.0, 20.0, 60).allowed)
+
+    def test_denied_requests_do_not_count(self):
+        for _ in range(10):
+            self.store.hit('k', 1000.0, 20.0, 60)
+        self.assertTrue(self.store.hit('k', 1020.0, 20.0, 60).allowed)
+
+    def test_keys_are_independent(self):
+        for _ in range(3):
+            self.store.hit('a', 1000.0, 20.0, 60)
+        self.assertFalse(self.store.hit('a', 1000.0, 20.0, 60).allowed)
+        self.assertTrue(self.store.hit('b', 1000.0, 20.0, 60).allowed)
+
+    def test_pruning_forgets_only_full_buckets(self):
+        store = ratelimit.MemoryRateStore(max_keys=2)
+        store.hit('old', 1000.0, 20.0, 60)
+        store.hit('busy', 1100.0, 20.0, 60)
+        store.hit('busy', 1100.0, 20.0, 60)
+        store.hit('new', 1100.0, 20.0, 60)
+        self.assertEqual(set(store.tats), {'busy', 'new'})
+
+
+class GeoTests(SimpleTestCase):
+    def test_projection_matches_haversine_at_city_scale(self):
+        proj = LocalProjection(12.97)
+        for lat2, lng2 in ((12.98, 77.59), (12.95, 77.62), (12.97, 77.55)):
+            expected = haversine_m(12.97, 77.59, lat2, lng2)
+            self.assertAlmostEqual(proj.distance_sq(12.97, 77.59, lat2, lng2) ** 0.5, expected, delta=1)
+
+    def test_nearest_on_empty_and_single_point_index(self):
+        index = GridIndex(cell_size_m=500, ref_lat=12.97)
+        self.assertEqual(index.nearest(12.97, 77.59), [])
+        index.insert('r1', 12.971, 77.59)
+        [(distance, key)] = index.nearest(12.97, 77.59, k=3)
+        self.assertEqual(key, 'r1')
+        self.assertAlmostEqual(distance, haversine_m(12.97, 77.59, 12.971, 77.59), delta=1)
+
+    def test_nearest_orders_by_distance_and_honours_max_distance(self):
+        index = GridIndex(cell_size_m=500, ref_lat=12.97)
+        index.insert('near', 12.9705, 77.59)
+        index.insert('far', 13.0, 77.59)
+        index.insert('mid', 12.98, 77.59)
+        self.assertEqual([key for _, key in index.nearest(12.97, 77.59, k=3)], ['near', 'mid', 'far'])
+        self.assertEqual([key for _, key in index.nearest(12.97, 77.59, k=3, max_distance_m=2000)], ['near', 'mid'])
+        index.remove('near')
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.nearest(12.97, 77.59)[0][1], 'mid')
+
+
+@override_settings(CACHES=LOCMEM, ID_WORKER_ID=1, RATE_LIMIT_ENABLED=False)
+class OTPFallbackTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('core_app.otp.get_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(DEBUG=False, OTP_MEMORY_FALLBACK=False)
+    def test_fails_closed_without_redis(self):
+        with self.assertRaises(otp.OTPUnavailable):
+            otp.issue(otp.CUSTOMER, '9000000001')
+        with self.assertRaises(otp.OTPUnavailable):
+            otp.verify(otp.CUSTOMER, '9000000001', '123456')
+
+    @override_settings(DEBUG=False, OTP_MEMORY_FALLBACK=True)
+    def test_memory_store_when_allowed(self):
+        self.assertIs(otp.get_store(), otp._memory_store)
+
+    @override_settings(DEBUG=True, OTP_MEMORY_FALLBACK=False)
+    def test_memory_store_under_debug(self):
+        self.assertIs(otp.get_store(), otp._memory_store)
+
+    @override_settings(DEBUG=False, OTP_MEMORY_FALLBACK=False)
+    def test_endpoints_return_503(self):
+        client = APIClient()
+        for url, body in (
+            ('/customer/send-otp/', {'phone': '9000000001'}),
+            ('/customer/verify-otp/', {'phone': '9000000001', 'otp': '123456'}),
+            ('/auth/send-otp/', {'phone': '8000000001'}),
+            ('/auth/verify-otp/', {'phone': '8000000001', 'otp': '123456'}),
+            ('/api/delivery/otp/send/', {'phone_number': '7000000001'}),
+        ):
+            self.assertEqual(client.post(url, body, format='json').status_code, 503, url)
@@ -0,0 +1,25 @@
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .jwt_auth import bearer_token
+from .revocation import revoke_token
+
+
+class TokenLogoutView(APIView):
+    """
+    Revoke the caller's tokens: the refresh token in the body and the access
+    token in the Authorization header, whichever are given. Works for
+    customer, vendor and delivery tokens alike. Tokens that are already
+    expired or invalid are ignored, so logging out twice is harmless.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        refresh_token = request.data.get('refresh')
+        access_token = bearer_token(request)
+        if not refresh_token and not access_token:
+            return Response({'error': 'No token provided'}, status=status.HTTP_400_BAD_REQUEST)
+        revoked = [jti for jti in (revoke_token(t) for t in (refresh_token, access_token) if t) if jti]
+        return Response({'message': 'Logged out', 'revoked': len(revoked)}, status=status.HTTP_200_OK)
@@ -12,4 +12,6 @@ admin.site.register(Food)
 admin.site.register(Cart)
 admin.site.register(Order)
 admin.site.register(OrderItem)
-admin.site.register(Address)
\ No newline at end of file
+admin.site.register(Address)
+admin.site.register(VendorDailyStats)
+admin.site.register(VendorHourlyStats)
@@ -0,0 +1,19 @@
+from core_app.jwt_auth import ClaimsJWTAuthentication, ClaimsPrincipal
+
+from .models import Customer
+
+
+class CustomerPrincipal(ClaimsPrincipal):
+    """request.user for customer tokens; request.user.load() returns the Customer."""
+    id_claim = 'customer_id'
+    model = Customer
+    lookup_field = 'customer_id'
+
+    @property
+    def customer_id(self):
+        return self.id
+
+
+class CustomerJWTAuthentication(ClaimsJWTAuthentication):
+    """Validates tokens from generate_customer_jwt without a database query."""
+    principal_class = CustomerPrincipal
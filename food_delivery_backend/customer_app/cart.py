@@ -0,0 +1,580 @@
+"""
+Customer carts.
+
+The active cart lives in one Redis hash per customer, so viewing it is one
+HGETALL and adding, changing or removing an item is one Lua script call
+(which also enforces the single-restaurant rule atomically). Changes are
+written to the Cart table behind the request: mutated carts are added to a
+dirty set that the flush_carts command drains in batches. A cart that is
+not in Redis (first use, or expired after CART_TTL_SECONDS without
+changes) is loaded from the table once.
+
+Prices, names and vendors come from a cached price table (price_table)
+rather than a join per request; it is invalidated when a listing or its
+vendor changes. Promotions come from the in-process index in
+auth_app/promotions.py. Browsing and editing a warm cart therefore makes no SQL
+queries.
+
+Without Redis the Cart table is used directly. Carts changed that way are
+marked in StaleCart: once Redis is back their Redis copy predates the
+change, so it is dropped (and taken out of the dirty set) before it can be
+served or flushed over the table, and the next read reloads the table's
+version. Each process checks for marks at most every
+CART_RECONCILE_CHECK_SECONDS, and flush() checks before every batch.
+
+Redis layout:
+    cart:{customer_id}  hash food_id -> quantity, plus _vendor (vendor pk or '') and _loaded
+    cart:dirty          set of customers whose cart changed since the last flush
+"""
+import logging
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from core_app.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CART_KEY = 'cart:{}'
+DIRTY_KEY = 'cart:dirty'
+PRICE_KEY = 'menu:price:{}'
+
+ADD = 'add'  # Change the quantity by the given amount
+SET = 'set'  # Replace the quantity
+
+REPLACE = 'replace'  # replace_lines(): the given lines become the whole cart
+MERGE = 'merge'  # replace_lines(): the given quantities are added to the cart
+
+# change() / replace_lines() outcomes
+CHANGED = 1
+OTHER_VENDOR = -1
+NOT_LOADED = -2
+
+# KEYS: cart, dirty set. ARGV: food id, vendor pk, quantity, mode, ttl, customer id.
+# Returns {outcome, new quantity or the cart's vendor}.
+CHANGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {-2, 0}
+end
+local vendor = redis.call('HGET', KEYS[1], '_vendor')
+local items = redis.call('HLEN', KEYS[1]) - 2
+if vendor and vendor ~= '' and vendor ~= ARGV[2] and items > 0 then
+    return {-1, vendor}
+end
+local qty
+if ARGV[4] == 'set' then
+    qty = tonumber(ARGV[3])
+else
+    qty = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0') + tonumber(ARGV[3])
+end
+if qty > 0 then
+    redis.call('HSET', KEYS[1], ARGV[1], qty, '_vendor', ARGV[2])
+else
+    qty = 0
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    if redis.call('HLEN', KEYS[1]) <= 2 then
+        redis.call('HSET', KEYS[1], '_vendor', '')
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('SADD', KEYS[2], ARGV[6])
+return {1, qty}
+"""
+
+# KEYS: cart, dirty set. ARGV: mode, vendor pk, ttl, customer id, then food id / quantity pairs.
+# REPLACE swaps the whole cart; MERGE adds to it, subject to the single-restaurant rule.
+# Returns {outcome, number of items or the cart's vendor}.
+BULK_SCRIPT = """
+if ARGV[1] == 'merge' then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {-2, 0}
+    end
+    local vendor = redis.call('HGET', KEYS[1], '_vendor')
+    if vendor and vendor ~= '' and vendor ~= ARGV[2] and redis.call('HLEN', KEYS[1]) > 2 then
+        return {-1, vendor}
+    end
+else
+    redis.call('DEL', KEYS[1])
+    redis.call('HSET', KEYS[1], '_loaded', 1)
+end
+for i = 5, #ARGV, 2 do
+    if ARGV[1] == 'merge' then
+        redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+    else
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+redis.call('HSET', KEYS[1], '_vendor', ARGV[2])
+local items = redis.call('HLEN', KEYS[1]) - 2
+if items == 0 then
+    redis.call('HSET', KEYS[1], '_vendor', '')
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('SADD', KEYS[2], ARGV[4])
+return {1, items}
+"""
+
+# KEYS: cart. ARGV: ttl, vendor pk, then food id / quantity pairs. Only seeds a cart that is not loaded.
+SEED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], '_loaded', 1, '_vendor', ARGV[2])
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _empty():
+    return {'vendor': None, 'items': {}}
+
+
+def _text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+# --- Price table ------------------------------------------------------------
+
+def _price_entry(row):
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'price': str(row['price']),
+        'is_available': row['is_available'],
+        'category': row['category'],
+        'images': row['images'] or [],
+        'vendor_pk': row['vendor_id'],
+        'vendor_id': row['vendor__vendor_id'],
+        'vendor_name': row['vendor__restaurant_name'],
+    }
+
+
+def price_table(food_ids):
+    """{food_id: listing summary} from the cache; the missing ones are loaded in one query."""
+    from auth_app.models import FoodListing
+
+    food_ids = {int(f) for f in food_ids}
+    if not food_ids:
+        return {}
+    cached = cache.get_many([PRICE_KEY.format(f) for f in food_ids])
+    table = {entry['id']: entry for entry in cached.values()}
+    missing = food_ids - table.keys()
+    if missing:
+        rows = FoodListing.objects.filter(id__in=missing).values(
+            'id', 'name', 'price', 'is_available', 'category', 'images',
+            'vendor_id', 'vendor__vendor_id', 'vendor__restaurant_name',
+        )
+        loaded = {row['id']: _price_entry(row) for row in rows}
+        cache.set_many({PRICE_KEY.format(f): e for f, e in loaded.items()}, timeout=_setting('MENU_PRICE_CACHE_SECONDS', 600))
+        table.update(loaded)
+    return table
+
+
+def invalidate_prices(food_ids):
+    cache.delete_many([PRICE_KEY.format(f) for f in food_ids])
+
+
+# --- Stores -----------------------------------------------------------------
+
+def _load_from_db(customer_id):
+    from .models import Cart
+
+    items = dict(Cart.objects.filter(customer_id=customer_id).values_list('food_id', 'quantity'))
+    if not items:
+        return _empty()
+    vendors = {e['vendor_pk'] for e in price_table(items).values()}
+    return {'vendor': vendors.pop() if len(vendors) == 1 else None, 'items': items}
+
+
+class RedisCartStore:
+    def __init__(self, client):
+        self.client = client
+        self.change_script = client.register_script(CHANGE_SCRIPT)
+        self.seed_script = client.register_script(SEED_SCRIPT)
+        self.bulk_script = client.register_script(BULK_SCRIPT)
+
+    @staticmethod
+    def _parse(raw):
+        if not raw:
+            return None
+        raw = {_text(k): _text(v) for k, v in raw.items()}
+        vendor = raw.pop('_vendor', '')
+        raw.pop('_loaded', None)
+        return {'vendor': int(vendor) if vendor else None, 'items': {int(f): int(q) for f, q in raw.items()}}
+
+    def get(self, customer_id):
+        return self._parse(self.client.hgetall(CART_KEY.format(customer_id)))
+
+    def seed(self, customer_id, cart):
+        args = [_setting('CART_TTL_SECONDS', 7 * 24 * 3600), cart['vendor'] or '']
+        for food_id, quantity in cart['items'].items():
+            args += [food_id, quantity]
+        self.seed_script(keys=[CART_KEY.format(customer_id)], args=args)
+
+    def change(self, customer_id, food_id, vendor_pk, quantity, mode):
+        outcome, value = self.change_script(
+            keys=[CART_KEY.format(customer_id), DIRTY_KEY],
+            args=[food_id, vendor_pk, quantity, mode, _setting('CART_TTL_SECONDS', 7 * 24 * 3600), customer_id],
+        )
+        return int(outcome), int(value)
+
+    def replace_lines(self, customer_id, items, vendor_pk, mode):
+        args = [mode, vendor_pk, _setting('CART_TTL_SECONDS', 7 * 24 * 3600), customer_id]
+        for food_id, quantity in items.items():
+            args += [food_id, quantity]
+        outcome, value = self.bulk_script(keys=[CART_KEY.format(customer_id), DIRTY_KEY], args=args)
+        return int(outcome), int(value)
+
+    def clear(self, customer_id):
+        key = CART_KEY.format(customer_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping={'_loaded': 1, '_vendor': ''})
+        pipe.expire(key, _setting('CART_TTL_SECONDS', 7 * 24 * 3600))
+        pipe.sadd(DIRTY_KEY, customer_id)
+        pipe.execute()
+
+    def discard(self, customer_ids):
+        """Forget carts entirely; the next read loads them from the table."""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(*[CART_KEY.format(c) for c in customer_ids])
+        pipe.srem(DIRTY_KEY, *customer_ids)
+        pipe.execute()
+
+    def pop_dirty(self, count):
+        return [_text(c) for c in self.client.spop(DIRTY_KEY, count) or []]
+
+    def mark_dirty(self, customer_ids):
+        if customer_ids:
+            self.client.sadd(DIRTY_KEY, *customer_ids)
+
+    def snapshot(self, customer_ids):
+        """{customer_id: cart} for carts still in Redis; expired ones are left out."""
+        pipe = self.client.pipeline(transaction=False)
+        for customer_id in customer_ids:
+            pipe.hgetall(CART_KEY.format(customer_id))
+        carts = zip(customer_ids, map(self._parse, pipe.execute()))
+        return {c: cart for c, cart in carts if cart is not None}
+
+
+def _mark_stale(customer_id):
+    from .models import StaleCart
+
+    StaleCart.objects.update_or_create(customer_id=customer_id, defaults={'marked_at': timezone.now()})
+
+
+class DatabaseCartStore:
+    """
+    The Cart table itself, when there is no Redis: every operation is SQL,
+    nothing to flush. Every change marks the cart stale for reconcile().
+    """
+
+    def get(self, customer_id):
+        return _load_from_db(customer_id)
+
+    def seed(self, customer_id, cart):
+        pass
+
+    def change(self, customer_id, food_id, vendor_pk, quantity, mode):
+        from .models import Cart
+
+        with transaction.atomic():
+            rows = list(Cart.objects.select_for_update().filter(customer_id=customer_id).values_list('food_id', 'quantity'))
+            items = dict(rows)
+            if items:
+                vendors = {e['vendor_pk'] for e in price_table(items).values()}
+                others = vendors - {vendor_pk}
+                if others:
+                    return OTHER_VENDOR, others.pop()
+            new_quantity = quantity if mode == SET else items.get(food_id, 0) + quantity
+            if new_quantity > 0:
+                Cart.objects.update_or_create(customer_id=customer_id, food_id=food_id, defaults={'quantity': new_quantity})
+            else:
+                new_quantity = 0
+                Cart.objects.filter(customer_id=customer_id, food_id=food_id).delete()
+            _mark_stale(customer_id)
+        return CHANGED, new_quantity
+
+    def replace_lines(self, customer_id, items, vendor_pk, mode):
+        from .models import Cart
+
+        with transaction.atomic():
+            current = dict(Cart.objects.select_for_update().filter(customer_id=customer_id).values_list('food_id', 'quantity'))
+            if mode == MERGE and current:
+                vendors = {e['vendor_pk'] for e in price_table(current).values()}
+                others = vendors - {vendor_pk}
+                if others:
+                    return OTHER_VENDOR, others.pop()
+                items = {f: current.get(f, 0) + q for f, q in items.items()}
+                Cart.objects.filter(customer_id=customer_id, food_id__in=list(items)).delete()
+                count = len(current.keys() | items.keys())
+            else:
+                Cart.objects.filter(customer_id=customer_id).delete()
+                count = len(items)
+            Cart.objects.bulk_create([Cart(customer_id=customer_id, food_id=f, quantity=q) for f, q in items.items()])
+            _mark_stale(customer_id)
+        return CHANGED, count
+
+    def clear(self, customer_id):
+        from .models import Cart
+
+        with transaction.atomic():
+            Cart.objects.filter(customer_id=customer_id).delete()
+            _mark_stale(customer_id)
+
+    def pop_dirty(self, count):
+        return []
+
+    def mark_dirty(self, customer_ids):
+        pass
+
+    def snapshot(self, customer_ids):
+        return {}
+
+
+_database_store = DatabaseCartStore()
+_redis_store = None
+_reconcile_checked_at = 0.0
+
+
+def get_store():
+    global _redis_store
+    client = get_redis()
+    if client is None:
+        return _database_store
+    store = _redis_store
+    if store is None or store.client is not client:
+        store = _redis_store = RedisCartStore(client)
+    if time.monotonic() - _reconcile_checked_at >= _setting('CART_RECONCILE_CHECK_SECONDS', 5):
+        reconcile(store)
+    return store
+
+
+def reconcile(store, batch_size=500):
+    """
+    Drop the Redis copy of carts changed in the Cart table while Redis was
+    down, so the table's version is what gets read and flushed next.
+    Returns the number of carts reconciled.
+    """
+    from .models import StaleCart
+
+    global _reconcile_checked_at
+    _reconcile_checked_at = time.monotonic()
+    reconciled = 0
+    while True:
+        marks = list(StaleCart.objects.values_list('customer_id', 'marked_at')[:batch_size])
+        if marks:
+            customer_ids = [c for c, _ in marks]
+            store.discard(customer_ids)
+            # A cart marked again meanwhile has a later marked_at and stays for the next check
+            StaleCart.objects.filter(customer_id__in=customer_ids, marked_at__lte=max(m for _, m in marks)).delete()
+            reconciled += len(marks)
+        if len(marks) < batch_size:
+            break
+    if reconciled:
+        logger.info(f"Reloading {reconciled} carts changed while Redis was unavailable")
+    return reconciled
+
+
+# --- Cart operations --------------------------------------------------------
+
+def get_cart(customer_id):
+    """{'vendor': vendor pk or None, 'items': {food_id: quantity}}."""
+    customer_id = str(customer_id)
+    store = get_store()
+    cart = store.get(customer_id)
+    if cart is None:
+        cart = _load_from_db(customer_id)
+        store.seed(customer_id, cart)
+    return cart
+
+
+def change(customer_id, food_id, quantity, mode=ADD):
+    """
+    Add to (mode ADD) or set (mode SET) the quantity of one listing; a
+    quantity that ends at or below zero removes it. Returns (outcome, value):
+    (CHANGED, new quantity) or (OTHER_VENDOR, vendor pk of the current cart).
+    Raises LookupError for an unknown listing.
+    """
+    customer_id, food_id = str(customer_id), int(food_id)
+    entry = price_table([food_id]).get(food_id)
+    if entry is None:
+        raise LookupError(food_id)
+    store = get_store()
+    outcome, value = store.change(customer_id, food_id, entry['vendor_pk'], quantity, mode)
+    if outcome == NOT_LOADED:
+        store.seed(customer_id, _load_from_db(customer_id))
+        outcome, value = store.change(customer_id, food_id, entry['vendor_pk'], quantity, mode)
+    return outcome, value
+
+
+def replace_lines(customer_id, items, mode=REPLACE):
+    """
+    Apply many lines at once, atomically: with mode REPLACE the items
+    ({food_id: quantity}, quantities > 0) become the whole cart, with MERGE
+    their quantities are added to it. All items must be from one vendor and,
+    when merging, from the cart's vendor. Returns (CHANGED, number of lines
+    in the cart) or (OTHER_VENDOR, vendor pk of the current cart). Raises
+    LookupError with the unknown listing ids and ValueError if the items
+    span several vendors.
+    """
+    customer_id = str(customer_id)
+    items = {int(f): int(q) for f, q in items.items()}
+    table = price_table(items)
+    unknown = sorted(items.keys() - table.keys())
+    if unknown:
+        raise LookupError(unknown)
+    vendors = {e['vendor_pk'] for e in table.values()}
+    if len(vendors) > 1:
+        raise ValueError('Items from more than one restaurant')
+    vendor_pk = vendors.pop() if vendors else ''
+    store = get_store()
+    if mode == MERGE and not items:
+        return CHANGED, len(get_cart(customer_id)['items'])
+    outcome, value = store.replace_lines(customer_id, items, vendor_pk, mode)
+    if outcome == NOT_LOADED:
+        store.seed(customer_id, _load_from_db(customer_id))
+        outcome, value = store.replace_lines(customer_id, items, vendor_pk, mode)
+    return outcome, value
+
+
+def reorder(customer_id, order_lines, mode=REPLACE):
+    """
+    Rebuild the cart from a past order. order_lines are (food_id, quantity,
+    unit price paid) rows of its OrderItems. Listings that are gone or no
+    longer available are left out. Returns (outcome, value, report) with
+    outcome and value as for replace_lines() (outcome None if nothing could
+    be added) and report {'unavailable': [...], 'repriced': [...]}.
+    """
+    quantities, paid = {}, {}
+    for food_id, quantity, price in order_lines:
+        quantities[food_id] = quantities.get(food_id, 0) + quantity
+        paid[food_id] = Decimal(str(price))
+    table = price_table(quantities)
+    unavailable, repriced, items = [], [], {}
+    for food_id, quantity in quantities.items():
+        entry = table.get(food_id)
+        if entry is None or not entry['is_available']:
+            unavailable.append({'food_id': food_id, 'name': entry['name'] if entry else None, 'quantity': quantity})
+            continue
+        items[food_id] = quantity
+        if Decimal(entry['price']) != paid[food_id]:
+            repriced.append({'food_id': food_id, 'name': entry['name'], 'old_price': str(paid[food_id]), 'new_price': entry['price']})
+    report = {'unavailable': unavailable, 'repriced': repriced}
+    if not items:
+        return None, 0, report
+    outcome, value = replace_lines(customer_id, items, mode)
+    return outcome, value, report
+
+
+def remove(customer_id, food_id):
+    return change(customer_id, food_id, 0, SET)
+
+
+def clear(customer_id):
+    get_store().clear(str(customer_id))
+
+
+def line_items(cart):
+    """Priced lines and the total for a cart; listings that no longer exist are skipped."""
+    table = price_table(cart['items'])
+    lines, total = [], Decimal('0')
+    for food_id, quantity in cart['items'].items():
+        entry = table.get(food_id)
+        if entry is None:
+            continue
+        line_total = Decimal(entry['price']) * quantity
+        total += line_total
+        lines.append({
+            'id': food_id,
+            'food': food_id,
+            'quantity': quantity,
+            'price': entry['price'],
+            'line_total': str(line_total),
+            'food_details': entry,
+        })
+    return lines, total
+
+
+def quote(cart, day=None):
+    """
+    line_items() with the vendor's promotions applied. Each line gains
+    'discount' and 'promotion'; returns (lines, pricing) where pricing is
+    auth_app.promotions.apply()'s subtotal / discount / total / promotions.
+    """
+    from auth_app import promotions
+
+    lines, subtotal = line_items(cart)
+    if not lines:
+        return lines, {'subtotal': subtotal, 'discount': Decimal('0'), 'total': subtotal, 'promotions': []}
+    pricing = promotions.apply(lines[0]['food_details']['vendor_pk'], [
+        {'food': line['food'], 'quantity': line['quantity'], 'price': line['price'], 'category': line['food_details']['category']}
+        for line in lines
+    ], day)
+    for line, priced in zip(lines, pricing['lines']):
+        line['discount'] = str(priced['discount'])
+        line['promotion'] = {'id': priced['promotion_id'], 'title': priced['promotion_title']} if priced['promotion_id'] else None
+    return lines, pricing
+
+
+def summary(customer_id):
+    lines, pricing = quote(get_cart(customer_id))
+    return {
+        'items': lines,
+        'subtotal': pricing['subtotal'],
+        'discount_amount': pricing['discount'],
+        'total_amount': pricing['total'],
+        'promotions': pricing['promotions'],
+        'item_count': len(lines),
+    }
+
+
+# --- Write-behind -----------------------------------------------------------
+
+def flush(batch_size=500):
+    """
+    Write carts changed since the last flush to the Cart table. Returns the
+    number of carts written. Carts that fail to save are marked dirty again.
+    """
+    from auth_app.models import FoodListing
+    from .models import Cart, Customer
+
+    store = get_store()
+    if store is _database_store:
+        return 0  # Nothing is held back
+    reconcile(store)  # Never write a stale Redis copy over changes made while it was down
+    customer_ids = store.pop_dirty(batch_size)
+    if not customer_ids:
+        return 0
+    try:
+        carts = store.snapshot(customer_ids)
+        # Carts of unknown customers or deleted listings would fail the whole batch on the foreign keys
+        customers = set(Customer.objects.filter(customer_id__in=list(carts)).values_list('customer_id', flat=True))
+        carts = {c: cart for c, cart in carts.items() if c in customers}
+        food_ids = {f for cart in carts.values() for f in cart['items']}
+        existing = set(FoodListing.objects.filter(id__in=food_ids).values_list('id', flat=True))
+        rows = [
+            Cart(customer_id=customer_id, food_id=food_id, quantity=quantity)
+            for customer_id, cart in carts.items()
+            for food_id, quantity in cart['items'].items()
+            if food_id in existing
+        ]
+        with transaction.atomic():
+            Cart.objects.filter(customer_id__in=list(carts)).delete()
+            Cart.objects.bulk_create(rows)
+    except Exception as e:
+        logger.error(f"Failed to flush {len(customer_ids)} carts: {e}")
+        store.mark_dirty(customer_ids)
+        raise
+    return len(carts)
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from customer_app.cart import flush
+
+
+class Command(BaseCommand):
+    help = 'Persist carts changed in Redis to the Cart table in batches (write-behind).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'CART_FLUSH_INTERVAL', 5),
+                            help='Seconds between flushes.')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'CART_FLUSH_BATCH_SIZE', 500))
+        parser.add_argument('--once', action='store_true', help='Flush every pending cart once, then exit.')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        self.stdout.write(f"Flushing carts every {interval}s")
+        try:
+            while True:
+                started = time.monotonic()
+                written = 0
+                while True:
+                    try:
+                        batch = flush(options['batch_size'])
+                    except Exception as e:
+                        self.stderr.write(f"Cart flush failed, will retry: {e}")
+                        break
+                    written += batch
+                    if batch < options['batch_size']:
+                        break
+                if written:
+                    self.stdout.write(f"Persisted {written} carts")
+                if options['once']:
+                    break
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping cart flusher')
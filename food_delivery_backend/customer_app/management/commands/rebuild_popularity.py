@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from customer_app.popularity import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Seed the popular-items summaries in the cache from the hourly vendor rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Days of rollups to replay.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Rebuilt {rebuild(options['days'])} popularity summaries")
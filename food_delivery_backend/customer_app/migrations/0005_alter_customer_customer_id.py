@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_app', '0004_customer_fcm_token'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='customer_id',
+            field=models.CharField(max_length=20, primary_key=True, serialize=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_app', '0005_alter_customer_customer_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivery_lat',
+            field=models.FloatField(blank=True, help_text='Last persisted latitude of delivery agent', null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='delivery_lng',
+            field=models.FloatField(blank=True, help_text='Last persisted longitude of delivery agent', null=True),
+        ),
+    ]
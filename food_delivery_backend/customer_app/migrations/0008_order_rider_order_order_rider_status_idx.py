@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0011_alter_vendor_vendor_id'),
+        ('customer_app', '0007_order_delivery_latitude_order_delivery_longitude'),
+        ('delivery_auth', '0003_locationtrail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='rider',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='delivery_auth.deliveryuser'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['rider', 'status', 'created_at'], name='order_rider_status_idx'),
+        ),
+    ]
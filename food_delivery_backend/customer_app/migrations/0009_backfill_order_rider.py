@@ -0,0 +1,34 @@
+from uuid import UUID
+
+from django.db import migrations
+
+
+def backfill_order_rider(apps, schema_editor):
+    """Point Order.rider at the rider named in the delivery_partner JSON."""
+    Order = apps.get_model('customer_app', 'Order')
+    DeliveryUser = apps.get_model('delivery_auth', 'DeliveryUser')
+    rider_ids = set(DeliveryUser.objects.values_list('id', flat=True))
+    by_rider = {}
+    rows = Order.objects.filter(delivery_partner__isnull=False, rider__isnull=True).values_list('id', 'delivery_partner')
+    for order_id, partner in rows:
+        try:
+            rider_id = UUID(str(partner.get('id')))
+        except (AttributeError, ValueError):
+            continue  # Not a dict or not a rider id
+        if rider_id in rider_ids:
+            by_rider.setdefault(rider_id, []).append(order_id)
+    for rider_id, order_ids in by_rider.items():
+        for start in range(0, len(order_ids), 500):
+            Order.objects.filter(id__in=order_ids[start:start + 500]).update(rider_id=rider_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_app', '0008_order_rider_order_order_rider_status_idx'),
+        ('delivery_auth', '0003_locationtrail'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_rider, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def map_legacy_carts(apps, schema_editor):
+    """
+    Point cart rows at the FoodListing of the same vendor and name as their
+    Food, merging rows that land on the same listing; rows without exactly
+    one such listing are dropped.
+    """
+    Cart = apps.get_model('customer_app', 'Cart')
+    Food = apps.get_model('customer_app', 'Food')
+    FoodListing = apps.get_model('auth_app', 'FoodListing')
+    listings = {}
+    for listing_id, vendor_id, name in FoodListing.objects.values_list('id', 'vendor_id', 'name'):
+        key = (vendor_id, name.strip().lower())
+        listings[key] = None if key in listings else listing_id  # Ambiguous names map to nothing
+    food_ids = set(Cart.objects.values_list('food_id', flat=True))
+    to_listing = {
+        food_id: listings.get((vendor_id, name.strip().lower()))
+        for food_id, vendor_id, name in Food.objects.filter(id__in=food_ids).values_list('id', 'vendor_id', 'name')
+    }
+    kept, dropped = {}, []
+    for row_id, customer_id, food_id, quantity in Cart.objects.order_by('id').values_list('id', 'customer_id', 'food_id', 'quantity'):
+        listing_id = to_listing.get(food_id)
+        if listing_id is None:
+            dropped.append(row_id)
+        elif (customer_id, listing_id) in kept:
+            kept[customer_id, listing_id][1] += quantity
+            dropped.append(row_id)
+        else:
+            kept[customer_id, listing_id] = [row_id, quantity]
+    for start in range(0, len(dropped), 500):
+        Cart.objects.filter(id__in=dropped[start:start + 500]).delete()
+    for (_, listing_id), (row_id, quantity) in kept.items():
+        Cart.objects.filter(id=row_id).update(food_id=listing_id, quantity=quantity)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0011_alter_vendor_vendor_id'),
+        ('customer_app', '0009_backfill_order_rider'),
+    ]
+
+    operations = [
+        migrations.RunPython(map_legacy_carts, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cart',
+            name='food',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth_app.foodlisting'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('customer', 'food'), name='cart_customer_food_unique'),
+        ),
+    ]
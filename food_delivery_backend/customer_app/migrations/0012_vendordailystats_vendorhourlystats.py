@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0012_promotion_vendorcategory'),
+        ('customer_app', '0011_order_discount_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendorDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('status_counts', models.JSONField(default=dict)),
+                ('item_quantities', models.JSONField(default=dict)),
+                ('day', models.DateField()),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth_app.vendor')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('vendor', 'day'), name='vendor_daily_stats_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VendorHourlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('status_counts', models.JSONField(default=dict)),
+                ('item_quantities', models.JSONField(default=dict)),
+                ('hour', models.DateTimeField()),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='auth_app.vendor')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('vendor', 'hour'), name='vendor_hourly_stats_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_app', '0012_vendordailystats_vendorhourlystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='ready_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer_app', '0013_order_ready_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleCart',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('marked_at', models.DateTimeField()),
+            ],
+        ),
+    ]
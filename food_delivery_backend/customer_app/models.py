@@ -1,7 +1,7 @@
 from django.db import models
-import random
 from auth_app.models import Vendor, FoodListing  # Import Vendor and FoodListing models from auth_app
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin # Import necessary classes
+from core_app.ids import new_customer_id, new_order_number
 
 # --- Custom User Manager ---
 class CustomerManager(BaseUserManager):
@@ -20,10 +20,7 @@ class CustomerManager(BaseUserManager):
         # Generate customer_id here or let the model's save handle it
         customer_id = extra_fields.pop('customer_id', None)
         if not customer_id:
-             while True:
-                customer_id = f"C{random.randint(10000, 99999)}"
-                if not self.model.objects.filter(customer_id=customer_id).exists():
-                    break
+            customer_id = new_customer_id()
 
         user = self.model(
             customer_id=customer_id,
@@ -64,7 +61,7 @@ class CustomerManager(BaseUserManager):
         # Generate customer_id (can reuse logic from create_user or simplify)
         customer_id = extra_fields.pop('customer_id', None)
         if not customer_id:
-             customer_id = f"C{random.randint(10000, 99999)}" # Simplified for superuser
+             customer_id = new_customer_id()
 
         # Reuse create_user logic
         return self.create_user(
@@ -80,7 +77,7 @@ class CustomerManager(BaseUserManager):
 
 # Modify Customer model
 class Customer(AbstractBaseUser, PermissionsMixin): # Inherit from AbstractBaseUser and PermissionsMixin
-    customer_id = models.CharField(max_length=10, unique=True, primary_key=True) # Make customer_id primary key
+    customer_id = models.CharField(max_length=20, unique=True, primary_key=True) # Make customer_id primary key
     phone = models.CharField(max_length=15, unique=True)
     full_name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
@@ -157,11 +154,25 @@ class Food(models.Model):
     is_available = models.BooleanField(default=True)
 
 class Cart(models.Model):
+    # Persisted copy of the cart; the live one is in Redis (customer_app/cart.py)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
-    food = models.ForeignKey(Food, on_delete=models.CASCADE)
+    food = models.ForeignKey(FoodListing, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'food'], name='cart_customer_food_unique'),
+        ]
+
+class StaleCart(models.Model):
+    """
+    A cart changed in the Cart table while Redis was unreachable. Its Redis
+    copy, if any, is older and is dropped once Redis is back (customer_app/cart.py).
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True)
+    marked_at = models.DateTimeField()
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -184,17 +195,33 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     delivery_address = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    ready_at = models.DateTimeField(null=True, blank=True)  # When the vendor marked it ready for pickup (dispatch/batching)
     current_location = models.CharField(max_length=255, null=True, blank=True)
-    delivery_partner = models.JSONField(null=True, blank=True)
+    delivery_partner = models.JSONField(null=True, blank=True)  # Display copy of the assigned rider (name, phone, batch plan)
+    rider = models.ForeignKey(
+        'delivery_auth.DeliveryUser', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='orders', db_index=False,  # Covered by order_rider_status_idx
+    )
     estimated_delivery = models.DateTimeField(null=True, blank=True)
     payment_id = models.CharField(max_length=100, null=True, blank=True) # For online payments
     payment_mode = models.CharField(max_length=10, choices=PAYMENT_MODE_CHOICES, default='COD') # Added payment_mode
     payment_status = models.CharField(max_length=20, default='pending') # Existing field
     delivery_fee = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True) # Add delivery fee
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0) # Promotions applied to the items (auth_app.promotions)
+    delivery_lat = models.FloatField(null=True, blank=True, help_text="Last persisted latitude of delivery agent")
+    delivery_lng = models.FloatField(null=True, blank=True, help_text="Last persisted longitude of delivery agent")
+    delivery_latitude = models.FloatField(null=True, blank=True, help_text="Latitude of the drop-off address")
+    delivery_longitude = models.FloatField(null=True, blank=True, help_text="Longitude of the drop-off address")
+
+    class Meta:
+        indexes = [
+            # A rider's orders by status, newest first, as a range scan
+            models.Index(fields=['rider', 'status', 'created_at'], name='order_rider_status_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.order_number:
-            self.order_number = f"ORD{random.randint(10000, 99999)}"
+            self.order_number = new_order_number()
         super().save(*args, **kwargs)
 
 class OrderItem(models.Model):
@@ -202,3 +229,39 @@ class OrderItem(models.Model):
     food = models.ForeignKey(FoodListing, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+
+
+class VendorStatsBase(models.Model):
+    """Running totals for a vendor's orders placed in one period (customer_app/rollups.py)."""
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # Cancelled orders excluded
+    status_counts = models.JSONField(default=dict)  # Lower-cased status -> orders currently in it
+    item_quantities = models.JSONField(default=dict)  # Food listing id -> quantity ordered, cancelled orders excluded
+
+    class Meta:
+        abstract = True
+
+
+class VendorDailyStats(VendorStatsBase):
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'day'], name='vendor_daily_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.vendor_id} {self.day}"
+
+
+class VendorHourlyStats(VendorStatsBase):
+    hour = models.DateTimeField()  # Start of the hour
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'hour'], name='vendor_hourly_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.vendor_id} {self.hour:%Y-%m-%d %H:00}"
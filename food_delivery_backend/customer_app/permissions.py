@@ -0,0 +1,15 @@
+from rest_framework import permissions
+
+from core_app.jwt_auth import raise_deferred_failure
+
+from .authentication import CustomerPrincipal
+
+
+class IsAuthenticatedCustomer(permissions.BasePermission):
+    """Allows access only to requests authenticated with a customer token; a bad token answers 401."""
+
+    def has_permission(self, request, view):
+        if isinstance(request.user, CustomerPrincipal):
+            return True
+        raise_deferred_failure(request)
+        return False
@@ -0,0 +1,283 @@
+"""
+What is popular right now.
+
+Ordered quantities are tracked per vendor, per area and overall in
+Space-Saving summaries: a fixed number of counters per summary, of which
+the heaviest items are kept, so the top items of any summary are read in
+constant time and space however many orders and listings there are. An
+item's estimate overcounts by at most its recorded error.
+
+Counts decay with a half-life of POPULARITY_HALF_LIFE_SECONDS ("popular
+now", not "popular ever"). Decay is forward: a new order is weighted by how
+far it lies after the summary's landmark time instead of every counter being
+scaled down as time passes, and counters are rescaled only when the weights
+grow large.
+
+Summaries are plain dicts in the shared cache, so every worker sees the
+same ranking. Orders only add to a pending summary in the process after
+commit; a timer thread merges the pending summaries into the shared ones
+every POPULARITY_FLUSH_SECONDS under a short cache lock, so no request
+waits on it. Summaries whose lock is busy stay pending until the next
+tick. An area is a grid cell of POPULARITY_AREA_DEGREES around
+the restaurant's location (its pincode when it has none). The
+rebuild_popularity command seeds the summaries from the hourly vendor
+rollups, e.g. after the cache was cleared.
+"""
+import atexit
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY = 'popularity:{}'
+LOCK_KEY = 'popularity:{}:lock'
+ALL = 'all'
+RESCALE_EXPONENT = 64  # Rescale once new weights reach 2 ** 64
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def vendor_key(vendor_pk):
+    return f"vendor:{vendor_pk}"
+
+
+def area_of(latitude=None, longitude=None, pincode=None):
+    """The area for a location, or None if nothing is known about it."""
+    if latitude is not None and longitude is not None:
+        size = _setting('POPULARITY_AREA_DEGREES', 0.1)
+        return f"area:{math.floor(float(latitude) / size)}:{math.floor(float(longitude) / size)}"
+    if pincode:
+        return f"area:pin:{pincode}"
+    return None
+
+
+class SpaceSaving:
+    """
+    A Space-Saving summary with forward exponential decay. counters maps an
+    item to [count, error], both weighted relative to the landmark time.
+    """
+
+    def __init__(self, capacity, half_life, landmark=None, counters=None):
+        self.capacity = capacity
+        self.half_life = half_life
+        self.landmark = time.time() if landmark is None else landmark
+        self.counters = counters if counters is not None else {}
+
+    def _weight(self, now):
+        return 2.0 ** ((now - self.landmark) / self.half_life)
+
+    def _rescale(self, landmark):
+        factor = 2.0 ** ((self.landmark - landmark) / self.half_life)
+        for counter in self.counters.values():
+            counter[0] *= factor
+            counter[1] *= factor
+        self.landmark = landmark
+
+    def add(self, item, count=1, now=None):
+        now = time.time() if now is None else now
+        if (now - self.landmark) / self.half_life > RESCALE_EXPONENT:
+            self._rescale(now)
+        weight = count * self._weight(now)
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [weight, 0.0]
+        else:
+            # Replace the smallest counter; the newcomer inherits its count as the error bound
+            victim = min(self.counters, key=lambda k: self.counters[k][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + weight, floor]
+
+    def merge(self, other):
+        """Fold another summary (e.g. pending local updates) into this one."""
+        if (other.landmark - self.landmark) / self.half_life > RESCALE_EXPONENT:
+            self._rescale(other.landmark)
+        if other.landmark != self.landmark:
+            other = SpaceSaving(other.capacity, other.half_life, other.landmark,
+                                {k: list(v) for k, v in other.counters.items()})
+            other._rescale(self.landmark)
+        for item, (count, error) in other.counters.items():
+            counter = self.counters.setdefault(item, [0.0, 0.0])
+            counter[0] += count
+            counter[1] += error
+        if len(self.counters) > self.capacity:
+            kept = sorted(self.counters.items(), key=lambda kv: kv[1][0], reverse=True)[:self.capacity]
+            self.counters = dict(kept)
+
+    def top(self, n, now=None):
+        """[(item, decayed count, decayed error)], heaviest first."""
+        scale = 1.0 / self._weight(time.time() if now is None else now)
+        ranked = sorted(self.counters.items(), key=lambda kv: kv[1][0], reverse=True)[:n]
+        return [(item, count * scale, error * scale) for item, (count, error) in ranked]
+
+    def to_dict(self):
+        return {'landmark': self.landmark, 'counters': self.counters}
+
+    @classmethod
+    def from_dict(cls, data, capacity, half_life):
+        return cls(capacity, half_life, data['landmark'], {k: list(v) for k, v in data['counters'].items()})
+
+
+def _new():
+    return SpaceSaving(_setting('POPULARITY_CAPACITY', 64), _setting('POPULARITY_HALF_LIFE_SECONDS', 6 * 3600))
+
+
+def load(key):
+    data = cache.get(KEY.format(key))
+    if data is None:
+        return None
+    return SpaceSaving.from_dict(data, _setting('POPULARITY_CAPACITY', 64), _setting('POPULARITY_HALF_LIFE_SECONDS', 6 * 3600))
+
+
+def _store(key, summary):
+    cache.set(KEY.format(key), summary.to_dict(), timeout=_setting('POPULARITY_CACHE_SECONDS', 7 * 24 * 3600))
+
+
+_pending_lock = threading.Lock()
+_pending = {}  # key -> SpaceSaving of updates not yet in the shared summary
+_flush_timer = None
+
+
+def _keep_pending(key, pending):
+    """Put updates back after a failed merge, together with any that arrived meanwhile."""
+    with _pending_lock:
+        newer = _pending.get(key)
+        if newer is not None:
+            pending.merge(newer)
+        _pending[key] = pending
+
+
+def _publish(key):
+    """Merge the pending updates for key into the shared summary; False if the lock is busy."""
+    lock = LOCK_KEY.format(key)
+    if not cache.add(lock, 1, timeout=5):
+        return False
+    try:
+        with _pending_lock:
+            pending = _pending.pop(key, None)
+        if pending is not None:
+            try:
+                shared = load(key)
+                if shared is None:
+                    shared = pending
+                else:
+                    shared.merge(pending)
+                _store(key, shared)
+            except Exception:
+                _keep_pending(key, pending)
+                raise
+    finally:
+        cache.delete(lock)
+    return True
+
+
+def flush():
+    """Merge every pending summary into the shared ones now. Returns the keys left pending."""
+    with _pending_lock:
+        keys = list(_pending)
+    left = []
+    for key in keys:
+        try:
+            if not _publish(key):
+                left.append(key)
+        except Exception as e:
+            logger.error(f"Failed to update popularity summary {key}: {e}")
+            left.append(key)
+    if left:
+        logger.warning(f"Popularity summaries {left} are busy or failing; keeping the updates pending")
+    return left
+
+
+def _schedule_flush():
+    """Start the flush timer unless it is running. Call with _pending_lock held."""
+    global _flush_timer
+    if _flush_timer is None:
+        _flush_timer = threading.Timer(_setting('POPULARITY_FLUSH_SECONDS', 5), _flush_on_timer)
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def _flush_on_timer():
+    global _flush_timer
+    with _pending_lock:
+        _flush_timer = None
+    try:
+        flush()
+    finally:
+        with _pending_lock:
+            if _pending:
+                _schedule_flush()
+
+
+atexit.register(flush)
+
+
+def record(keys, lines, now=None):
+    """Count (food_id, quantity) lines in the summaries of the given keys; shared within POPULARITY_FLUSH_SECONDS."""
+    now = time.time() if now is None else now
+    with _pending_lock:
+        for key in keys:
+            pending = _pending.get(key)
+            if pending is None:
+                pending = _pending[key] = _new()
+            for food_id, quantity in lines:
+                pending.add(str(food_id), quantity, now)
+        _schedule_flush()
+
+
+def record_order(vendor, lines):
+    """Count an order's lines for its vendor, the vendor's area and overall."""
+    keys = [vendor_key(vendor.pk), ALL]
+    area = area_of(vendor.latitude, vendor.longitude, vendor.pincode)
+    if area:
+        keys.append(area)
+    record(keys, lines)
+
+
+def popular(key, n=10):
+    """[(food_id, estimated recent quantity)] for a summary, heaviest first."""
+    summary = load(key)
+    if summary is None:
+        return []
+    return [(int(item), count) for item, count, _ in summary.top(n)]
+
+
+def rebuild(days=7):
+    """Seed every summary from the hourly vendor rollups of the last days. Returns the number of summaries."""
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from auth_app.models import Vendor
+    from .models import VendorHourlyStats
+
+    since = timezone.now() - timedelta(days=days)
+    vendors = {v['id']: v for v in Vendor.objects.values('id', 'latitude', 'longitude', 'pincode')}
+    summaries = {}
+    rows = VendorHourlyStats.objects.filter(hour__gte=since).order_by('hour').values_list('vendor_id', 'hour', 'item_quantities')
+    for vendor_pk, hour, quantities in rows.iterator():
+        vendor = vendors.get(vendor_pk)
+        keys = [vendor_key(vendor_pk), ALL]
+        area = vendor and area_of(vendor['latitude'], vendor['longitude'], vendor['pincode'])
+        if area:
+            keys.append(area)
+        # An hour's orders are counted at its midpoint
+        at = hour.timestamp() + 1800
+        for key in keys:
+            summary = summaries.get(key)
+            if summary is None:
+                summary = summaries[key] = _new()
+                summary.landmark = since.timestamp()
+            for food_id, quantity in quantities.items():
+                summary.add(food_id, quantity, at)
+    cache.set_many({KEY.format(k): s.to_dict() for k, s in summaries.items()},
+                   timeout=_setting('POPULARITY_CACHE_SECONDS', 7 * 24 * 3600))
+    return len(summaries)
@@ -0,0 +1,198 @@
+"""
+Vendor analytics rollups.
+
+Every order is counted in one VendorDailyStats and one VendorHourlyStats
+row of its vendor, for the day and hour it was placed (local time): number
+of orders, revenue, how many are currently in each status and the quantity
+ordered of each listing. Order creation and status changes update both rows
+in the transaction that makes the change, so the vendor dashboard reads one
+row per day instead of scanning the vendor's whole order history.
+
+The rebuild_vendor_rollups command regenerates every row from the orders in
+bulk, e.g. after a data migration or for orders changed outside the views.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0')
+
+# Statuses are compared lower-cased: the apps send both 'Pending' and 'pending'
+EXCLUDED_STATUSES = {'cancelled'}  # Not counted in revenue or item quantities
+PENDING_STATUSES = {'pending', 'placed'}
+COMPLETED_STATUSES = {'delivered', 'fulfilled'}
+
+
+def _status(value):
+    return (value or '').lower()
+
+
+def _amount(value):
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def _periods(created_at):
+    local = timezone.localtime(created_at)
+    return local.date(), local.replace(minute=0, second=0, microsecond=0)
+
+
+def _bump(counts, key, delta):
+    key = str(key)
+    value = counts.get(key, 0) + delta
+    if value:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+def _apply(vendor_id, created_at, orders=0, revenue=ZERO, statuses=(), items=()):
+    """Add deltas to the vendor's daily and hourly rows for created_at; the rows are locked meanwhile."""
+    from .models import VendorDailyStats, VendorHourlyStats
+
+    day, hour = _periods(created_at)
+    with transaction.atomic():
+        for model, period in ((VendorDailyStats, {'day': day}), (VendorHourlyStats, {'hour': hour})):
+            row, _ = model.objects.select_for_update().get_or_create(vendor_id=vendor_id, **period)
+            row.orders += orders
+            row.revenue += revenue
+            for status, delta in statuses:
+                _bump(row.status_counts, status, delta)
+            for food_id, quantity in items:
+                _bump(row.item_quantities, food_id, quantity)
+            row.save()
+
+
+def record_order(order, lines):
+    """
+    Count a new order; lines are its (food_id, quantity) pairs. Call in the
+    creating transaction. The popularity summaries are updated once it commits.
+    """
+    from . import popularity
+
+    if order.vendor_id is None:
+        return
+    status = _status(order.status)
+    counted = status not in EXCLUDED_STATUSES
+    _apply(
+        order.vendor_id, order.created_at, orders=1,
+        revenue=_amount(order.total_amount) if counted else ZERO,
+        statuses=[(status, 1)],
+        items=lines if counted else (),
+    )
+    if counted:
+        transaction.on_commit(lambda: popularity.record_order(order.vendor, lines))
+
+
+def record_status_change(order, old_status, new_status):
+    """Move an order between status counts, and in or out of revenue when it is (un)cancelled."""
+    from .models import OrderItem
+
+    old, new = _status(old_status), _status(new_status)
+    if order.vendor_id is None or old == new:
+        return
+    sign = (new not in EXCLUDED_STATUSES) - (old not in EXCLUDED_STATUSES)
+    items = ()
+    if sign:
+        items = [(f, q * sign) for f, q in OrderItem.objects.filter(order_id=order.id).values_list('food_id', 'quantity')]
+    _apply(
+        order.vendor_id, order.created_at,
+        revenue=_amount(order.total_amount) * sign,
+        statuses=[(old, -1), (new, 1)],
+        items=items,
+    )
+
+
+def rebuild(batch_size=1000):
+    """Regenerate all rollup rows from the orders with two grouped queries per table. Returns the row counts."""
+    from .models import Order, OrderItem, VendorDailyStats, VendorHourlyStats
+
+    written = {}
+    for model, field, trunc in ((VendorDailyStats, 'day', TruncDate), (VendorHourlyStats, 'hour', TruncHour)):
+        rows = {}
+
+        def row(vendor_id, period):
+            key = (vendor_id, period)
+            if key not in rows:
+                rows[key] = model(vendor_id=vendor_id, revenue=ZERO, **{field: period})
+            return rows[key]
+
+        orders = Order.objects.filter(vendor__isnull=False).annotate(period=trunc('created_at')).values(
+            'vendor_id', 'period', 'status',
+        ).annotate(count=Count('id'), revenue=Sum('total_amount')).order_by()
+        for group in orders:
+            stats = row(group['vendor_id'], group['period'])
+            status = _status(group['status'])
+            stats.orders += group['count']
+            _bump(stats.status_counts, status, group['count'])
+            if status not in EXCLUDED_STATUSES:
+                stats.revenue += group['revenue'] or ZERO
+
+        items = OrderItem.objects.filter(order__vendor__isnull=False).annotate(period=trunc('order__created_at')).values(
+            'order__vendor_id', 'period', 'order__status', 'food_id',
+        ).annotate(quantity=Sum('quantity')).order_by()
+        for group in items:
+            if _status(group['order__status']) not in EXCLUDED_STATUSES:
+                _bump(row(group['order__vendor_id'], group['period']).item_quantities, group['food_id'], group['quantity'])
+
+        with transaction.atomic():
+            model.objects.all().delete()
+            model.objects.bulk_create(rows.values(), batch_size=batch_size)
+        written[model.__name__] = len(rows)
+    return written
+
+
+def _totals(rows):
+    totals = {'orders': 0, 'revenue': ZERO, 'statuses': {}, 'items': {}}
+    for stats in rows:
+        totals['orders'] += stats['orders']
+        totals['revenue'] += stats['revenue']
+        for status, count in stats['status_counts'].items():
+            _bump(totals['statuses'], status, count)
+        for food_id, quantity in stats['item_quantities'].items():
+            _bump(totals['items'], food_id, quantity)
+    return totals
+
+
+def vendor_summary(vendor_pk, since=None, top=5):
+    """
+    Dashboard figures from the daily rows since the given date (all time by
+    default) and the hourly rows of the last 24 hours: three queries plus
+    one for the names of the top listings.
+    """
+    from auth_app.models import FoodListing
+    from .models import VendorDailyStats, VendorHourlyStats
+
+    fields = ('orders', 'revenue', 'status_counts', 'item_quantities')
+    daily = VendorDailyStats.objects.filter(vendor_id=vendor_pk)
+    if since is not None:
+        daily = daily.filter(day__gte=since)
+    daily = list(daily.order_by('day').values('day', *fields))
+    hourly = list(VendorHourlyStats.objects.filter(
+        vendor_id=vendor_pk, hour__gt=timezone.now() - timedelta(hours=24),
+    ).order_by('hour').values('hour', 'orders', 'revenue'))
+
+    totals = _totals(daily)
+    statuses = totals['statuses']
+    ranked = sorted(totals['items'].items(), key=lambda kv: kv[1], reverse=True)
+    names = dict(FoodListing.objects.filter(id__in=[int(f) for f, _ in ranked[:top]]).values_list('id', 'name'))
+    top_items = [
+        {'food_id': int(f), 'name': names[int(f)], 'quantity': q}
+        for f, q in ranked[:top] if int(f) in names
+    ]
+    return {
+        'total_orders': totals['orders'],
+        'total_revenue': totals['revenue'],
+        'pending_orders': sum(statuses.get(s, 0) for s in PENDING_STATUSES),
+        'completed_orders': sum(statuses.get(s, 0) for s in COMPLETED_STATUSES),
+        'cancelled_orders': sum(statuses.get(s, 0) for s in EXCLUDED_STATUSES),
+        'status_counts': statuses,
+        'popular_item': top_items[0]['name'] if top_items else '',
+        'top_items': top_items,
+        'daily': [{'date': d['day'], 'orders': d['orders'], 'revenue': d['revenue']} for d in daily],
+        'hourly': hourly,
+    }
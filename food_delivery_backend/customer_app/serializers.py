@@ -40,19 +40,19 @@ class FoodSerializer(serializers.ModelSerializer):
         model = Food
         fields = '__all__'
 
-class CartItemSerializer(serializers.ModelSerializer):
-    food_details = FoodSerializer(source='food', read_only=True)
-    
-    class Meta:
-        model = Cart
-        fields = '__all__'
-
 class FoodListingSerializer(serializers.ModelSerializer):
     """Serializer for FoodListing from auth_app"""
     class Meta:
         model = FoodListing
         fields = ('id', 'name', 'price', 'description', 'is_available', 'category', 'images')
 
+class CartItemSerializer(serializers.ModelSerializer):
+    food_details = FoodListingSerializer(source='food', read_only=True)
+    
+    class Meta:
+        model = Cart
+        fields = '__all__'
+
 class OrderItemSerializer(serializers.ModelSerializer):
     food_id = serializers.IntegerField(write_only=True)
     food = FoodListingSerializer(read_only=True)
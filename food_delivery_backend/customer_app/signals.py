@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from auth_app.models import FoodListing, Vendor
+
+from .cart import invalidate_prices
+
+
+@receiver([post_save, post_delete], sender=FoodListing)
+def invalidate_listing_price(sender, instance, **kwargs):
+    """Carts price from a cached table; a menu edit must show up in the next cart view."""
+    invalidate_prices([instance.id])
+
+
+@receiver(post_save, sender=Vendor)
+def invalidate_vendor_prices(sender, instance, **kwargs):
+    # Cached entries carry the restaurant name
+    invalidate_prices(FoodListing.objects.filter(vendor=instance).values_list('id', flat=True))
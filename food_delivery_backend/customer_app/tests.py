@@ -1,3 +1,513 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+
+from auth_app import promotions
+from auth_app.models import FoodListing, Vendor
+from auth_app.models_promo_category import Promotion
+from core_app.models import RevokedToken
+from core_app.revocation import token_id
+from delivery_auth.models import DeliveryUser
+from notification_app.models import DeviceToken
+
+from . import cart, popularity, rollups
+from .models import Cart, Customer, Order, OrderItem, StaleCart, VendorDailyStats, VendorHourlyStats
+from .views import CheckoutView, generate_customer_jwt
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'customer-app-tests'}}
+
+
+def make_customer(n):
+    return Customer.objects.create_user(phone=f"90000000{n:02d}", full_name=f"Customer {n}", email=f"c{n}@example.com")
+
+
+def make_vendor(n, **fields):
+    return Vendor.objects.create(
+        phone=f"80000000{n:02d}", restaurant_name=f"Restaurant {n}", email=f"v{n}@example.com",
+        address='Somewhere', contact_number='0', open_hours='9-5', **fields,
+    )
+
+
+def make_food(vendor, name, price, **fields):
+    return FoodListing.objects.create(vendor=vendor, name=name, price=price, description='', **fields)
+
+
+def client_for(customer):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {generate_customer_jwt(customer)['access']}")
+    return client
+
+
+@override_settings(CACHES=LOCMEM, ID_WORKER_ID=1, RATE_LIMIT_ENABLED=False)
+class CustomerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+
+class FCMTokenRegistrationTests(CustomerTestCase):
+    def test_requires_a_customer_token(self):
+        response = APIClient().post('/customer/fcm-token/update/', {'customer_id': 'C1', 'fcm_token': 'tok'}, format='json')
+        self.assertIn(response.status_code, (401, 403))
+        self.assertFalse(DeviceToken.objects.exists())
+
+    def test_registers_for_the_token_holder_not_the_body(self):
+        me, victim = make_customer(1), make_customer(2)
+        response = client_for(me).post(
+            '/customer/fcm-token/update/', {'customer_id': victim.customer_id, 'fcm_token': 'tok'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        device = DeviceToken.objects.get(token='tok')
+        self.assertEqual((device.user_type, device.user_id), ('customer', me.customer_id))
+
+
+class OrderStreamTests(CustomerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = make_customer(1)
+        self.order = Order.objects.create(customer=self.owner, vendor=make_vendor(1), total_amount=100,
+                                          delivery_address='x', status='delivered')
+        self.url = f'/customer/orders/{self.order.order_number}/stream/'
+
+    def test_requires_a_customer_token(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    def test_other_customers_cannot_follow_the_order(self):
+        self.assertEqual(client_for(make_customer(2)).get(self.url).status_code, 404)
+
+    async def test_owner_gets_the_snapshot(self):
+        response = await self.async_client.get(self.url, headers={
+            'Authorization': f"Bearer {generate_customer_jwt(self.owner)['access']}",
+        })
+        self.assertEqual(response.status_code, 200)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertIn('event: snapshot', body)
+        self.assertIn('"status": "delivered"', body)
+
+
+class BadTokenTests(CustomerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = make_customer(1)
+        expired = jwt.encode({'customer_id': self.customer.customer_id, 'token_type': 'access', 'exp': time.time() - 60},
+                             settings.SECRET_KEY, algorithm=settings.SIMPLE_JWT['ALGORITHM'])
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {expired}")
+
+    def test_public_endpoints_ignore_an_expired_token(self):
+        self.assertEqual(self.client.get('/customer/popular-foods/').status_code, 200)
+
+    def test_protected_endpoints_still_reject_it(self):
+        response = self.client.get(f'/customer/{self.customer.customer_id}/addresses/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'Token expired')
+
+
+class TokenRefreshTests(CustomerTestCase):
+    def test_refresh_token_is_exchanged_only_once(self):
+        refresh = generate_customer_jwt(make_customer(1))['refresh']
+        response = APIClient().post('/customer/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = APIClient().post('/customer/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_concurrent_refresh_that_loses_the_revocation_gets_no_tokens(self):
+        refresh = generate_customer_jwt(make_customer(1))['refresh']
+        payload = jwt.decode(refresh, settings.SECRET_KEY, algorithms=[settings.SIMPLE_JWT['ALGORITHM']])
+        RevokedToken.objects.create(jti=token_id(payload, refresh), expires_at=timezone.now() + timedelta(days=1))
+        # Another request revoked it after this one passed the revocation check
+        with mock.patch('customer_app.views.is_token_revoked', return_value=False):
+            response = APIClient().post('/customer/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('access', response.data)
+
+
+@mock.patch('customer_app.cart.get_redis', return_value=None)
+class DatabaseCartStoreTests(CustomerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = make_customer(1).customer_id
+        vendor, other = make_vendor(1), make_vendor(2)
+        self.dosa = make_food(vendor, 'Dosa', '60.00').id
+        self.idli = make_food(vendor, 'Idli', '40.00').id
+        self.burger = make_food(other, 'Burger', '120.00').id
+
+    def test_changes_are_written_straight_to_the_table(self, _):
+        self.assertEqual(cart.change(self.customer, self.dosa, 2), (cart.CHANGED, 2))
+        self.assertEqual(cart.change(self.customer, self.dosa, 1), (cart.CHANGED, 3))
+        self.assertEqual(cart.change(self.customer, self.idli, 1, cart.SET), (cart.CHANGED, 1))
+        self.assertEqual(dict(Cart.objects.values_list('food_id', 'quantity')), {self.dosa: 3, self.idli: 1})
+        self.assertEqual(cart.remove(self.customer, self.idli), (cart.CHANGED, 0))
+        self.assertEqual(cart.get_cart(self.customer)['items'], {self.dosa: 3})
+        self.assertEqual(cart.flush(), 0)  # Nothing is held back
+
+    def test_one_restaurant_per_cart(self, _):
+        cart.change(self.customer, self.dosa, 1)
+        outcome, vendor_pk = cart.change(self.customer, self.burger, 1)
+        self.assertEqual(outcome, cart.OTHER_VENDOR)
+        self.assertEqual(vendor_pk, FoodListing.objects.get(id=self.dosa).vendor_id)
+        self.assertEqual(cart.replace_lines(self.customer, {self.burger: 1}, cart.MERGE)[0], cart.OTHER_VENDOR)
+        self.assertEqual(cart.replace_lines(self.customer, {self.burger: 2}), (cart.CHANGED, 1))
+        self.assertEqual(cart.get_cart(self.customer)['items'], {self.burger: 2})
+
+    def test_merge_adds_to_existing_lines(self, _):
+        cart.change(self.customer, self.dosa, 1)
+        self.assertEqual(cart.replace_lines(self.customer, {self.dosa: 2, self.idli: 1}, cart.MERGE), (cart.CHANGED, 2))
+        self.assertEqual(cart.get_cart(self.customer)['items'], {self.dosa: 3, self.idli: 1})
+
+    def test_summary_prices_the_lines(self, _):
+        cart.change(self.customer, self.dosa, 2)
+        cart.change(self.customer, self.idli, 1)
+        summary = cart.summary(self.customer)
+        self.assertEqual(summary['item_count'], 2)
+        self.assertEqual(summary['total_amount'], Decimal('160.00'))
+        cart.clear(self.customer)
+        self.assertEqual(cart.summary(self.customer)['item_count'], 0)
+
+
+@mock.patch('customer_app.cart.get_redis', return_value=None)
+class BulkCartTests(CustomerTestCase):
+    def setUp(self):
+        super().setUp()
+        promotions.invalidate()
+        self.customer = make_customer(1)
+        self.vendor = make_vendor(1)
+        self.menu = [make_food(self.vendor, f"Dish {i}", f"{10 * (i + 1)}.00") for i in range(12)]
+
+    def bulk(self, customer, lines, mode=cart.REPLACE):
+        items = [{'food_id': food.id, 'quantity': quantity} for food, quantity in lines]
+        return APIClient().post('/customer/cart/bulk/', {'customer_id': customer.customer_id, 'mode': mode, 'items': items}, format='json')
+
+    def reorder(self, order, mode=cart.REPLACE):
+        url = f'/customer/orders/{order.order_number}/reorder/'
+        return APIClient().post(url, {'customer_id': order.customer_id, 'mode': mode}, format='json')
+
+    def past_order(self, customer, lines):
+        order = Order.objects.create(customer=customer, vendor=self.vendor, total_amount=0, delivery_address='x')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, food=food, quantity=quantity, price=Decimal(food.price)) for food, quantity in lines
+        ])
+        return order
+
+    def items(self, customer):
+        return cart.get_cart(customer.customer_id)['items']
+
+    def test_merge_adds_to_the_existing_cart(self, _):
+        dosa, idli = self.menu[:2]
+        self.assertEqual(self.bulk(self.customer, [(dosa, 1)]).status_code, 200)
+        response = self.bulk(self.customer, [(dosa, 2), (idli, 1), (idli, 2)], mode=cart.MERGE)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.items(self.customer), {dosa.id: 3, idli.id: 3})
+        self.assertEqual(response.data['item_count'], 2)
+
+    def test_replace_drops_lines_not_sent(self, _):
+        dosa, idli = self.menu[:2]
+        self.bulk(self.customer, [(dosa, 1)])
+        self.assertEqual(self.bulk(self.customer, [(idli, 4)]).status_code, 200)
+        self.assertEqual(self.items(self.customer), {idli.id: 4})
+
+    def test_reorder_reports_unavailable_and_repriced_items(self, _):
+        dosa, idli, vada = self.menu[:3]
+        order = self.past_order(self.customer, [(dosa, 2), (idli, 1), (vada, 1)])
+        FoodListing.objects.filter(pk=idli.pk).update(is_available=False)
+        FoodListing.objects.filter(pk=vada.pk).update(price='99.00')
+        cart.invalidate_prices([idli.id, vada.id])
+
+        response = self.reorder(order)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.items(self.customer), {dosa.id: 2, vada.id: 1})
+        self.assertEqual(response.data['unavailable'], [{'food_id': idli.id, 'name': idli.name, 'quantity': 1}])
+        self.assertEqual(response.data['repriced'], [
+            {'food_id': vada.id, 'name': vada.name, 'old_price': '30.00', 'new_price': '99.00'},
+        ])
+
+    def test_reorder_with_nothing_available_is_a_conflict(self, _):
+        dosa = self.menu[0]
+        order = self.past_order(self.customer, [(dosa, 1)])
+        FoodListing.objects.filter(pk=dosa.pk).update(is_available=False)
+        cart.invalidate_prices([dosa.id])
+        response = self.reorder(order)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['unavailable'], [{'food_id': dosa.id, 'name': dosa.name, 'quantity': 1}])
+        self.assertEqual(self.items(self.customer), {})
+
+    def test_reorder_merges_quantities_into_the_cart(self, _):
+        dosa, idli = self.menu[:2]
+        self.bulk(self.customer, [(dosa, 1)])
+        order = self.past_order(self.customer, [(dosa, 2), (idli, 1)])
+        self.assertEqual(self.reorder(order, mode=cart.MERGE).status_code, 200)
+        self.assertEqual(self.items(self.customer), {dosa.id: 3, idli.id: 1})
+
+    def assertQueriesIndependentOfLines(self, prepare):
+        """
+        prepare(customer, lines) sets up and returns the request to measure; it
+        is run for 2 and then 12 lines, for a new customer with a cold price cache.
+        """
+        small = prepare(make_customer(2), [(food, 1) for food in self.menu[:2]])
+        large = prepare(make_customer(3), [(food, 1) for food in self.menu])
+        promotions.active_promotions(self.vendor.id)  # Build the in-process index outside the measurement
+        cart.invalidate_prices([food.id for food in self.menu])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(small().status_code, 200)
+        cart.invalidate_prices([food.id for food in self.menu])
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(large().status_code, 200)
+
+    def test_bulk_query_count_does_not_grow_with_lines(self, _):
+        self.assertQueriesIndependentOfLines(lambda customer, lines: lambda: self.bulk(customer, lines))
+
+    def test_reorder_query_count_does_not_grow_with_lines(self, _):
+        def prepare(customer, lines):
+            order = self.past_order(customer, lines)
+            return lambda: self.reorder(order)
+
+        self.assertQueriesIndependentOfLines(prepare)
+
+
+@mock.patch('customer_app.cart.get_redis', return_value=None)
+class CheckoutTests(CustomerTestCase):
+    def setUp(self):
+        super().setUp()
+        promotions.invalidate()
+        self.customer = make_customer(1).customer_id
+        self.vendor = make_vendor(1)
+        self.dosa = make_food(self.vendor, 'Dosa', '60.00')
+
+    def checkout(self):
+        request = APIRequestFactory().post('/customer/checkout/', {
+            'customer_id': self.customer, 'delivery_address': 'Somewhere',
+        }, format='json')
+        return CheckoutView.as_view()(request)
+
+    def test_checkout_creates_the_order_and_empties_the_cart(self, _):
+        cart.change(self.customer, self.dosa.id, 2)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201, response.data)
+        order = Order.objects.get()
+        self.assertEqual((order.vendor_id, order.total_amount), (self.vendor.id, Decimal('120.00')))
+        self.assertEqual(list(OrderItem.objects.values_list('food_id', 'quantity')), [(self.dosa.id, 2)])
+        self.assertEqual(VendorDailyStats.objects.get(vendor=self.vendor).orders, 1)
+        self.assertEqual(cart.get_cart(self.customer)['items'], {})
+
+    def test_failure_after_the_order_is_created_writes_nothing(self, _):
+        cart.change(self.customer, self.dosa.id, 2)
+        with mock.patch('customer_app.cart.DatabaseCartStore.clear', side_effect=RuntimeError('cart store down')):
+            response = self.checkout()
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(VendorDailyStats.objects.exists())
+        self.assertEqual(cart.get_cart(self.customer)['items'], {self.dosa.id: 2})
+
+
+class CartFailbackTests(CustomerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = make_customer(1).customer_id
+        self.dosa = make_food(make_vendor(1), 'Dosa', '60.00').id
+        self.redis_store = mock.Mock(spec=cart.RedisCartStore)
+        self.redis_store.pop_dirty.return_value = []
+
+    def change_without_redis(self):
+        with mock.patch('customer_app.cart.get_redis', return_value=None):
+            cart.change(self.customer, self.dosa, 2)
+
+    def test_changes_without_redis_mark_the_cart_stale(self):
+        self.change_without_redis()
+        self.assertEqual(list(StaleCart.objects.values_list('customer_id', flat=True)), [self.customer])
+        with mock.patch('customer_app.cart.get_redis', return_value=None):
+            self.assertEqual(cart.flush(), 0)
+        self.assertEqual(StaleCart.objects.count(), 1)  # Kept until Redis is back
+
+    def test_failback_drops_the_redis_copy_once(self):
+        self.change_without_redis()
+        self.assertEqual(cart.reconcile(self.redis_store), 1)
+        self.redis_store.discard.assert_called_once_with([self.customer])
+        self.assertFalse(StaleCart.objects.exists())
+        self.assertEqual(cart.reconcile(self.redis_store), 0)
+        self.assertEqual(dict(Cart.objects.values_list('food_id', 'quantity')), {self.dosa: 2})
+
+    def test_flush_reconciles_before_taking_dirty_carts(self):
+        self.change_without_redis()
+        with mock.patch('customer_app.cart.get_store', return_value=self.redis_store):
+            cart.flush()
+        self.assertEqual([call[0] for call in self.redis_store.method_calls], ['discard', 'pop_dirty'])
+
+    def test_cart_marked_again_during_reconcile_stays_marked(self):
+        self.change_without_redis()
+
+        def marked_again(customer_ids):
+            StaleCart.objects.filter(customer_id__in=customer_ids).update(marked_at=timezone.now() + timedelta(seconds=1))
+
+        self.redis_store.discard.side_effect = marked_again
+        cart.reconcile(self.redis_store)
+        self.assertTrue(StaleCart.objects.filter(customer_id=self.customer).exists())
+
+
+class PlaceOrderTotalTests(CustomerTestCase):
+    def setUp(self):
+        super().setUp()
+        promotions.invalidate()
+        self.customer = make_customer(1)
+        self.vendor = make_vendor(1)
+        self.dosa = make_food(self.vendor, 'Dosa', '100.00')
+
+    def place(self, **details):
+        body = {
+            'payment_method': 'cod',
+            'order_details': {
+                'customer_id': self.customer.customer_id,
+                'vendor_id': self.vendor.vendor_id,
+                'address': 'Somewhere 560001',
+                'delivery_fee': 20,
+                'items': [{'food_id': self.dosa.id, 'quantity': 2, 'price': 1.0}],
+                **details,
+            },
+        }
+        return APIClient().post('/customer/place-order/', body, format='json')
+
+    def test_total_is_computed_from_menu_prices(self):
+        response = self.place()
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['items_total'], response.data['total_amount']), (200.0, 220.0))
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, Decimal('220.00'))
+        self.assertEqual(list(OrderItem.objects.values_list('price', flat=True)), [Decimal('100.00')])
+
+    def test_matching_client_total_is_accepted(self):
+        self.assertEqual(self.place(total_price='220.0').status_code, 201)
+
+    def test_mismatched_client_total_is_rejected(self):
+        for total_price in (1, '219.99', 'free'):
+            response = self.place(total_price=total_price)
+            self.assertEqual(response.status_code, 400, total_price)
+            self.assertEqual(response.data['total_amount'], 220.0)
+        self.assertFalse(Order.objects.exists())
+
+    def test_promotions_are_taken_off_the_server_total(self):
+        Promotion.objects.create(vendor=self.vendor, title='10% off', discount_value=10)
+        promotions.invalidate()
+        self.assertEqual(self.place(total_price=220).status_code, 400)
+        response = self.place(total_price=200)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Order.objects.get().discount_amount, Decimal('20.00'))
+
+
+class RollupRebuildTests(CustomerTestCase):
+    def place(self, customer, vendor, lines, status='pending'):
+        order = Order.objects.create(customer=customer, vendor=vendor, delivery_address='x', status=status,
+                                     total_amount=sum(Decimal(food.price) * quantity for food, quantity in lines))
+        for food, quantity in lines:
+            OrderItem.objects.create(order=order, food=food, quantity=quantity, price=food.price)
+        rollups.record_order(order, [(food.id, quantity) for food, quantity in lines])
+        return order
+
+    def move(self, order, status):
+        rollups.record_status_change(order, order.status, status)
+        Order.objects.filter(pk=order.pk).update(status=status)
+        order.status = status
+
+    def rows(self):
+        fields = ('vendor_id', 'orders', 'revenue', 'status_counts', 'item_quantities')
+        return (
+            sorted(VendorDailyStats.objects.values_list('day', *fields)),
+            sorted(VendorHourlyStats.objects.values_list('hour', *fields)),
+        )
+
+    def test_rebuild_matches_the_incremental_rows(self):
+        customer = make_customer(1)
+        vendor, other = make_vendor(1), make_vendor(2)
+        dosa, idli = make_food(vendor, 'Dosa', '60.00'), make_food(vendor, 'Idli', '40.00')
+        burger = make_food(other, 'Burger', '120.00')
+        first = self.place(customer, vendor, [(dosa, 2), (idli, 1)])
+        second = self.place(customer, vendor, [(dosa, 1)], status='Pending')
+        self.place(customer, other, [(burger, 3)])
+        self.move(first, 'delivered')
+        self.move(second, 'cancelled')
+        self.move(second, 'pending')  # Uncancelled
+        self.place(customer, vendor, [(idli, 4)], status='cancelled')
+
+        incremental = self.rows()
+        self.assertEqual(rollups.rebuild(), {'VendorDailyStats': 2, 'VendorHourlyStats': 2})
+        self.assertEqual(self.rows(), incremental)
+        daily = VendorDailyStats.objects.get(vendor=vendor)
+        self.assertEqual((daily.orders, daily.revenue), (3, Decimal('220.00')))
+        self.assertEqual(daily.status_counts, {'delivered': 1, 'pending': 1, 'cancelled': 1})
+        self.assertEqual(daily.item_quantities, {str(dosa.id): 3, str(idli.id): 1})
+
+
+class PopularityFlushTests(CustomerTestCase):
+    def setUp(self):
+        super().setUp()
+        popularity.flush()
+        popularity._pending.clear()
+
+    def test_orders_reach_the_shared_summary_only_on_flush(self):
+        popularity.record([popularity.ALL], [(7, 2), (9, 1)])
+        self.assertEqual(popularity.popular(popularity.ALL), [])
+        self.assertEqual(popularity.flush(), [])
+        self.assertEqual([food_id for food_id, _ in popularity.popular(popularity.ALL)], [7, 9])
+
+    def test_busy_summary_stays_pending_without_waiting(self):
+        popularity.record([popularity.ALL], [(7, 2)])
+        cache.add(popularity.LOCK_KEY.format(popularity.ALL), 1)
+        started = time.monotonic()
+        self.assertEqual(popularity.flush(), [popularity.ALL])
+        self.assertLess(time.monotonic() - started, 0.05)  # No lock retries with sleeps
+        popularity.record([popularity.ALL], [(9, 5)])
+        cache.delete(popularity.LOCK_KEY.format(popularity.ALL))
+        self.assertEqual(popularity.flush(), [])
+        self.assertEqual([food_id for food_id, _ in popularity.popular(popularity.ALL)], [9, 7])
+
+
+class BackfillOrderRiderTests(CustomerTestCase):
+    migration = import_module('customer_app.migrations.0009_backfill_order_rider')
+
+    def test_only_orders_naming_an_existing_rider_are_linked(self):
+        customer, vendor = make_customer(1), make_vendor(1)
+        rider = DeliveryUser.objects.create(phone_number='7000000001', name='Rider')
+        gone = DeliveryUser.objects.create(phone_number='7000000002', name='Gone')
+        gone_id = gone.id
+        gone.delete()
+        partners = {
+            'valid': {'id': str(rider.id), 'name': rider.name},
+            'missing': {'name': 'No id'},
+            'non_numeric': {'id': 'rider-seven'},
+            'numeric': {'id': 42},
+            'deleted': {'id': str(gone_id)},
+            'not_a_dict': ['unexpected'],
+        }
+        orders = {
+            label: Order.objects.create(customer=customer, vendor=vendor, total_amount=100,
+                                        delivery_address='x', delivery_partner=partner)
+            for label, partner in partners.items()
+        }
+
+        self.migration.backfill_order_rider(apps, None)
+
+        riders = {label: Order.objects.get(pk=order.pk).rider_id for label, order in orders.items()}
+        self.assertEqual(riders, {
+            'valid': rider.id, 'missing': None, 'non_numeric': None,
+            'numeric': None, 'deleted': None, 'not_a_dict': None,
+        })
+
+    def test_orders_that_already_have_a_rider_are_left_alone(self):
+        first = DeliveryUser.objects.create(phone_number='7000000001', name='First')
+        second = DeliveryUser.objects.create(phone_number='7000000002', name='Second')
+        order = Order.objects.create(customer=make_customer(1), vendor=make_vendor(1), total_amount=100,
+                                     delivery_address='x', rider=first,
+                                     delivery_partner={'id': str(second.id)})
+        self.migration.backfill_order_rider(apps, None)
+        order.refresh_from_db()
+        self.assertEqual(order.rider_id, first.id)
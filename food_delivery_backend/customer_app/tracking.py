@@ -0,0 +1,59 @@
+"""
+Live order tracking updates.
+
+Status views and the live-location store publish to a per-order channel;
+the SSE endpoint (orders/<order_number>/stream/) relays them to customers,
+replacing repeated polling of the status and track endpoints.
+"""
+import json
+import time
+
+from django.conf import settings
+
+from core_app.pubsub import Subscription, publish
+
+TERMINAL_STATUSES = {'delivered', 'cancelled', 'fulfilled'}
+
+
+def order_channel(order_number):
+    return f"order:{order_number}"
+
+
+def publish_status(order_number, status):
+    publish(order_channel(order_number), {'type': 'status', 'status': status})
+
+
+def publish_location(order_number, lat, lng, ts):
+    publish(order_channel(order_number), {'type': 'location', 'lat': lat, 'lng': lng, 'ts': ts})
+
+
+def _event(kind, data):
+    return f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+async def order_event_stream(order_number, load_snapshot):
+    """
+    Server-sent events for one order: an initial snapshot, then status and
+    location events as they are published. The snapshot comes from the
+    async load_snapshot() once the channel is subscribed, so no update
+    between the two is missed. Sends a keep-alive comment when
+    idle and ends on a terminal status or after SSE_MAX_STREAM_SECONDS
+    (clients reconnect automatically).
+    """
+    keepalive = getattr(settings, 'SSE_KEEPALIVE_SECONDS', 15)
+    deadline = time.monotonic() + getattr(settings, 'SSE_MAX_STREAM_SECONDS', 1800)
+    async with Subscription(order_channel(order_number)) as subscription:
+        snapshot = await load_snapshot()
+        yield f"retry: 3000\n{_event('snapshot', snapshot)}"
+        if str(snapshot.get('status', '')).lower() in TERMINAL_STATUSES:
+            return
+        while time.monotonic() < deadline:
+            message = await subscription.get(timeout=keepalive)
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+            message = dict(message)  # Shared with other subscribers in this process
+            kind = message.pop('type', 'message')
+            yield _event(kind, message)
+            if kind == 'status' and str(message.get('status', '')).lower() in TERMINAL_STATUSES:
+                return
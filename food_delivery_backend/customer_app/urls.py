@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import *
 from .views import CustomerOrderStatusView, CustomerOrderTrackingView, UpdateFCMTokenView, TestNotificationView
+from core_app.views import TokenLogoutView
 # from .views import CheckDeliveryView
 
 # from .views import (
@@ -15,6 +16,7 @@ from .views import CustomerTokenRefreshView
 
 urlpatterns = [
     path('token/refresh/', CustomerTokenRefreshView.as_view(), name='customer-token-refresh'),
+    path('logout/', TokenLogoutView.as_view(), name='customer-logout'),
     path('fcm-token/update/', UpdateFCMTokenView.as_view(), name='customer-fcm-token-update'),
     path('testnotify/', TestNotificationView.as_view(), name='customer-test-notification'),
     path('reverse-geocode/', ReverseGeocodeView.as_view(), name='reverse-geocode'),
@@ -27,12 +29,15 @@ urlpatterns = [
     # path('search-suggestions/', SearchSuggestionsView.as_view(), name='search-suggestions'),
     path('cart/', CartView.as_view()),
     path('cart/<int:item_id>/', CartView.as_view()),
+    path('cart/bulk/', CartBulkView.as_view(), name='cart-bulk'),
     path('my-orders/', OrderView.as_view()),
     # path('restaurants/<str:vendor_id>/', RestaurantDetailView.as_view(), name='restaurant-detail'),
     # path('restaurants/<str:vendor_id>/foods/<int:food_id>/', FoodDetailView.as_view(), name='food-detail'),
     path('orders/<str:order_number>/', OrderDetailView.as_view()),
+    path('orders/<str:order_number>/reorder/', ReorderView.as_view(), name='customer-reorder'),
     path('orders/<str:order_number>/status/', CustomerOrderStatusView.as_view()),
     path('orders/<str:order_number>/track/', CustomerOrderTrackingView.as_view()),
+    path('orders/<str:order_number>/stream/', CustomerOrderStreamView.as_view(), name='customer-order-stream'),
     # path('payment/create/', CreatePaymentView.as_view()),
     # # path('payment/verify/', VerifyPaymentView.as_view()),
     path('check-delivery/', CheckDeliveryView.as_view(), name='check-delivery'),
@@ -5,7 +5,9 @@ from rest_framework import status
 from .models import *
 from .serializers import *
 from .utils import OTPManager
+from core_app.otp import OTPUnavailable
 from django.db.models import Q
+from decimal import Decimal, InvalidOperation
 from math import radians, cos, sin, asin, sqrt
 import logging
 import random
@@ -20,37 +22,30 @@ from django.db import IntegrityError
 from rest_framework.permissions import IsAuthenticated, AllowAny
 import jwt
 from django.db import transaction
+from core_app.ids import new_customer_id
+from notification_app.outbox import enqueue_push
 import jwt
 from datetime import datetime, timedelta
 from django.conf import settings
 
 # --- FCM Notification Utility ---
-try:
-    from firebase_admin import messaging
-except ImportError:
-    messaging = None
-
-def send_notification_to_device(token, title, body):
-    if not messaging:
-        print("firebase_admin.messaging is not available.")
-        return False
-    try:
-        message = messaging.Message(
-            notification=messaging.Notification(
-                title=title,
-                body=body,
-            ),
-            token=token,
-        )
-        response = messaging.send(message)
-        print(f"FCM notification sent: {response}")
-        return True
-    except Exception as e:
-        print(f"Failed to send FCM notification: {e}")
-        return False
+from notification_app.dispatch import send_notification_to_device
+from notification_app.registry import register_token
+from delivery_auth.live_location import get_order_location
+from .tracking import order_event_stream
+from .authentication import CustomerJWTAuthentication
+from . import cart as cart_service
+from . import popularity, rollups
+from auth_app import promotions
+from core_app.revocation import is_token_revoked, revoke
+from .permissions import IsAuthenticatedCustomer
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
 
 # --- Custom JWT Refresh for Customer ---
 class CustomerTokenRefreshView(APIView):
+    authentication_classes = []  # Issues tokens; a stale Authorization header must not block it
     permission_classes = [AllowAny]
     def post(self, request):
         refresh_token = request.data.get('refresh')
@@ -69,6 +64,9 @@ class CustomerTokenRefreshView(APIView):
             if token_type != 'refresh':
                 print('[REFRESH] Token type is not refresh:', token_type)
                 return Response({'error': 'Invalid refresh token type'}, status=status.HTTP_401_UNAUTHORIZED)
+            if is_token_revoked(payload, refresh_token):
+                print('[REFRESH] Token has been revoked')
+                return Response({'error': 'Refresh token revoked'}, status=status.HTTP_401_UNAUTHORIZED)
             # Validate customer
             from .models import Customer
             try:
@@ -76,24 +74,15 @@ class CustomerTokenRefreshView(APIView):
             except Customer.DoesNotExist:
                 print('[REFRESH] Customer not found:', customer_id)
                 return Response({'error': 'Customer not found'}, status=status.HTTP_401_UNAUTHORIZED)
-            # Issue new access token (2 hours expiry)
-            access_payload = {
-                'customer_id': customer.customer_id,
-                'exp': datetime.utcnow() + timedelta(hours=2),
-                'iat': datetime.utcnow(),
-                'token_type': 'access',
-            }
-            access_token = jwt.encode(access_payload, settings.SECRET_KEY, algorithm='HS256')
-            # Issue new refresh token (30 days expiry, rotation)
-            refresh_payload = {
-                'customer_id': customer.customer_id,
-                'exp': datetime.utcnow() + timedelta(days=30),
-                'iat': datetime.utcnow(),
-                'token_type': 'refresh',
-            }
-            refresh_token_new = jwt.encode(refresh_payload, settings.SECRET_KEY, algorithm='HS256')
+            # Revoke the old refresh token first; only the request that revokes it gets new tokens
+            _, created = revoke(payload, refresh_token)
+            if not created:
+                print('[REFRESH] Token was used concurrently')
+                return Response({'error': 'Refresh token revoked'}, status=status.HTTP_401_UNAUTHORIZED)
+            # Issue new access (2 hours) and refresh (30 days) tokens
+            tokens = generate_customer_jwt(customer)
             print('[REFRESH] Issued new tokens for customer:', customer_id)
-            return Response({'access': access_token, 'refresh': refresh_token_new}, status=status.HTTP_200_OK)
+            return Response({'access': tokens['access'], 'refresh': tokens['refresh']}, status=status.HTTP_200_OK)
         except jwt.ExpiredSignatureError:
             print('[REFRESH] Token expired')
             return Response({'error': 'Refresh token expired'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -121,6 +110,7 @@ logger = logging.getLogger(__name__)
 # --- Helper function to get tokens ---
 def generate_customer_jwt(customer):
     import jwt
+    import uuid
     from datetime import datetime, timedelta
     from django.conf import settings
     now = datetime.utcnow()
@@ -128,12 +118,14 @@ def generate_customer_jwt(customer):
         'customer_id': customer.customer_id,
         'exp': now + timedelta(hours=2),
         'iat': now,
+        'jti': uuid.uuid4().hex, # Revocation key (core_app.revocation)
         'token_type': 'access',
     }
     refresh_payload = {
         'customer_id': customer.customer_id,
         'exp': now + timedelta(days=30),
         'iat': now,
+        'jti': uuid.uuid4().hex,
         'token_type': 'refresh',
     }
     access_token = jwt.encode(access_payload, settings.SECRET_KEY, algorithm='HS256')
@@ -142,6 +134,8 @@ def generate_customer_jwt(customer):
 
 
 class SendOTP(APIView):
+    authentication_classes = []  # Issues tokens; a stale Authorization header must not block it
+
     def post(self, request):
         try:
             phone = request.data.get('phone')
@@ -171,6 +165,8 @@ class SendOTP(APIView):
                 status=status.HTTP_200_OK
             )
             
+        except OTPUnavailable as e:
+            return Response({'error': str(e.detail)}, status=e.status_code)
         except Exception as e:
             logger.error(f"Error in SendOTP: {str(e)}")
             return Response(
@@ -179,6 +175,8 @@ class SendOTP(APIView):
             )
 
 class VerifyOTP(APIView):
+    authentication_classes = []  # Issues tokens; a stale Authorization header must not block it
+
     def post(self, request):
         try:
             phone = request.data.get('phone')
@@ -221,6 +219,8 @@ class VerifyOTP(APIView):
                     'is_signup': True,
                 }, status=status.HTTP_200_OK)
                 
+        except OTPUnavailable as e:
+            return Response({'error': str(e.detail)}, status=e.status_code)
         except Exception as e:
             logger.error(f"Error in VerifyOTP: {str(e)}")
             traceback.print_exc()
@@ -230,6 +230,8 @@ class VerifyOTP(APIView):
             )
 
 class CustomerSignup(APIView):
+    authentication_classes = []  # Issues tokens; a stale Authorization header must not block it
+
     def post(self, request):
         print(request.data)
         try:
@@ -251,11 +253,8 @@ class CustomerSignup(APIView):
                  return Response({'error': 'An account with this email address already exists.'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-            # Generate customer ID (ensure uniqueness if needed, maybe check DB)
-            while True:
-                customer_id = f"C{random.randint(10000, 99999)}" # Increased range slightly
-                if not Customer.objects.filter(customer_id=customer_id).exists():
-                    break
+            # Generate customer ID (time-ordered, unique without a DB check)
+            customer_id = new_customer_id()
 
             customer = Customer.objects.create(
                 customer_id=customer_id,
@@ -492,185 +491,111 @@ class SearchView_test(APIView):
         }
         return Response(data, status=status.HTTP_200_OK)
 
+def _multi_vendor_response(customer_id, current_vendor_pk, food_id):
+    """The cart holds items from a different restaurant than food_id's."""
+    table = cart_service.price_table(set(cart_service.get_cart(customer_id)['items']) | {food_id})
+    current = next((e for e in table.values() if e['vendor_pk'] == current_vendor_pk), None)
+    new = table[food_id]
+    return Response(
+        {
+            'error': 'MULTI_VENDOR_ERROR',
+            'message': 'Orders from multiple restaurants are not allowed. Please clear your cart or complete your existing order before ordering from another restaurant.',
+            'current_vendor': {
+                'id': current_vendor_pk,
+                'name': current['vendor_name'] if current else None
+            },
+            'new_vendor': {
+                'id': new['vendor_pk'],
+                'name': new['vendor_name']
+            }
+        }, 
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def _add_to_cart(customer_id, food_id, quantity):
+    """Shared by CartView.post and CartAddView: add a listing to the customer's cart."""
+    try:
+        outcome, value = cart_service.change(customer_id, food_id, quantity)
+    except LookupError:
+        return Response(
+            {'error': 'Food item not found'}, 
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if outcome == cart_service.OTHER_VENDOR:
+        return _multi_vendor_response(customer_id, value, int(food_id))
+    lines, _ = cart_service.line_items({'vendor': None, 'items': {int(food_id): value}})
+    created = value == quantity
+    return Response(
+        {
+            'message': 'Item added to cart successfully' if created else 'Item quantity updated in cart',
+            'cart_item': lines[0] if lines else None
+        }, 
+        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+    )
+
+
+def _cart_request(data):
+    """(customer_id, food_id, quantity, error response) from a cart request body."""
+    customer_id = data.get('customer_id')
+    food_id = data.get('food_id')
+    if not all([customer_id, food_id]):
+        return None, None, None, Response(
+            {'error': 'Customer ID and Food ID are required'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        food_id = int(food_id)
+        quantity = int(data.get('quantity', 1))
+    except (TypeError, ValueError):
+        return None, None, None, Response({'error': 'Invalid food ID or quantity'}, status=status.HTTP_400_BAD_REQUEST)
+    if quantity < 1:
+        return None, None, None, Response({'error': 'Quantity must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+    return customer_id, food_id, quantity, None
+
+
 class CartView(APIView):
+    """
+    The customer's cart (customer_app/cart.py): held in Redis, priced from the
+    cached price table and written to the Cart table in the background.
+    Items are identified by their food listing id.
+    """
     def get(self, request):
         try:
             customer_id = request.query_params.get('customer_id')
             if not customer_id:
                 return Response({'error': 'Customer ID is required'}, status=status.HTTP_400_BAD_REQUEST)
-                
-            cart_items = Cart.objects.filter(customer_id=customer_id)
-            serializer = CartItemSerializer(cart_items, many=True)
-            
-            # Calculate total amount
-            total_amount = sum(item.food.price * item.quantity for item in cart_items)
-            
-            response_data = {
-                'items': serializer.data,
-                'total_amount': total_amount,
-                'item_count': cart_items.count()
-            }
-            
-            return Response(response_data, status=status.HTTP_200_OK)
+            return Response(cart_service.summary(customer_id), status=status.HTTP_200_OK)
         except Exception as e:
             logger.error(f"Error in CartView.get: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def post(self, request):
         try:
-            customer_id = request.data.get('customer_id')
-            food_id = request.data.get('food_id')
-            quantity = int(request.data.get('quantity', 1))
-            
-            if not all([customer_id, food_id]):
-                return Response(
-                    {'error': 'Customer ID and Food ID are required'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Validate food exists
-            try:
-                food = Food.objects.get(id=food_id)
-            except Food.DoesNotExist:
-                return Response(
-                    {'error': 'Food item not found'}, 
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
-            # Check if there are existing items in the cart from a different restaurant
-            existing_cart_items = Cart.objects.filter(customer_id=customer_id)
-            if existing_cart_items.exists():
-                # Get the vendor of the existing cart items
-                existing_vendor = existing_cart_items.first().food.vendor
-                
-                # Check if the new food item is from a different vendor
-                if food.vendor.id != existing_vendor.id:
-                    return Response(
-                        {
-                            'error': 'MULTI_VENDOR_ERROR',
-                            'message': 'Orders from multiple restaurants are not allowed. Please clear your cart or complete your existing order before ordering from another restaurant.',
-                            'current_vendor': {
-                                'id': existing_vendor.id,
-                                'name': existing_vendor.restaurant_name
-                            },
-                            'new_vendor': {
-                                'id': food.vendor.id,
-                                'name': food.vendor.restaurant_name
-                            }
-                        }, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            # Check if item already exists in cart
-            try:
-                existing_item = Cart.objects.get(customer_id=customer_id, food_id=food_id)
-                # Update quantity
-                existing_item.quantity += quantity
-                existing_item.save()
-                serializer = CartItemSerializer(existing_item)
-                return Response(
-                    {
-                        'message': 'Item quantity updated in cart',
-                        'cart_item': serializer.data
-                    }, 
-                    status=status.HTTP_200_OK
-                )
-            except Cart.DoesNotExist:
-                # Create new cart item
-                cart_item = Cart.objects.create(
-                    customer_id=customer_id,
-                    food_id=food_id,
-                    quantity=quantity
-                )
-                serializer = CartItemSerializer(cart_item)
-                return Response(
-                    {
-                        'message': 'Item added to cart successfully',
-                        'cart_item': serializer.data
-                    }, 
-                    status=status.HTTP_201_CREATED
-                )
+            customer_id, food_id, quantity, error = _cart_request(request.data)
+            if error:
+                return error
+            return _add_to_cart(customer_id, food_id, quantity)
         except Exception as e:
             logger.error(f"Error in CartView.post: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def delete(self, request, item_id):
-        try:
-            item = Cart.objects.get(id=item_id)
-            item.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except Cart.DoesNotExist:
+        customer_id = request.query_params.get('customer_id') or request.data.get('customer_id')
+        if not customer_id:
+            return Response({'error': 'Customer ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if item_id not in cart_service.get_cart(customer_id)['items']:
             return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+        cart_service.remove(customer_id, item_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 class CartAddView(APIView):
     def post(self, request):
         try:
-            customer_id = request.data.get('customer_id')
-            food_id = request.data.get('food_id')
-            quantity = int(request.data.get('quantity', 1))
-            
-            if not all([customer_id, food_id]):
-                return Response(
-                    {'error': 'Customer ID and Food ID are required'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Validate food exists
-            try:
-                food = Food.objects.get(id=food_id)
-            except Food.DoesNotExist:
-                return Response(
-                    {'error': 'Food item not found'}, 
-                    status=status.HTTP_404_NOT_FOUND
-                )
-            
-            # Check if there are existing items in the cart from a different restaurant
-            existing_cart_items = Cart.objects.filter(customer_id=customer_id)
-            if existing_cart_items.exists():
-                # Get the vendor of the existing cart items
-                existing_vendor = existing_cart_items.first().food.vendor
-                
-                # Check if the new food item is from a different vendor
-                if food.vendor.id != existing_vendor.id:
-                    return Response(
-                        {
-                            'error': 'MULTI_VENDOR_ERROR',
-                            'message': 'Orders from multiple restaurants are not allowed. Please clear your cart or complete your existing order before ordering from another restaurant.',
-                            'current_vendor': {
-                                'id': existing_vendor.id,
-                                'name': existing_vendor.restaurant_name
-                            },
-                            'new_vendor': {
-                                'id': food.vendor.id,
-                                'name': food.vendor.restaurant_name
-                            }
-                        }, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            # Check if item already exists in cart
-            try:
-                cart_item = Cart.objects.get(customer_id=customer_id, food_id=food_id)
-                # Update quantity
-                cart_item.quantity += quantity
-                cart_item.save()
-            except Cart.DoesNotExist:
-                # Create new cart item
-                cart_item = Cart.objects.create(
-                    customer_id=customer_id,
-                    food_id=food_id,
-                    quantity=quantity
-                )
-            
-            serializer = CartItemSerializer(cart_item)
-            return Response(
-                {
-                    'message': 'Item added to cart successfully',
-                    'cart_item': serializer.data
-                }, 
-                status=status.HTTP_200_OK
-            )
-            
+            customer_id, food_id, quantity, error = _cart_request(request.data)
+            if error:
+                return error
+            return _add_to_cart(customer_id, food_id, quantity)
         except Exception as e:
             logger.error(f"Error in CartAddView: {str(e)}")
             traceback.print_exc()
@@ -679,6 +604,86 @@ class CartAddView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class CartBulkView(APIView):
+    """
+    Set many cart lines in one request, atomically:
+        {"customer_id": ..., "mode": "replace" | "merge",
+         "items": [{"food_id": ..., "quantity": ...}, ...]}
+    "replace" (the default) makes the items the whole cart, "merge" adds
+    them to it. Responds with the priced cart.
+    """
+    def post(self, request):
+        try:
+            customer_id = request.data.get('customer_id')
+            mode = request.data.get('mode', cart_service.REPLACE)
+            raw_items = request.data.get('items')
+            if not customer_id or not isinstance(raw_items, list):
+                return Response({'error': 'Customer ID and a list of items are required'}, status=status.HTTP_400_BAD_REQUEST)
+            if mode not in (cart_service.REPLACE, cart_service.MERGE):
+                return Response({'error': "Mode must be 'replace' or 'merge'"}, status=status.HTTP_400_BAD_REQUEST)
+            items = {}
+            try:
+                for item in raw_items:
+                    food_id, quantity = int(item['food_id']), int(item.get('quantity', 1))
+                    if quantity < 1:
+                        return Response({'error': 'Quantity must be at least 1'}, status=status.HTTP_400_BAD_REQUEST)
+                    items[food_id] = items.get(food_id, 0) + quantity
+            except (KeyError, TypeError, ValueError, AttributeError):
+                return Response({'error': 'Invalid food ID or quantity'}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                outcome, value = cart_service.replace_lines(customer_id, items, mode)
+            except LookupError as e:
+                return Response({'error': 'Food item not found', 'food_ids': e.args[0]}, status=status.HTTP_404_NOT_FOUND)
+            except ValueError:
+                return Response(
+                    {'error': 'MULTI_VENDOR_ERROR', 'message': 'All items must be from the same restaurant.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if outcome == cart_service.OTHER_VENDOR:
+                return _multi_vendor_response(customer_id, value, next(iter(items)))
+            return Response(cart_service.summary(customer_id), status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f"Error in CartBulkView: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class ReorderView(APIView):
+    """
+    Rebuild the cart from one of the customer's past orders in a constant
+    number of queries: the order, its items and (for prices not cached) the
+    listings. The cart is replaced unless "mode" is "merge". Items no longer
+    available are left out and reported in "unavailable"; items whose price
+    changed since the order are reported in "repriced".
+    """
+    def post(self, request, order_number):
+        try:
+            customer_id = request.data.get('customer_id') or request.query_params.get('customer_id')
+            mode = request.data.get('mode', cart_service.REPLACE)
+            if not customer_id:
+                return Response({'error': 'Customer ID is required'}, status=status.HTTP_400_BAD_REQUEST)
+            if mode not in (cart_service.REPLACE, cart_service.MERGE):
+                return Response({'error': "Mode must be 'replace' or 'merge'"}, status=status.HTTP_400_BAD_REQUEST)
+            order_id = Order.objects.filter(order_number=order_number, customer_id=customer_id).values_list('id', flat=True).first()
+            if order_id is None:
+                return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+            order_lines = list(OrderItem.objects.filter(order_id=order_id).values_list('food_id', 'quantity', 'price'))
+
+            outcome, value, report = cart_service.reorder(customer_id, order_lines, mode)
+            if outcome is None:
+                return Response(
+                    dict(report, error='None of the items in this order are available any more'),
+                    status=status.HTTP_409_CONFLICT
+                )
+            if outcome == cart_service.OTHER_VENDOR:
+                unavailable = {u['food_id'] for u in report['unavailable']}
+                return _multi_vendor_response(customer_id, value, next(f for f, _, _ in order_lines if f not in unavailable))
+            return Response(dict(cart_service.summary(customer_id), **report), status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error(f"Error in ReorderView: {str(e)}")
+            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 class OrderView(APIView):
     def _get_customer_orders(self, customer_id, inprogress=False):
         """Helper method to get customer orders used by both GET and POST. Optionally filter for in-progress orders."""
@@ -772,17 +777,20 @@ class OrderView(APIView):
             # Otherwise, this is a regular order creation request
             serializer = OrderSerializer(data=request.data)
             if serializer.is_valid():
-                order = serializer.save()
-                # Create order items
-                for item in request.data.get('items', []):
-                    OrderItem.objects.create(
-                        order=order,
-                        food_id=item['food_id'],
-                        quantity=item['quantity'],
-                        price=item['price']
-                    )
-                # Clear cart
-                Cart.objects.filter(customer_id=request.data['customer_id']).delete()
+                # The order, its items, its rollup counts and the emptied cart are saved together or not at all
+                with transaction.atomic():
+                    order = serializer.save()
+                    # Create order items
+                    for item in request.data.get('items', []):
+                        OrderItem.objects.create(
+                            order=order,
+                            food_id=item['food_id'],
+                            quantity=item['quantity'],
+                            price=item['price']
+                        )
+                    rollups.record_order(order, [(item['food_id'], int(item['quantity'])) for item in request.data.get('items', [])])
+                    # Clear cart
+                    cart_service.clear(request.data['customer_id'])
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -803,36 +811,40 @@ class CheckoutView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Get cart items
-            cart_items = Cart.objects.filter(customer_id=customer_id)
-            if not cart_items.exists():
+            # Get cart items, priced from the cached price table with promotions applied
+            cart_lines, pricing = cart_service.quote(cart_service.get_cart(customer_id))
+            total_amount = pricing['total']
+            if not cart_lines:
                 return Response(
                     {'error': 'Cart is empty'}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Calculate total amount
-            total_amount = sum(item.food.price * item.quantity for item in cart_items)
-            
-            # Create order
-            order = Order.objects.create(
-                customer_id=customer_id,
-                total_amount=total_amount,
-                delivery_address=delivery_address,
-                payment_status='pending' if payment_method == 'online' else 'cod',
-            )
-            
-            # Create order items
-            for cart_item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    food=cart_item.food,
-                    quantity=cart_item.quantity,
-                    price=cart_item.food.price
+            # The order, its items, its rollup counts and the emptied cart are saved together or not at all
+            with transaction.atomic():
+                order = Order.objects.create(
+                    customer_id=customer_id,
+                    vendor_id=cart_lines[0]['food_details']['vendor_pk'],  # A cart holds one restaurant's items
+                    total_amount=total_amount,
+                    discount_amount=pricing['discount'],
+                    delivery_address=delivery_address,
+                    payment_status='pending' if payment_method == 'online' else 'cod',
                 )
-            
-            # Clear cart
-            cart_items.delete()
+
+                # Create order items
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        food_id=line['food'],
+                        quantity=line['quantity'],
+                        price=line['price']
+                    )
+                    for line in cart_lines
+                ])
+                rollups.record_order(order, [(line['food'], line['quantity']) for line in cart_lines])
+
+                # Clear cart
+                cart_service.clear(customer_id)
             
             # Return order details
             order_serializer = OrderSerializer(order)
@@ -950,16 +962,49 @@ class CustomerOrderStatusView(APIView):
 class CustomerOrderTrackingView(APIView):
     def get(self, request, order_number):
         try:
-            order = Order.objects.get(order_number=order_number)
+            order = Order.objects.only('order_number', 'status', 'delivery_lat', 'delivery_lng').get(order_number=order_number)
+            # Prefer the live position; the DB copy lags by up to one flush interval
+            live = get_order_location(order.order_number)
             return Response({
                 'order_no': order.order_number,
                 'status': order.status,
-                'delivery_lat': order.delivery_lat,
-                'delivery_lng': order.delivery_lng
+                'delivery_lat': live['lat'] if live else order.delivery_lat,
+                'delivery_lng': live['lng'] if live else order.delivery_lng
             }, status=200)
         except Order.DoesNotExist:
             return Response({'error': 'Order not found'}, status=404)
 
+# --- Customer: Stream Order Tracking (SSE) ---
+class CustomerOrderStreamView(View):
+    """
+    Server-sent events replacing status/track polling. Async so an idle
+    stream costs no worker thread when served under ASGI. Only the order's
+    customer may open it.
+    """
+    async def get(self, request, order_number):
+        auth = await sync_to_async(CustomerJWTAuthentication().authenticate)(request)
+        if auth is None:
+            error = getattr(request, 'jwt_auth_failure', 'Authentication credentials were not provided.')
+            return JsonResponse({'error': str(error)}, status=401)
+        orders = Order.objects.filter(order_number=order_number, customer_id=auth[0].customer_id)
+        if not await orders.aexists():
+            return JsonResponse({'error': 'Order not found'}, status=404)
+
+        async def load_snapshot():
+            order = await orders.values('order_number', 'status', 'delivery_lat', 'delivery_lng').afirst()
+            live = await sync_to_async(get_order_location)(order_number)
+            return {
+                'order_no': order['order_number'],
+                'status': order['status'],
+                'delivery_lat': live['lat'] if live else order['delivery_lat'],
+                'delivery_lng': live['lng'] if live else order['delivery_lng'],
+            }
+
+        response = StreamingHttpResponse(order_event_stream(order_number, load_snapshot), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+        return response
+
 class CreatePaymentView(APIView):
     def post(self, request):
         try:
@@ -1017,12 +1062,30 @@ class CheckDeliveryView(APIView):
             return Response({"delivery_available": False}, status=status.HTTP_200_OK)
 
 class UpdateFCMTokenView(APIView):
-    permission_classes = [AllowAny]
+    authentication_classes = [CustomerJWTAuthentication]
+
+    def get_permissions(self):
+        # AllowAny for GET, the device is registered for the token's customer on POST
+        if self.request.method == 'GET':
+            return [AllowAny()]
+        return [IsAuthenticatedCustomer()]
+
     def get(self, request):
         # HARDCODED TEST VALUES
         fcm_token = '<PUT_YOUR_FCM_TOKEN_HERE>'
         return Response({'success': True, 'fcm_token': fcm_token}, status=status.HTTP_200_OK)
 
+    def post(self, request):
+        # Always the authenticated customer; a customer_id in the body is ignored
+        fcm_token = request.data.get('fcm_token')
+        if not fcm_token:
+            return Response({'success': False, 'message': 'fcm_token is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        customer = request.user.load()
+        register_token('customer', customer.customer_id, fcm_token, request.data.get('platform'))
+        customer.fcm_token = fcm_token  # Legacy single-token field, kept as "last registered device"
+        customer.save(update_fields=['fcm_token'])
+        return Response({'success': True, 'message': 'FCM token updated.'}, status=status.HTTP_200_OK)
+
 class TestNotificationView(APIView):
     permission_classes = [AllowAny]
     def get(self, request):
@@ -1112,9 +1175,39 @@ class FoodDetailView_test(APIView):
         return Response(data, status=status.HTTP_200_OK)
 
 class PopularFoodsView_test(APIView):
+    """
+    Listings ordered most in recent hours (customer_app/popularity.py): near
+    ?lat=&long=, at one restaurant with ?vendor_id=, or everywhere. Until
+    any orders have been counted, every listing is returned.
+    """
     def get(self, request):
-        # Fetch all foods for testing
-        foods = FoodListing.objects.all()  # Assuming FoodListing is the model for foods
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+        key = popularity.ALL
+        vendor_id = request.query_params.get('vendor_id')
+        if vendor_id:
+            vendor_pk = Vendor.objects.filter(vendor_id=vendor_id).values_list('id', flat=True).first()
+            if vendor_pk is None:
+                return Response({"error": "Vendor not found"}, status=status.HTTP_404_NOT_FOUND)
+            key = popularity.vendor_key(vendor_pk)
+        elif request.query_params.get('lat') and request.query_params.get('long'):
+            try:
+                key = popularity.area_of(float(request.query_params['lat']), float(request.query_params['long']))
+            except ValueError:
+                return Response({"error": "Invalid latitude or longitude"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ranked = popularity.popular(key, limit)
+        if ranked:
+            scores = dict(ranked)
+            foods = sorted(
+                FoodListing.objects.filter(id__in=scores).select_related('vendor'),
+                key=lambda food: scores[food.id], reverse=True,
+            )
+        else:
+            scores = {}
+            foods = FoodListing.objects.select_related('vendor')
         data = [
             {
                 "id": food.id,
@@ -1127,6 +1220,7 @@ class PopularFoodsView_test(APIView):
                  # --- Updated image handling ---
                 "image_urls": [request.build_absolute_uri(img_path) for img_path in food.images if img_path] if isinstance(food.images, list) else [],
                  # --- End update ---
+                "popularity": round(scores.get(food.id, 0.0), 2),
             }
             for food in foods
         ]
@@ -1186,56 +1280,26 @@ class CustomerDetailsView(APIView):
             return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
 
 class CustomerAddressesView(APIView):
-    permission_classes = [AllowAny]
+    authentication_classes = [CustomerJWTAuthentication]
+    permission_classes = [IsAuthenticatedCustomer]
     def get(self, request, customer_id):
-        print("... this is test header request for request.headers...........................................",request.headers)
-        print("... this is test data request for request.data",request.data)
-        print("=== CUSTOMER ADDRESSES VIEW HIT - MAIN FILE ===")
-        # --- JWT Auth Start ---
-        auth_header = request.headers.get('Authorization')
-        print(f"[DEBUG][CustomerAddressesView] Incoming headers: {dict(request.headers)}")
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return Response({'error': 'Authorization header missing'}, status=status.HTTP_401_UNAUTHORIZED)
-        token = auth_header.split(' ')[1]
-        print(f"[DEBUG][CustomerAddressesView] Received JWT token: {token}")
-        try:
-            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-            print(f"[DEBUG][CustomerAddressesView] Decoded JWT payload: {payload}")
-        except jwt.ExpiredSignatureError:
-            return Response({'error': 'Token expired'}, status=status.HTTP_401_UNAUTHORIZED)
-        except jwt.InvalidTokenError:
-            return Response({'error': 'Invalid token'}, status=status.HTTP_401_UNAUTHORIZED)
-        # Debug print for troubleshooting
-        print(f"[CustomerAddressesView] customer_id from URL: {customer_id}, customer_id from token: {payload.get('customer_id')}")
-        # Check token_type is 'access'
-        print(f"[CustomerAddressesView] token_type in payload: {payload.get('token_type')}")
-        if payload.get('token_type') != 'access':
-            print("------Payload.. for token type......",payload.get('token_type'))
-            return Response({'error': 'Given token not valid for any token type'}, status=status.HTTP_401_UNAUTHORIZED)
-        # Check customer_id match
-        if str(payload.get('customer_id')) != str(customer_id):
-            print("------Payload.. for customer id......",payload.get('customer_id'))
+        # request.user comes from the token claims; no Customer lookup needed
+        if str(request.user.customer_id) != str(customer_id):
             return Response({'error': 'Token does not match customer'}, status=status.HTTP_401_UNAUTHORIZED)
-        # --- JWT Auth End ---
-        try:
-            customer = Customer.objects.get(customer_id=customer_id)
-            addresses = customer.addresses.all()
-            data = [
-                {
-                    "id": address.id,
-                    "address_line_1": address.address_line_1,
-                    "address_line_2": address.address_line_2,
-                    "city": address.city,
-                    "state": address.state,
-                    "pincode": address.pincode,
-                    "is_default": address.is_default,
-                }
-                for address in addresses
-            ]
-            print(data)
-            return Response(data, status=status.HTTP_200_OK)
-        except Customer.DoesNotExist:
-            return Response({"error": "Customer not found"}, status=status.HTTP_404_NOT_FOUND)
+        addresses = Address.objects.filter(customer_id=request.user.customer_id)
+        data = [
+            {
+                "id": address.id,
+                "address_line_1": address.address_line_1,
+                "address_line_2": address.address_line_2,
+                "city": address.city,
+                "state": address.state,
+                "pincode": address.pincode,
+                "is_default": address.is_default,
+            }
+            for address in addresses
+        ]
+        return Response(data, status=status.HTTP_200_OK)
 
 class AddAddressView(APIView):
     def post(self, request):
@@ -1358,7 +1422,7 @@ class PlaceOrderView(APIView):
             address_param = order_details.get('address')  # Can be either pincode or address ID
             vendor_id = order_details.get('vendor_id')
             delivery_fee = order_details.get('delivery_fee')  # Optional delivery fee from request
-            total_price = order_details.get('total_price')  # Optional total price from request
+            total_price = order_details.get('total_price')  # Optional; must match the server's total
             
             if not all([customer_id, items_data, address_param, vendor_id]):
                 return Response(
@@ -1392,6 +1456,7 @@ class PlaceOrderView(APIView):
             address_obj = None
             delivery_pincode = None
             delivery_address_str = None
+            delivery_coords = None  # (lat, lng) of the drop-off, used for rider batching
             
             # Check if address is a numeric ID (for a saved address) or a pincode
             try:
@@ -1402,6 +1467,7 @@ class PlaceOrderView(APIView):
                     address_obj = Address.objects.get(id=address_id, customer=customer)
                     delivery_pincode = address_obj.pincode
                     delivery_address_str = f"{address_obj.address_line_1}, {address_obj.address_line_2 or ''}, {address_obj.city}, {address_obj.state}, {address_obj.pincode}"
+                    delivery_coords = (address_obj.latitude, address_obj.longitude)
                 except Address.DoesNotExist:
                     # If address not found, assume it's a pincode
                     delivery_pincode = address_param
@@ -1411,15 +1477,14 @@ class PlaceOrderView(APIView):
                 delivery_pincode = address_param
                 delivery_address_str = delivery_pincode
             
-            # Calculate items total and validate items
-            items_total = 0
+            # Calculate items total from the menu prices and validate items
+            items_total = Decimal('0')
             order_items_to_create = []
             unavailable_items = []
 
             for item_data in items_data:
                 food_id = item_data.get('food_id')
                 quantity = item_data.get('quantity')
-                price = item_data.get('price')
                 
                 # Convert quantity to int if it's a string
                 if isinstance(quantity, str):
@@ -1443,13 +1508,14 @@ class PlaceOrderView(APIView):
                         unavailable_items.append(food_listing.name)
                         continue
                     
-                    item_total = price * quantity
-                    items_total += item_total
+                    price = Decimal(str(food_listing.price))  # The client's price is display only
+                    items_total += price * quantity
                     
                     order_items_to_create.append({
                         'food': food_listing,
                         'quantity': quantity,
-                        'price': price
+                        'price': price,
+                        'category': food_listing.category,
                     })
                 except FoodListing.DoesNotExist:
                     return Response(
@@ -1485,10 +1551,12 @@ class PlaceOrderView(APIView):
                     
                     # Get coordinates for vendor
                     vendor_location = (vendor.latitude, vendor.longitude)
-                    delivery_coords = (delivery_location.latitude, delivery_location.longitude)
+                    geocoded_coords = (delivery_location.latitude, delivery_location.longitude)
+                    if delivery_coords is None:
+                        delivery_coords = geocoded_coords
                     
                     # Calculate distance in kilometers
-                    distance = geodesic(vendor_location, delivery_coords).kilometers
+                    distance = geodesic(vendor_location, geocoded_coords).kilometers
                     print(f"Distance: {distance} km")
                     
                     # Calculate delivery fee
@@ -1506,72 +1574,90 @@ class PlaceOrderView(APIView):
                         status=status.HTTP_500_INTERNAL_SERVER_ERROR
                     )
 
-            # Calculate total amount including delivery fee
-            # Use total_price from request if provided, otherwise calculate
-            if total_price:
-                total_amount = float(total_price)
-            else:
-                total_amount = items_total + delivery_fee
-
-            # Create the Order
-            order = Order.objects.create(
-                customer=customer,
-                vendor=vendor,
-                total_amount=total_amount,
-                delivery_address=delivery_address_str,
-                payment_mode=payment_method,
-                payment_status=payment_status,
-                payment_id=txn_id,
-                status='placed',
-                delivery_fee=delivery_fee
-            )
-
-            # Create OrderItems
-            order_item_instances = []
-            for item_info in order_items_to_create:
-                order_item_instances.append(
-                    OrderItem(
-                        order=order,
-                        food=item_info['food'],
-                        quantity=item_info['quantity'],
-                        price=item_info['price']
+            # Apply the vendor's active promotions to the items
+            pricing = promotions.apply(vendor.id, [
+                {'food': item['food'].id, 'quantity': item['quantity'], 'price': item['price'], 'category': item['category']}
+                for item in order_items_to_create
+            ])
+            # The total is always the server's; a client total that disagrees means stale prices
+            total = (items_total - pricing['discount'] + Decimal(str(delivery_fee))).quantize(Decimal('0.01'))
+            if total_price not in (None, ''):
+                try:
+                    client_total = Decimal(str(total_price)).quantize(Decimal('0.01'))
+                except InvalidOperation:
+                    client_total = None
+                if client_total != total:
+                    return Response(
+                        {"error": "Order total has changed. Please review your order.", "total_amount": float(total)},
+                        status=status.HTTP_400_BAD_REQUEST
                     )
+            items_total = float(items_total)
+            discount_amount = float(pricing['discount'])
+            total_amount = float(total)
+
+            # Create the Order, its items, the vendor notification and the queued
+            # push in one transaction so the side effect exists iff the order does
+            with transaction.atomic():
+                order = Order.objects.create(
+                    customer=customer,
+                    vendor=vendor,
+                    total_amount=total,
+                    discount_amount=pricing['discount'],
+                    delivery_address=delivery_address_str,
+                    payment_mode=payment_method,
+                    payment_status=payment_status,
+                    payment_id=txn_id,
+                    status='placed',
+                    delivery_fee=delivery_fee,
+                    delivery_latitude=delivery_coords[0] if delivery_coords else None,
+                    delivery_longitude=delivery_coords[1] if delivery_coords else None,
                 )
-            OrderItem.objects.bulk_create(order_item_instances)
 
-            # Create notification for vendor
-            try:
-                notification_body = f"""New Order Received!
+                # Create OrderItems
+                order_item_instances = []
+                for item_info in order_items_to_create:
+                    order_item_instances.append(
+                        OrderItem(
+                            order=order,
+                            food=item_info['food'],
+                            quantity=item_info['quantity'],
+                            price=item_info['price']
+                        )
+                    )
+                OrderItem.objects.bulk_create(order_item_instances)
+                rollups.record_order(order, [(item.food_id, item.quantity) for item in order_item_instances])
+
+                # Create notification for vendor (savepoint: a failure here must not lose the order)
+                try:
+                    with transaction.atomic():
+                        notification_body = f"""New Order Received!
 Order ID: {order.order_number}
 Customer: {customer.full_name}
 Items Total: ₹{items_total}
+Discount: ₹{discount_amount}
 Delivery Fee: ₹{delivery_fee}
 Total Amount: ₹{total_amount}
 Payment Mode: {payment_method}
 Delivery Address: {delivery_address_str}"""
-                
-                # Create database notification
-                notification = Notification.objects.create(
-                    vendor=vendor,
-                    title=f"New Order #{order.order_number}",
-                    body=notification_body
-                )
-                
-                # Send push notification if vendor has FCM token
-                if vendor.fcm_token:
-                    try:
-                        from auth_app.views import send_notification_to_device
-                        send_notification_to_device(
-                            vendor.fcm_token,
+                        
+                        # Create database notification
+                        notification = Notification.objects.create(
+                            vendor=vendor,
+                            title=f"New Order #{order.order_number}",
+                            body=notification_body
+                        )
+                        
+                        # Queue push notification to every registered vendor device
+                        enqueue_push(
+                            'vendor',
+                            vendor.vendor_id,
                             f"New Order #{order.order_number}",
                             f"New order received for ₹{total_amount}"
                         )
-                    except Exception as e:
-                        logger.error(f"Failed to send push notification: {str(e)}")
-                
-                logger.info(f"Notification sent to vendor {vendor.vendor_id} for order {order.order_number}")
-            except Exception as e:
-                logger.error(f"Failed to send notification to vendor: {str(e)}")
+                    
+                    logger.info(f"Notification queued for vendor {vendor.vendor_id} for order {order.order_number}")
+                except Exception as e:
+                    logger.error(f"Failed to create notification for vendor: {str(e)}")
             
             # Calculate estimated delivery time (in minutes)
             estimated_delivery_time = 30  # Default 30 minutes
@@ -1583,6 +1669,8 @@ Delivery Address: {delivery_address_str}"""
                 "estimated_delivery_time": estimated_delivery_time,
                 "total_amount": total_amount,
                 "items_total": items_total,
+                "discount_amount": discount_amount,
+                "promotions": [{'id': p['id'], 'title': p['title'], 'discount': float(p['discount'])} for p in pricing['promotions']],
                 "delivery_fee": delivery_fee,
                 "vendor": {
                     "id": vendor.vendor_id,
@@ -1,9 +1,103 @@
+import uuid
+
 import jwt
 from django.conf import settings
+from django.db import transaction
 from rest_framework.authentication import BaseAuthentication
 from rest_framework import exceptions
+
+from core_app.principals import PrincipalCache
+from core_app.revocation import is_token_revoked
+
 from .models import DeliveryUser
 
+# The only fields authentication needs; anything else is loaded on first access
+PRINCIPAL_FIELDS = ('id', 'phone_number', 'name', 'is_active')
+
+
+def _load_principal(user_id):
+    row = DeliveryUser.objects.filter(id=user_id).values(*PRINCIPAL_FIELDS).first()
+    if row is not None:
+        row['id'] = str(row['id'])
+    return row
+
+
+principals = PrincipalCache('delivery', _load_principal)
+
+
+def invalidate_principals(user_ids):
+    """
+    Drop cached principals once the current transaction commits. Invalidating
+    earlier would let a concurrent request re-cache the row as it was before
+    the change.
+    """
+    keys = [str(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: [principals.invalidate(key) for key in keys])
+
+
+def principal_user(principal):
+    """A DeliveryUser with only PRINCIPAL_FIELDS loaded, without a query."""
+    values = {**principal, 'id': uuid.UUID(principal['id'])}
+    return DeliveryUser.from_db('default', PRINCIPAL_FIELDS, [values[f] for f in PRINCIPAL_FIELDS])
+
+
+def user_from_token(token):
+    """
+    Decode a delivery access token and return its active DeliveryUser.
+    Raises AuthenticationFailed. Shared by the DRF authentication class and
+    the WebSocket endpoint.
+
+    The user comes from the principal cache, not a query per request; only
+    PRINCIPAL_FIELDS are loaded. With DELIVERY_AUTH_CLAIM_ONLY the token's
+    claims are used without any lookup.
+    """
+    try:
+        payload = jwt.decode(
+            token,
+            settings.SECRET_KEY,
+            algorithms=[settings.SIMPLE_JWT['ALGORITHM']]
+        )
+    except jwt.ExpiredSignatureError:
+        raise exceptions.AuthenticationFailed('Access token expired')
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed('Invalid token')
+    except Exception as e:
+         # Log unexpected errors during decoding
+         print(f"JWT Decode Error: {e}")
+         raise exceptions.AuthenticationFailed('Could not decode token')
+
+    # Check if it's our delivery user token
+    if payload.get('user_type') != 'delivery':
+        raise exceptions.AuthenticationFailed('Incorrect token type')
+    if is_token_revoked(payload, token):
+        raise exceptions.AuthenticationFailed('Token has been revoked')
+
+    user_id = payload.get('user_id')
+    if not user_id:
+        raise exceptions.AuthenticationFailed('Token missing user identifier')
+    try:
+        user_id = uuid.UUID(str(user_id))
+    except ValueError:
+        raise exceptions.AuthenticationFailed('Invalid user identifier in token')
+
+    if getattr(settings, 'DELIVERY_AUTH_CLAIM_ONLY', False):
+        # Trust the signed claims; disabling an account takes effect when its access token expires
+        return principal_user({
+            'id': str(user_id),
+            'phone_number': payload.get('phone_number'),
+            'name': payload.get('name'),
+            'is_active': True,
+        })
+
+    principal = principals.get(user_id)
+    if principal is None:
+        raise exceptions.AuthenticationFailed('Delivery user not found')
+    if not principal['is_active']:
+        raise exceptions.AuthenticationFailed('User account is disabled')
+    return principal_user(principal)
+
+
 class DeliveryUserJWTAuthentication(BaseAuthentication):
     """
     Custom authentication class for DeliveryUser using JWT.
@@ -24,39 +118,5 @@ class DeliveryUserJWTAuthentication(BaseAuthentication):
             # Header format is incorrect
             return None
 
-        try:
-            payload = jwt.decode(
-                token,
-                settings.SECRET_KEY,
-                algorithms=[settings.SIMPLE_JWT['ALGORITHM']]
-            )
-        except jwt.ExpiredSignatureError:
-            raise exceptions.AuthenticationFailed('Access token expired')
-        except jwt.InvalidTokenError:
-            raise exceptions.AuthenticationFailed('Invalid token')
-        except Exception as e:
-             # Log unexpected errors during decoding
-             print(f"JWT Decode Error: {e}")
-             raise exceptions.AuthenticationFailed('Could not decode token')
-
-        # Check if it's our delivery user token
-        if payload.get('user_type') != 'delivery':
-            raise exceptions.AuthenticationFailed('Incorrect token type')
-
-        user_id = payload.get('user_id')
-        if not user_id:
-            raise exceptions.AuthenticationFailed('Token missing user identifier')
-
-        try:
-            # Retrieve the DeliveryUser using the id from the token
-            user = DeliveryUser.objects.get(id=user_id)
-        except DeliveryUser.DoesNotExist:
-            raise exceptions.AuthenticationFailed('Delivery user not found')
-        except ValueError:
-             raise exceptions.AuthenticationFailed('Invalid user identifier in token') # If id is not valid UUID
-
-        if not user.is_active:
-            raise exceptions.AuthenticationFailed('User account is disabled')
-
         # Successfully authenticated
-        return (user, token) # Return user and token tuple 
\ No newline at end of file
+        return (user_from_token(token), token) # Return user and token tuple
@@ -0,0 +1,210 @@
+"""
+Multi-order batching for riders.
+
+Ready orders are grouped when their restaurants are within
+BATCH_PICKUP_RADIUS_M of each other, they became ready within
+BATCH_TIME_WINDOW_SECONDS and their drops are within BATCH_DROP_RADIUS_M.
+Each group's pickups and drops are sequenced with nearest neighbour
+followed by 2-opt on haversine distances, always picking an order up before
+dropping it. An order only joins a batch if the route does not carry it more
+than BATCH_MAX_DETOUR_M further than driving it straight to the customer.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+
+from core_app.geo import GridIndex, haversine_m
+
+PICKUP = 'pickup'
+DROP = 'drop'
+
+# ready_ts is epoch seconds; drop_lat/drop_lng may be None (ungeocoded address)
+Job = namedtuple('Job', 'key pickup_lat pickup_lng drop_lat drop_lng ready_ts')
+Stop = namedtuple('Stop', 'key action lat lng')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# --- Sequencing ---
+
+def _stops(jobs):
+    stops = []
+    for job in jobs:
+        stops.append(Stop(job.key, PICKUP, job.pickup_lat, job.pickup_lng))
+        stops.append(Stop(job.key, DROP, job.drop_lat, job.drop_lng))
+    return stops
+
+
+def _distances(points):
+    n = len(points)
+    dist = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            dist[i][j] = dist[j][i] = haversine_m(points[i][0], points[i][1], points[j][0], points[j][1])
+    return dist
+
+
+def _nearest_neighbour(stops, dist, first, start):
+    """Feasible route from stop index first (after the optional start node)."""
+    visited = {first}
+    picked = {stops[first].key}
+    route = [first]
+    while len(route) < len(stops):
+        here = route[-1]
+        best = None
+        for i, stop in enumerate(stops):
+            if i in visited or (stop.action == DROP and stop.key not in picked):
+                continue
+            if best is None or dist[here][i] < dist[here][best]:
+                best = i
+        visited.add(best)
+        picked.add(stops[best].key)
+        route.append(best)
+    return route
+
+
+def _two_opt(route, stops, dist, start):
+    """
+    Reverse segments while that shortens the path. A reversal is only allowed
+    if the segment holds no order's pickup and drop together, which is exactly
+    when it keeps every pickup ahead of its drop.
+    """
+    n = len(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(n - 1):
+            prev = route[i - 1] if i > 0 else start
+            seen = set()
+            for j in range(i, n):
+                key = stops[route[j]].key
+                if key in seen:
+                    break  # Both stops of this order are now inside the segment
+                seen.add(key)
+                if j == i:
+                    continue
+                after = route[j + 1] if j + 1 < n else None
+                before_cost = (dist[prev][route[i]] if prev is not None else 0.0) + (dist[route[j]][after] if after is not None else 0.0)
+                after_cost = (dist[prev][route[j]] if prev is not None else 0.0) + (dist[route[i]][after] if after is not None else 0.0)
+                if after_cost < before_cost - 1e-6:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+                    seen = {stops[r].key for r in route[i:j + 1]}
+    return route
+
+
+def _length(route, dist, start):
+    total = dist[start][route[0]] if start is not None else 0.0
+    for a, b in zip(route, route[1:]):
+        total += dist[a][b]
+    return total
+
+
+def sequence(jobs, start=None, improve=True):
+    """
+    Order the pickups and drops of jobs into one route.
+
+    start is an optional (lat, lng) the route leaves from (the rider); without
+    it every pickup is tried as the first stop. Returns ([Stop, ...], length_m),
+    the length including the leg from start.
+    """
+    stops = _stops(jobs)
+    points = [(s.lat, s.lng) for s in stops]
+    start_index = None
+    if start is not None:
+        points.append(start)
+        start_index = len(points) - 1
+    dist = _distances(points)
+
+    firsts = [i for i, s in enumerate(stops) if s.action == PICKUP]
+    if start is not None:
+        firsts = [min(firsts, key=lambda i: dist[start_index][i])]
+    best, best_length = None, None
+    for first in firsts:
+        route = _nearest_neighbour(stops, dist, first, start_index)
+        if improve:
+            route = _two_opt(route, stops, dist, start_index)
+        length = _length(route, dist, start_index)
+        if best is None or length < best_length:
+            best, best_length = route, length
+    return [stops[i] for i in best], best_length
+
+
+def detours(route):
+    """{key: metres carried beyond the direct pickup-drop distance} for a sequenced route."""
+    carried, since_pickup = {}, {}
+    for a, b in zip(route, route[1:]):
+        if a.action == PICKUP:
+            since_pickup[a.key] = 0.0
+        leg = haversine_m(a.lat, a.lng, b.lat, b.lng)
+        for key in since_pickup:
+            since_pickup[key] += leg
+        if b.action == DROP:
+            carried[b.key] = since_pickup.pop(b.key)
+    pickups = {s.key: s for s in route if s.action == PICKUP}
+    return {
+        s.key: carried[s.key] - haversine_m(pickups[s.key].lat, pickups[s.key].lng, s.lat, s.lng)
+        for s in route if s.action == DROP
+    }
+
+
+# --- Grouping ---
+
+def group(jobs, max_orders=None, pickup_radius_m=None, drop_radius_m=None, window_s=None, max_detour_m=None):
+    """
+    Split jobs into batches. Returns [(jobs, route, length_m), ...]; orders
+    that could not be batched come back on their own.
+
+    Seeds are taken oldest first so no order waits behind newer ones; each
+    seed then tries its nearest compatible neighbours, closest pickup + drop
+    first, keeping every addition that stays within the detour limit.
+    """
+    max_orders = max_orders or _setting('BATCH_MAX_ORDERS', 3)
+    pickup_radius_m = pickup_radius_m or _setting('BATCH_PICKUP_RADIUS_M', 1000)
+    drop_radius_m = drop_radius_m or _setting('BATCH_DROP_RADIUS_M', 3000)
+    window_s = window_s or _setting('BATCH_TIME_WINDOW_SECONDS', 600)
+    max_detour_m = max_detour_m if max_detour_m is not None else _setting('BATCH_MAX_DETOUR_M', 2000)
+
+    jobs = sorted(jobs, key=lambda j: j.ready_ts)
+    by_key = {j.key: j for j in jobs}
+    batchable = [j for j in jobs if j.drop_lat is not None and j.drop_lng is not None]
+    index = GridIndex(pickup_radius_m, ref_lat=batchable[0].pickup_lat) if batchable else None
+    for job in batchable:
+        index.insert(job.key, job.pickup_lat, job.pickup_lng)
+
+    batches, done = [], set()
+    for seed in jobs:
+        if seed.key in done:
+            continue
+        done.add(seed.key)
+        if index is None or seed.key not in index.points:
+            batches.append(([seed], None, None))
+            continue
+        index.remove(seed.key)
+
+        candidates = []
+        for pickup_m, key in index.nearest(seed.pickup_lat, seed.pickup_lng, k=max_orders * 4, max_distance_m=pickup_radius_m):
+            other = by_key[key]
+            if abs(other.ready_ts - seed.ready_ts) > window_s:
+                continue
+            drop_m = haversine_m(seed.drop_lat, seed.drop_lng, other.drop_lat, other.drop_lng)
+            if drop_m <= drop_radius_m:
+                candidates.append((pickup_m + drop_m, key))
+        candidates.sort()
+
+        members = [seed]
+        route, length = sequence(members)
+        for _, key in candidates:
+            if len(members) >= max_orders:
+                break
+            trial = members + [by_key[key]]
+            trial_route, trial_length = sequence(trial)
+            if max(detours(trial_route).values()) <= max_detour_m:
+                members, route, length = trial, trial_route, trial_length
+        for job in members[1:]:
+            index.remove(job.key)
+            done.add(job.key)
+        batches.append((members, route, length))
+    return batches
@@ -0,0 +1,199 @@
+"""
+Nearest-available-rider dispatch.
+
+Each round (manage.py run_dispatch) loads orders that are ready for pickup
+and have no rider, indexes the available riders from the presence store on
+a grid, and matches them greedily: every order proposes its nearest
+DISPATCH_CANDIDATES_PER_ORDER riders within DISPATCH_MAX_RADIUS_M, and the
+globally shortest (order, rider) pairs are taken first. Orders that one
+rider can take together are batched first (see batching.py) and matched as
+a unit. Assignments are written with a conditional update so two
+dispatchers can never give the same order to different riders.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core_app.geo import GridIndex, haversine_m
+from notification_app.outbox import enqueue_push
+
+from . import batching, presence
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _greedy_pass(orders, riders, max_radius_m, candidates, cell_size_m):
+    index = GridIndex(cell_size_m, ref_lat=riders[0][1])
+    for key, lat, lng in riders:
+        index.insert(key, lat, lng)
+
+    pairs = []
+    for order_key, lat, lng in orders:
+        for distance, rider_key in index.nearest(lat, lng, k=candidates, max_distance_m=max_radius_m):
+            pairs.append((distance, order_key, rider_key))
+    pairs.sort(key=lambda p: p[0])
+
+    used_orders, used_riders, result = set(), set(), []
+    for distance, order_key, rider_key in pairs:
+        if order_key in used_orders or rider_key in used_riders:
+            continue
+        used_orders.add(order_key)
+        used_riders.add(rider_key)
+        result.append((order_key, rider_key, distance))
+    return result
+
+
+def match(orders, riders, max_radius_m=None, candidates=None, cell_size_m=None):
+    """
+    Greedy nearest matching.
+
+    orders and riders are (key, lat, lng) tuples. Returns a list of
+    (order_key, rider_key, distance_m), each order and rider used at most once.
+    Orders whose candidates were all taken by closer orders get further
+    passes over the riders that are left.
+    """
+    max_radius_m = max_radius_m or _setting('DISPATCH_MAX_RADIUS_M', 5000)
+    candidates = candidates or _setting('DISPATCH_CANDIDATES_PER_ORDER', 8)
+    cell_size_m = cell_size_m or _setting('DISPATCH_CELL_SIZE_M', 1000)
+
+    result = []
+    while orders and riders:
+        matched = _greedy_pass(orders, riders, max_radius_m, candidates, cell_size_m)
+        if not matched:
+            break
+        result.extend(matched)
+        used_orders = {m[0] for m in matched}
+        used_riders = {m[1] for m in matched}
+        orders = [o for o in orders if o[0] not in used_orders]
+        riders = [r for r in riders if r[0] not in used_riders]
+    return result
+
+
+def ready_orders(limit=None):
+    from customer_app.models import Order
+
+    limit = limit or _setting('DISPATCH_BATCH_SIZE', 500)
+    return list(
+        Order.objects.filter(
+            status__in=_setting('DISPATCH_READY_STATUSES', ['ready', 'Ready for Pickup']),
+            rider__isnull=True,
+            vendor__latitude__isnull=False,
+            vendor__longitude__isnull=False,
+        ).values(
+            'id', 'order_number', 'vendor__latitude', 'vendor__longitude',
+            'delivery_latitude', 'delivery_longitude', 'created_at', 'ready_at',
+        ).order_by('created_at')[:limit]
+    )
+
+
+def plan_batches(orders):
+    """Group ready orders that one rider can take together. Returns [(orders, jobs), ...]."""
+    # Orders marked ready before ready_at was recorded fall back to their creation time
+    jobs = [
+        batching.Job(o['id'], o['vendor__latitude'], o['vendor__longitude'],
+                     o['delivery_latitude'], o['delivery_longitude'], (o['ready_at'] or o['created_at']).timestamp())
+        for o in orders
+    ]
+    if not _setting('BATCHING_ENABLED', True):
+        return [([o], [j]) for o, j in zip(orders, jobs)]
+    by_id = {o['id']: o for o in orders}
+    return [([by_id[j.key] for j in members], members) for members, _, _ in batching.group(jobs)]
+
+
+def assign(orders, rider, distance_m, route=None, route_m=None):
+    """
+    Write the assignment of one order or a batch unless another dispatcher got
+    to any of them first. Returns True on success.
+    """
+    from customer_app.models import Order
+
+    now = timezone.now().isoformat()
+    batch = None
+    if len(orders) > 1:
+        numbers = {o['id']: o['order_number'] for o in orders}
+        batch = {
+            'id': uuid.uuid4().hex[:12],
+            'orders': [o['order_number'] for o in orders],
+            'route': [
+                {'order_number': numbers[stop.key], 'action': stop.action, 'lat': stop.lat, 'lng': stop.lng}
+                for stop in route
+            ],
+            'route_m': round(route_m),
+        }
+    with transaction.atomic():
+        for order in orders:
+            partner = {
+                'id': str(rider.id),
+                'name': rider.name,
+                'phone': rider.phone_number,
+                'assigned_at': now,
+                'pickup_distance_m': round(distance_m),
+            }
+            if batch:
+                partner['batch'] = batch
+            updated = Order.objects.filter(id=order['id'], rider__isnull=True).update(rider=rider, delivery_partner=partner)
+            if not updated:
+                transaction.set_rollback(True)
+                return False
+        if batch:
+            title = f"New batch of {len(orders)} deliveries"
+            data = {'order_number': batch['route'][0]['order_number'], 'batch_id': batch['id']}
+        else:
+            title = f"New delivery {orders[0]['order_number']}"
+            data = {'order_number': orders[0]['order_number']}
+        enqueue_push('delivery', rider.id, title, f"Pickup is {distance_m / 1000:.1f} km away", data)
+    presence.add_load(rider.id, len(orders))
+    return True
+
+
+def run_once():
+    """One dispatch round. Returns (ready orders, orders assigned, elapsed seconds)."""
+    from .models import DeliveryUser
+
+    started = time.perf_counter()
+    orders = ready_orders()
+    if not orders:
+        return 0, 0, time.perf_counter() - started
+    # Only the presence cells around the restaurants are read
+    riders = presence.available_riders(
+        near={(o['vendor__latitude'], o['vendor__longitude']) for o in orders},
+        radius_m=_setting('DISPATCH_MAX_RADIUS_M', 5000),
+    )
+    if not riders:
+        return len(orders), 0, time.perf_counter() - started
+
+    batches = plan_batches(orders)
+    # A batch is matched on its oldest order's restaurant
+    pairs = match(
+        [(i, jobs[0].pickup_lat, jobs[0].pickup_lng) for i, (_, jobs) in enumerate(batches)],
+        [(r['rider_id'], r['lat'], r['lng']) for r in riders],
+    )
+    positions = {r['rider_id']: (r['lat'], r['lng']) for r in riders}
+    users = DeliveryUser.objects.filter(id__in=[r for _, r, _ in pairs], is_active=True).only('id', 'name', 'phone_number')
+    users = {str(u.id): u for u in users}
+    assigned = 0
+    for index, rider_id, distance in pairs:
+        rider = users.get(rider_id)
+        if rider is None:
+            presence.go_offline(rider_id)  # Deactivated or deleted
+            continue
+        batch_orders, jobs = batches[index]
+        route = route_m = None
+        if len(jobs) > 1:
+            # Sequence from where the rider actually is
+            route, route_m = batching.sequence(jobs, start=positions[rider_id])
+            distance = haversine_m(*positions[rider_id], route[0].lat, route[0].lng)
+        if assign(batch_orders, rider, distance, route, route_m):
+            assigned += len(batch_orders)
+    elapsed = time.perf_counter() - started
+    if assigned:
+        logger.info(f"Dispatched {assigned}/{len(orders)} ready orders to {len(riders)} available riders in {elapsed * 1000:.0f}ms")
+    return len(orders), assigned, elapsed
@@ -0,0 +1,261 @@
+"""
+Geofences around the restaurant and the customer of each assigned order.
+
+Every accepted location fix is checked against the order's fences, so
+riders no longer have to tap "arrived" or "picked up":
+
+- entering the restaurant fence fires ARRIVED_AT_RESTAURANT (vendor push);
+- leaving it again, after arriving, fires DEPARTED_RESTAURANT and moves a
+  ready order to out_for_delivery (customer "picked up" push); if the
+  order is not ready yet the departure does not count and fires again on a
+  later fix once it is;
+- entering the nearby ring around the customer fires NEARBY;
+- entering the customer fence fires ARRIVED_AT_CUSTOMER.
+
+Fences are loaded once per order and process, projected into a local
+equirectangular plane centred on the restaurant with squared radii
+precomputed, so a check is a few multiplications and comparisons. Each
+event fires at most once per order across all workers (cache.add); the
+shared cache is only consulted when the geometry says an event is due.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core_app.geo import LocalProjection
+
+logger = logging.getLogger(__name__)
+
+ARRIVED_AT_RESTAURANT = 'arrived_at_restaurant'
+DEPARTED_RESTAURANT = 'departed_restaurant'
+NEARBY = 'nearby'
+ARRIVED_AT_CUSTOMER = 'arrived_at_customer'
+
+FIRED_KEY = 'geofence:{}:{}'
+FIRED_TTL = 6 * 3600  # Longer than any delivery
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class OrderFences:
+    __slots__ = (
+        'order_number', 'customer_id', 'vendor_id', 'projection', 'customer_xy',
+        'restaurant_sq', 'restaurant_exit_sq', 'nearby_sq', 'customer_sq', 'fired', 'checked_at',
+    )
+
+    def __init__(self, order_number, customer_id, vendor_id, vendor_lat, vendor_lng, drop_lat, drop_lng):
+        self.order_number = order_number
+        self.customer_id = customer_id
+        self.vendor_id = vendor_id
+        self.projection = LocalProjection(vendor_lat, vendor_lng)
+        self.customer_xy = self.projection.project(drop_lat, drop_lng) if drop_lat is not None and drop_lng is not None else None
+        restaurant_m = _setting('GEOFENCE_RESTAURANT_RADIUS_M', 75)
+        # Leaving needs a margin beyond the entry radius so GPS jitter at the door is not a departure
+        exit_m = restaurant_m * _setting('GEOFENCE_EXIT_FACTOR', 1.5)
+        self.restaurant_sq = restaurant_m * restaurant_m
+        self.restaurant_exit_sq = exit_m * exit_m
+        self.nearby_sq = _setting('GEOFENCE_NEARBY_RADIUS_M', 500) ** 2
+        self.customer_sq = _setting('GEOFENCE_CUSTOMER_RADIUS_M', 60) ** 2
+        self.fired = set()  # Events this process knows have fired
+        self.checked_at = {}  # event -> when the shared cache was last asked about it
+
+    def due(self, lat, lng):
+        """Events whose fence condition holds for this fix and that this process has not seen fire."""
+        x, y = self.projection.project(lat, lng)
+        from_restaurant = x * x + y * y
+        events = []
+        if from_restaurant <= self.restaurant_sq:
+            events.append(ARRIVED_AT_RESTAURANT)
+        elif from_restaurant > self.restaurant_exit_sq:
+            events.append(DEPARTED_RESTAURANT)
+        if self.customer_xy is not None:
+            dx, dy = x - self.customer_xy[0], y - self.customer_xy[1]
+            from_customer = dx * dx + dy * dy
+            if from_customer <= self.nearby_sq:
+                events.append(NEARBY)
+            if from_customer <= self.customer_sq:
+                events.append(ARRIVED_AT_CUSTOMER)
+        return [e for e in events if e not in self.fired]
+
+
+class _FenceCache:
+    """Small LRU of OrderFences per process."""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, order_number):
+        with self.lock:
+            fences = self.entries.get(order_number)
+            if fences is not None:
+                self.entries.move_to_end(order_number)
+            return fences
+
+    def put(self, fences):
+        with self.lock:
+            self.entries[fences.order_number] = fences
+            self.entries.move_to_end(fences.order_number)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_fences = _FenceCache(_setting('GEOFENCE_CACHE_SIZE', 10000))
+
+
+def load_fences(order_numbers):
+    """OrderFences for the given orders, loading the missing ones in one query."""
+    from customer_app.models import Order
+
+    found, missing = {}, []
+    for order_number in set(order_numbers):
+        fences = _fences.get(order_number)
+        if fences is None:
+            missing.append(order_number)
+        else:
+            found[order_number] = fences
+    if missing:
+        rows = Order.objects.filter(
+            order_number__in=missing, vendor__latitude__isnull=False, vendor__longitude__isnull=False,
+        ).values(
+            'order_number', 'customer_id', 'vendor__vendor_id', 'vendor__latitude', 'vendor__longitude',
+            'delivery_latitude', 'delivery_longitude',
+        )
+        for row in rows:
+            fences = OrderFences(
+                row['order_number'], row['customer_id'], row['vendor__vendor_id'],
+                row['vendor__latitude'], row['vendor__longitude'],
+                row['delivery_latitude'], row['delivery_longitude'],
+            )
+            _fences.put(fences)
+            found[row['order_number']] = fences
+    return found
+
+
+def _claim(fences, event):
+    """True if this call is the first anywhere to fire the event for the order."""
+    fences.fired.add(event)
+    return cache.add(FIRED_KEY.format(fences.order_number, event), 1, timeout=FIRED_TTL)
+
+
+def _has_fired(fences, event):
+    """Whether the event fired in any worker; the shared cache is asked at most every few seconds."""
+    if event in fences.fired:
+        return True
+    now = time.monotonic()
+    if now - fences.checked_at.get(event, -1e9) < _setting('GEOFENCE_SHARED_CHECK_SECONDS', 10):
+        return False
+    fences.checked_at[event] = now
+    if cache.get(FIRED_KEY.format(fences.order_number, event)):
+        fences.fired.add(event)
+        return True
+    return False
+
+
+def _mark_picked_up(fences):
+    """1 if the order moved to picked up now, 0 if it already was, None if it is not ready yet (or gone)."""
+    from customer_app import rollups
+    from customer_app.models import Order
+    from customer_app.tracking import TERMINAL_STATUSES, publish_status
+
+    ready = _setting('DISPATCH_READY_STATUSES', ['ready', 'Ready for Pickup'])
+    new_status = _setting('GEOFENCE_PICKED_UP_STATUS', 'out_for_delivery')
+    order = Order.objects.select_for_update().filter(order_number=fences.order_number).only(
+        'id', 'vendor_id', 'status', 'total_amount', 'created_at',
+    ).first()
+    if order is None:
+        return None
+    if order.status not in ready:
+        return 0 if (order.status or '').lower() in TERMINAL_STATUSES | {new_status.lower()} else None
+    Order.objects.filter(pk=order.pk).update(status=new_status)
+    rollups.record_status_change(order, order.status, new_status)
+    transaction.on_commit(lambda: publish_status(fences.order_number, new_status))
+    return 1
+
+
+def _fire(fences, event):
+    """Act on an event; False if it cannot take effect yet (the order is not ready for pickup)."""
+    from customer_app.tracking import order_channel
+    from core_app.pubsub import publish
+    from notification_app.coalesce import ARRIVED, NEARBY as NEARBY_EVENT, PICKED_UP, notify_order_event
+    from notification_app.outbox import enqueue_push
+
+    with transaction.atomic():
+        if event == ARRIVED_AT_RESTAURANT:
+            enqueue_push(
+                'vendor', fences.vendor_id,
+                f"Rider arrived for order {fences.order_number}",
+                'Your delivery partner is at the restaurant.',
+                {'order_number': str(fences.order_number), 'event': event},
+            )
+        elif event == DEPARTED_RESTAURANT:
+            picked_up = _mark_picked_up(fences)
+            if picked_up is None:
+                return False
+            if picked_up:
+                notify_order_event(fences.order_number, 'customer', fences.customer_id, PICKED_UP)
+        elif event == NEARBY:
+            notify_order_event(fences.order_number, 'customer', fences.customer_id, NEARBY_EVENT)
+        elif event == ARRIVED_AT_CUSTOMER:
+            notify_order_event(fences.order_number, 'customer', fences.customer_id, ARRIVED)
+        transaction.on_commit(lambda: publish(order_channel(fences.order_number), {'type': 'geofence', 'event': event}))
+    return True
+
+
+def _release(fences, event):
+    cache.delete(FIRED_KEY.format(fences.order_number, event))
+    fences.fired.discard(event)
+
+
+def check(fences, lat, lng):
+    """Run the fence checks for one fix. Returns the events fired by this call."""
+    fired = []
+    for event in fences.due(lat, lng):
+        if event == DEPARTED_RESTAURANT and not _has_fired(fences, ARRIVED_AT_RESTAURANT):
+            continue  # Still on the way to the restaurant
+        if event in (NEARBY, ARRIVED_AT_CUSTOMER) and not _has_fired(fences, DEPARTED_RESTAURANT):
+            continue  # Customer lives next to the restaurant; wait for pickup
+        if not _claim(fences, event):
+            continue
+        try:
+            handled = _fire(fences, event)
+        except Exception as e:
+            logger.error(f"Failed to handle {event} for order {fences.order_number}: {e}")
+            handled = False
+        if not handled:
+            _release(fences, event)  # Fires again on a later fix
+            continue
+        fired.append(event)
+    return fired
+
+
+def check_fixes(fixes):
+    """
+    Run fence checks for (order_number, lat, lng) fixes in time order.
+    Returns {order_number: [events fired]} for orders where something fired.
+    """
+    fixes = list(fixes)
+    if not fixes:
+        return {}
+    fences = load_fences(f[0] for f in fixes)
+    result = {}
+    for order_number, lat, lng in fixes:
+        order_fences = fences.get(order_number)
+        if order_fences is None:
+            continue
+        fired = check(order_fences, lat, lng)
+        if fired:
+            result.setdefault(order_number, []).extend(fired)
+    return result
@@ -0,0 +1,372 @@
+"""
+Live rider positions.
+
+GPS pings only touch this store: the latest fix per order and per rider is
+kept in Redis hashes (one pipelined round trip per ping) and the order is
+marked dirty. A fix only replaces a stored position with an older ts, so a
+batch uploaded late cannot move the rider back. `manage.py flush_live_locations` periodically drains the
+dirty set and persists the latest fix of each order with a single
+bulk_update, so the database sees at most one write per order per interval.
+Every accepted fix is also appended to a per-order trail buffer, which the
+same command compresses into LocationTrail chunks (see trail.py); buffers
+that are never drained expire with the live positions.
+
+Without Redis an in-process store is used; it is only shared with a flusher
+running in the same process, so it is meant for local development.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core_app.redis_client import get_redis
+from customer_app.tracking import publish_location
+
+from .trail import RAW_POINT
+
+logger = logging.getLogger(__name__)
+
+ORDER_KEY = 'live:order:{}'
+RIDER_KEY = 'live:rider:{}'
+DIRTY_KEY = 'live:dirty'
+TRAIL_KEY = 'live:trail:{}'
+TRAIL_PENDING_KEY = 'live:trail:pending'
+META_KEY = 'live:meta:{}'
+
+
+# KEYS: live hash (order or rider), dirty set or ''. ARGV: ttl, then the record's fields.
+# Writes the record unless the hash holds a newer fix. Returns 1 if written.
+WRITE_SCRIPT = """
+local stored = tonumber(redis.call('HGET', KEYS[1], 'ts') or '-1')
+if stored > tonumber(ARGV[6]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'order_number', ARGV[2], 'rider_id', ARGV[3], 'lat', ARGV[4], 'lng', ARGV[5], 'ts', ARGV[6])
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+if KEYS[2] ~= '' then
+    redis.call('SADD', KEYS[2], ARGV[2])
+end
+return 1
+"""
+
+
+def _str(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _ttl():
+    return getattr(settings, 'LIVE_LOCATION_TTL_SECONDS', 6 * 3600)
+
+
+def _record(order_number, rider_id, lat, lng, ts):
+    return {
+        'order_number': str(order_number),
+        'rider_id': str(rider_id),
+        'lat': float(lat),
+        'lng': float(lng),
+        'ts': float(ts if ts is not None else time.time()),
+    }
+
+
+def _decode(raw):
+    if not raw:
+        return None
+    values = {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in raw.items()
+    }
+    if 'lat' not in values:
+        return None
+    for field in ('lat', 'lng', 'ts'):
+        values[field] = float(values[field])
+    return values
+
+
+def _newer(record, current):
+    return current is None or record['ts'] >= current['ts']
+
+
+def _latest_per_order(records):
+    latest = {}
+    for record in records:
+        current = latest.get(record['order_number'])
+        if _newer(record, current):
+            latest[record['order_number']] = record
+    return list(latest.values())
+
+
+def _pack(record):
+    return RAW_POINT.pack(record['ts'], record['lat'], record['lng'])
+
+
+class RedisLiveStore:
+    def __init__(self, client):
+        self.client = client
+        self.write_script = client.register_script(WRITE_SCRIPT)
+
+    def update_many(self, records):
+        """
+        Append every record to its order's trail buffer; the newest per order
+        becomes live unless a newer fix is stored. Returns the records made live.
+        """
+        ttl = _ttl()
+        latest = _latest_per_order(records)
+        pipe = self.client.pipeline(transaction=False)
+        for record in records:
+            trail_key = TRAIL_KEY.format(record['order_number'])
+            pipe.rpush(trail_key, _pack(record))
+            pipe.expire(trail_key, ttl)
+            pipe.sadd(TRAIL_PENDING_KEY, record['order_number'])
+        for record in latest:
+            args = [ttl, record['order_number'], record['rider_id'], repr(record['lat']), repr(record['lng']), repr(record['ts'])]
+            self.write_script(keys=[ORDER_KEY.format(record['order_number']), DIRTY_KEY], args=args, client=pipe)
+            self.write_script(keys=[RIDER_KEY.format(record['rider_id']), ''], args=args, client=pipe)
+        written = pipe.execute()[3 * len(records)::2]
+        return [record for record, ok in zip(latest, written) if ok]
+
+    def get_order(self, order_number):
+        return _decode(self.client.hgetall(ORDER_KEY.format(order_number)))
+
+    def get_rider(self, rider_id):
+        return _decode(self.client.hgetall(RIDER_KEY.format(rider_id)))
+
+    def pop_dirty(self, limit):
+        order_numbers = self.client.spop(DIRTY_KEY, limit) or []
+        if not order_numbers:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for order_number in order_numbers:
+            pipe.hgetall(ORDER_KEY.format(_str(order_number)))
+        return [r for r in map(_decode, pipe.execute()) if r]
+
+    def trail_buffer_info(self):
+        """{order_number: (buffered points, ts of the oldest)} for orders with buffered trail points."""
+        order_numbers = [_str(n) for n in self.client.smembers(TRAIL_PENDING_KEY)]
+        pipe = self.client.pipeline(transaction=False)
+        for order_number in order_numbers:
+            pipe.llen(TRAIL_KEY.format(order_number))
+            pipe.lindex(TRAIL_KEY.format(order_number), 0)
+        replies = pipe.execute()
+        info = {}
+        for order_number, length, first in zip(order_numbers, replies[::2], replies[1::2]):
+            if length and first:
+                info[order_number] = (length, RAW_POINT.unpack(first)[0])
+        return info
+
+    def take_trail(self, order_number):
+        """Atomically remove and return (rider_id, packed points) buffered for an order."""
+        key = TRAIL_KEY.format(order_number)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        pipe.srem(TRAIL_PENDING_KEY, order_number)
+        pipe.hget(ORDER_KEY.format(order_number), 'rider_id')
+        points, _, _, rider_id = pipe.execute()
+        return (_str(rider_id) if rider_id else None), points
+
+    def peek_trail(self, order_number):
+        return self.client.lrange(TRAIL_KEY.format(order_number), 0, -1)
+
+
+class MemoryLiveStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.riders = {}
+        self.dirty = set()
+        self.trails = {}
+
+    def update_many(self, records):
+        with self.lock:
+            for record in records:
+                self.trails.setdefault(record['order_number'], []).append(_pack(record))
+            written = []
+            for record in _latest_per_order(records):
+                if _newer(record, self.riders.get(record['rider_id'])):
+                    self.riders[record['rider_id']] = record
+                if not _newer(record, self.orders.get(record['order_number'])):
+                    continue
+                self.orders[record['order_number']] = record
+                self.dirty.add(record['order_number'])
+                written.append(record)
+            return written
+
+    def get_order(self, order_number):
+        return self.orders.get(str(order_number))
+
+    def get_rider(self, rider_id):
+        return self.riders.get(str(rider_id))
+
+    def pop_dirty(self, limit):
+        with self.lock:
+            batch = [self.dirty.pop() for _ in range(min(limit, len(self.dirty)))]
+            return [self.orders[n] for n in batch if n in self.orders]
+
+    def trail_buffer_info(self):
+        with self.lock:
+            return {n: (len(p), RAW_POINT.unpack(p[0])[0]) for n, p in self.trails.items() if p}
+
+    def take_trail(self, order_number):
+        with self.lock:
+            points = self.trails.pop(order_number, [])
+            record = self.orders.get(order_number)
+            return (record['rider_id'] if record else None), points
+
+    def peek_trail(self, order_number):
+        with self.lock:
+            return list(self.trails.get(str(order_number), []))
+
+
+_memory_store = MemoryLiveStore()
+
+
+def get_store():
+    client = get_redis()
+    return RedisLiveStore(client) if client is not None else _memory_store
+
+
+def update_location(order_number, rider_id, lat, lng, ts=None):
+    """Record a fix. O(1), no database access."""
+    record = _record(order_number, rider_id, lat, lng, ts)
+    if get_store().update_many([record]):
+        publish_location(record['order_number'], record['lat'], record['lng'], record['ts'])
+    return record
+
+
+def update_locations(fixes):
+    """
+    Record several (order_number, rider_id, lat, lng, ts) tuples in one round
+    trip. All of them go to the trail buffers; the newest per order becomes
+    the live position unless a newer one is already stored.
+    """
+    records = [_record(*fix) for fix in fixes]
+    written = get_store().update_many(records) if records else []
+    for record in written:
+        publish_location(record['order_number'], record['lat'], record['lng'], record['ts'])
+    return records
+
+
+def get_order_location(order_number):
+    return get_store().get_order(order_number)
+
+
+def get_rider_location(rider_id):
+    return get_store().get_rider(rider_id)
+
+
+def order_customer_id(order_number):
+    """customer_id of an order, cached so pings don't hit the database. None if unknown."""
+    from customer_app.models import Order
+
+    key = META_KEY.format(order_number)
+    customer_id = cache.get(key)
+    if customer_id is None:
+        row = Order.objects.filter(order_number=order_number).values('customer_id').first()
+        if row is None:
+            return None
+        customer_id = row['customer_id']
+        cache.set(key, customer_id, timeout=3600)
+    return customer_id
+
+
+def assigned_orders(rider_id, order_numbers):
+    """{order_number: customer_id} for the given orders assigned to the rider, in one query."""
+    from customer_app.models import Order
+
+    owned = {}
+    rows = Order.objects.filter(order_number__in=set(order_numbers), rider_id=rider_id).values('order_number', 'customer_id')
+    for row in rows:
+        owned[row['order_number']] = row['customer_id']
+        cache.set(META_KEY.format(row['order_number']), row['customer_id'], timeout=3600)
+    return owned
+
+
+def record_fixes(rider_id, fixes, owned):
+    """
+    Record fixes for orders already known to belong to the rider.
+
+    `fixes` are dicts with order_number, lat, lng, ts (epoch seconds) and an
+    optional event; `owned` maps order_number -> customer_id. Fixes outside
+    the accepted time window or for other orders are rejected, repeated
+    (order_number, ts) pairs are dropped and only the newest fix per order
+    reaches the live store.
+    """
+    from notification_app.coalesce import ON_THE_MOVE, notify_order_event
+
+    from .geofence import check_fixes
+
+    now = time.time()
+    max_age = getattr(settings, 'LOCATION_FIX_MAX_AGE_SECONDS', 3600)
+    max_skew = getattr(settings, 'LOCATION_FIX_MAX_CLOCK_SKEW_SECONDS', 60)
+    rejected = []
+    unique = {}
+    not_assigned = set()
+    duplicates = 0
+    for fix in fixes:
+        if fix['order_number'] not in owned:
+            not_assigned.add(fix['order_number'])
+        elif fix['ts'] < now - max_age:
+            rejected.append({'order_number': fix['order_number'], 'ts': fix['ts'], 'reason': 'too_old'})
+        elif fix['ts'] > now + max_skew:
+            rejected.append({'order_number': fix['order_number'], 'ts': fix['ts'], 'reason': 'in_future'})
+        else:
+            key = (fix['order_number'], fix['ts'])
+            duplicates += key in unique
+            unique[key] = fix
+    rejected.extend({'order_number': n, 'reason': 'not_assigned'} for n in sorted(not_assigned))
+    accepted = sorted(unique.values(), key=lambda f: f['ts'])
+
+    latest = {f['order_number']: f for f in accepted}  # Later ts overwrite earlier ones
+    update_locations(
+        (f['order_number'], rider_id, f['lat'], f['lng'], f['ts']) for f in accepted
+    )
+
+    events = {}
+    for fix in accepted:
+        event = fix.get('event') or ON_THE_MOVE
+        events.setdefault(fix['order_number'], [])
+        if event not in events[fix['order_number']]:
+            events[fix['order_number']].append(event)
+    for order_number, kinds in events.items():
+        for kind in kinds:
+            notify_order_event(order_number, 'customer', owned[order_number], kind)
+    geofence_events = check_fixes((f['order_number'], f['lat'], f['lng']) for f in accepted)
+
+    return {
+        'accepted': len(accepted),
+        'duplicates': duplicates,
+        'rejected': rejected,
+        'events': geofence_events,
+        'orders': {
+            n: {'lat': f['lat'], 'lng': f['lng'], 'ts': f['ts']} for n, f in latest.items()
+        },
+    }
+
+
+def ingest_fixes(rider_id, fixes):
+    """Validate and record a batch of fixes uploaded by one rider, checking ownership with one query."""
+    owned = assigned_orders(rider_id, (f['order_number'] for f in fixes))
+    return record_fixes(rider_id, fixes, owned)
+
+
+def flush_to_db(batch_size=None):
+    """Persist the latest fix of every dirty order. Returns the number of orders written."""
+    from customer_app.models import Order
+
+    batch_size = batch_size or getattr(settings, 'LIVE_LOCATION_FLUSH_BATCH_SIZE', 500)
+    written = 0
+    while True:
+        records = get_store().pop_dirty(batch_size)
+        if not records:
+            return written
+        latest = {r['order_number']: r for r in records}
+        orders = Order.objects.only('id', 'order_number').in_bulk(list(latest), field_name='order_number')
+        for order_number, order in orders.items():
+            order.delivery_lat = latest[order_number]['lat']
+            order.delivery_lng = latest[order_number]['lng']
+        Order.objects.bulk_update(orders.values(), ['delivery_lat', 'delivery_lng'], batch_size=batch_size)
+        written += len(orders)
+        if len(records) < batch_size:
+            return written
@@ -0,0 +1,109 @@
+import itertools
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from core_app.geo import haversine_m
+from delivery_auth import batching
+
+
+def _optimal_length(jobs):
+    """Exhaustive search over precedence-feasible routes; only for small batches."""
+    stops = batching._stops(jobs)
+    best = None
+    for perm in itertools.permutations(stops):
+        picked, feasible = set(), True
+        for stop in perm:
+            if stop.action == batching.PICKUP:
+                picked.add(stop.key)
+            elif stop.key not in picked:
+                feasible = False
+                break
+        if feasible:
+            length = sum(haversine_m(a.lat, a.lng, b.lat, b.lng) for a, b in zip(perm, perm[1:]))
+            if best is None or length < best:
+                best = length
+    return best
+
+
+class Command(BaseCommand):
+    help = 'Benchmark order batching and route sequencing on synthetic ready orders (no database access).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--vendors', type=int, default=150)
+        parser.add_argument('--radius-km', type=float, default=15, help='Radius of the simulated city.')
+        parser.add_argument('--window-minutes', type=float, default=10, help='Orders become ready over this period.')
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--optimal-sample', type=int, default=200, help='Batches checked against the exhaustive optimum.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        center = (12.9716, 77.5946)
+        spread = options['radius_km'] / 111.0
+
+        def point(origin, radius):
+            r = radius * rng.random() ** 1.5  # Denser towards the origin, like a real city
+            return origin[0] + rng.uniform(-r, r), origin[1] + rng.uniform(-r, r)
+
+        def make_jobs():
+            vendors = [point(center, spread) for _ in range(options['vendors'])]
+            weights = [rng.paretovariate(1.5) for _ in vendors]  # A few busy restaurants
+            jobs = []
+            for i, vendor in enumerate(rng.choices(vendors, weights=weights, k=options['orders'])):
+                drop = point(vendor, 6 / 111.0)
+                jobs.append(batching.Job(i, vendor[0], vendor[1], drop[0], drop[1], rng.uniform(0, options['window_minutes'] * 60)))
+            return jobs
+
+        timings, batches = [], []
+        for _ in range(options['rounds']):
+            jobs = make_jobs()
+            started = time.perf_counter()
+            batches = batching.group(jobs)
+            timings.append(time.perf_counter() - started)
+
+        sizes = [len(members) for members, _, _ in batches]
+        multi = [(members, route, length) for members, route, length in batches if len(members) > 1]
+        direct = sum(haversine_m(j.pickup_lat, j.pickup_lng, j.drop_lat, j.drop_lng) for j in jobs)
+        batched = sum(length for _, _, length in batches)
+        detours = [d for _, route, _ in multi for d in batching.detours(route).values()]
+
+        self.stdout.write(
+            f"{options['orders']} ready orders, {options['rounds']} rounds: "
+            f"group + sequence p50 {statistics.median(timings) * 1000:.1f}ms, max {max(timings) * 1000:.1f}ms"
+        )
+        self.stdout.write(
+            f"{len(batches)} trips for {len(jobs)} orders ({len(jobs) / len(batches):.2f} orders per trip); "
+            + ', '.join(f"{sizes.count(n)} x {n}" for n in sorted(set(sizes)))
+        )
+        self.stdout.write(
+            f"Rider distance pickup to last drop: batched {batched / 1000:.0f}km vs one order per trip "
+            f"{direct / 1000:.0f}km ({(1 - batched / direct) * 100:.0f}% saved)"
+        )
+        if detours:
+            self.stdout.write(
+                f"Extra distance carried per batched order: mean {statistics.mean(detours):.0f}m, "
+                f"p90 {sorted(detours)[int(len(detours) * 0.9)]:.0f}m, max {max(detours):.0f}m"
+            )
+
+        if not multi:
+            return
+        nn_total = opt_total = two_opt_total = 0.0
+        gaps = []
+        sample = multi[:options['optimal_sample']]
+        for members, _, _ in sample:
+            _, nn_length = batching.sequence(members, improve=False)
+            _, two_opt_length = batching.sequence(members)
+            optimal = _optimal_length(members)
+            nn_total += nn_length
+            two_opt_total += two_opt_length
+            opt_total += optimal
+            gaps.append(two_opt_length / optimal - 1 if optimal else 0.0)
+        self.stdout.write(
+            f"Route quality on {len(sample)} batches vs exhaustive optimum: nearest neighbour "
+            f"+{(nn_total / opt_total - 1) * 100:.1f}%, with 2-opt +{(two_opt_total / opt_total - 1) * 100:.1f}% "
+            f"(worst batch +{max(gaps) * 100:.1f}%, optimal in {sum(g < 1e-9 for g in gaps)})"
+        )
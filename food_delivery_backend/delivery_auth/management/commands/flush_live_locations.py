@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from delivery_auth.live_location import flush_to_db
+from delivery_auth.trail import flush_trails
+
+
+class Command(BaseCommand):
+    help = 'Persist the latest live rider position of each active order to the database in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'LIVE_LOCATION_FLUSH_INTERVAL', 10),
+                            help='Seconds between flushes.')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'LIVE_LOCATION_FLUSH_BATCH_SIZE', 500))
+        parser.add_argument('--once', action='store_true', help='Flush once (including partial trail chunks), then exit.')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        self.stdout.write(f"Flushing live locations every {interval}s")
+        try:
+            while True:
+                started = time.monotonic()
+                written = flush_to_db(options['batch_size'])
+                if written:
+                    self.stdout.write(f"Persisted {written} order locations")
+                chunks, raw, stored = flush_trails(force=options['once'])
+                if chunks:
+                    self.stdout.write(f"Stored {chunks} trail chunks: {raw} fixes simplified to {stored} points")
+                if options['once']:
+                    break
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping live location flusher')
@@ -0,0 +1,30 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from delivery_auth.dispatch import run_once
+
+
+class Command(BaseCommand):
+    help = 'Assign ready orders to the nearest available riders, in rounds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'DISPATCH_INTERVAL_SECONDS', 5),
+                            help='Seconds between dispatch rounds.')
+        parser.add_argument('--once', action='store_true', help='Run a single round, then exit.')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        self.stdout.write(f"Dispatching every {interval}s")
+        try:
+            while True:
+                started = time.monotonic()
+                ready, assigned, elapsed = run_once()
+                if ready:
+                    self.stdout.write(f"{ready} ready orders, {assigned} assigned in {elapsed * 1000:.0f}ms")
+                if options['once']:
+                    break
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping dispatcher')
@@ -0,0 +1,66 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core_app.geo import haversine_m
+from delivery_auth.dispatch import match
+
+
+class Command(BaseCommand):
+    help = 'Benchmark rider matching on synthetic orders and riders (no database access).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--riders', type=int, default=1500)
+        parser.add_argument('--radius-km', type=float, default=15, help='Radius of the simulated city.')
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        center = (12.9716, 77.5946)
+        spread = options['radius_km'] / 111.0
+
+        def point():
+            # Denser towards the centre, like a real city
+            r = spread * rng.random() ** 1.5
+            return center[0] + rng.uniform(-r, r), center[1] + rng.uniform(-r, r)
+
+        timings, matched, distances = [], [], []
+        for _ in range(options['rounds']):
+            orders = [(i, *point()) for i in range(options['orders'])]
+            riders = [(f'r{i}', *point()) for i in range(options['riders'])]
+            started = time.perf_counter()
+            pairs = match(orders, riders)
+            timings.append(time.perf_counter() - started)
+            matched.append(len(pairs))
+            distances.extend(d for _, _, d in pairs)
+
+        # Baseline: first-come-first-served, every order takes the nearest rider still free (same radius)
+        max_radius_m = getattr(settings, 'DISPATCH_MAX_RADIUS_M', 5000)
+        orders = [(i, *point()) for i in range(options['orders'])]
+        riders = [(f'r{i}', *point()) for i in range(options['riders'])]
+        free = dict((r[0], r) for r in riders)
+        fcfs = []
+        for _, lat, lng in orders:
+            if not free:
+                break
+            key = min(free, key=lambda k: haversine_m(lat, lng, free[k][1], free[k][2]))
+            distance = haversine_m(lat, lng, free[key][1], free[key][2])
+            if distance <= max_radius_m:
+                fcfs.append(distance)
+                del free[key]
+
+        self.stdout.write(
+            f"{options['orders']} orders x {options['riders']} riders, {options['rounds']} rounds: "
+            f"match p50 {statistics.median(timings) * 1000:.1f}ms, max {max(timings) * 1000:.1f}ms; "
+            f"{statistics.mean(matched):.0f} matched per round"
+        )
+        self.stdout.write(
+            f"Pickup distance: batch greedy mean {statistics.mean(distances):.0f}m "
+            f"(p90 {sorted(distances)[int(len(distances) * 0.9)]:.0f}m), "
+            f"one-at-a-time nearest mean {statistics.mean(fcfs):.0f}m ({len(fcfs)} matched)"
+        )
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from delivery_auth.models import DeliveryUser
+from delivery_auth.views import generate_delivery_jwt
+from delivery_auth.ws import encode_fixes
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+LOADTEST_PHONE_PREFIX = '+00000'  # Never a real number; used to find and clean up load-test riders
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate many riders streaming locations over ws/delivery/location/. '
+        'Needs the websockets package and an ASGI server (uvicorn) running the project. '
+        'Raise the open-files limit (ulimit -n) for thousands of riders.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='ws://127.0.0.1:8000/ws/delivery/location/')
+        parser.add_argument('--riders', type=int, default=1000)
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to stream after ramp-up.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between frames per rider.')
+        parser.add_argument('--fixes-per-frame', type=int, default=1)
+        parser.add_argument('--ramp', type=float, default=10, help='Seconds over which riders connect.')
+        parser.add_argument('--orders', nargs='*', default=[],
+                            help='Order numbers to bind (must be assigned to the load-test riders to be accepted).')
+        parser.add_argument('--cleanup', action='store_true', help='Delete load-test riders and exit.')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted, _ = DeliveryUser.objects.filter(phone_number__startswith=LOADTEST_PHONE_PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted} load-test riders")
+            return
+        if websockets is None:
+            raise CommandError('ws_load_test needs the websockets package (pip install websockets)')
+
+        tokens = [generate_delivery_jwt(rider)['access'] for rider in self.riders(options['riders'])]
+        stats = asyncio.run(self.run(tokens, options))
+
+        connected = len(stats['connect_ms'])
+        elapsed = stats['elapsed']
+        self.stdout.write(f"Riders connected: {connected}/{len(tokens)} ({stats['connect_errors']} failed)")
+        if connected:
+            connect_ms = sorted(stats['connect_ms'])
+            self.stdout.write(
+                f"Connect latency: p50 {statistics.median(connect_ms):.1f}ms, "
+                f"p99 {connect_ms[int(len(connect_ms) * 0.99) - 1 if len(connect_ms) > 1 else 0]:.1f}ms"
+            )
+        self.stdout.write(
+            f"Sent {stats['frames']} frames / {stats['fixes']} fixes in {elapsed:.1f}s "
+            f"({stats['fixes'] / elapsed if elapsed else 0:.0f} fixes/s), "
+            f"{stats['server_errors']} error replies, {stats['dropped']} connections dropped"
+        )
+
+    def riders(self, count):
+        phones = [f"{LOADTEST_PHONE_PREFIX}{i:07d}" for i in range(count)]
+        existing = set(DeliveryUser.objects.filter(phone_number__in=phones).values_list('phone_number', flat=True))
+        DeliveryUser.objects.bulk_create(
+            [DeliveryUser(phone_number=p, name=f'Load test {p[-7:]}') for p in phones if p not in existing],
+            batch_size=1000,
+        )
+        return DeliveryUser.objects.filter(phone_number__in=phones).order_by('phone_number')
+
+    async def run(self, tokens, options):
+        stats = {'connect_ms': [], 'connect_errors': 0, 'frames': 0, 'fixes': 0, 'server_errors': 0, 'dropped': 0}
+        started = time.perf_counter()
+        deadline = started + options['ramp'] + options['duration']
+        delay = options['ramp'] / max(len(tokens), 1)
+        await asyncio.gather(*(
+            self.rider(token, i * delay, deadline, options, stats) for i, token in enumerate(tokens)
+        ))
+        stats['elapsed'] = time.perf_counter() - started
+        return stats
+
+    async def rider(self, token, start_delay, deadline, options, stats):
+        await asyncio.sleep(start_delay)
+        connect_started = time.perf_counter()
+        try:
+            ws = await websockets.connect(f"{options['url']}?token={token}", open_timeout=30, max_queue=None)
+        except Exception:
+            stats['connect_errors'] += 1
+            return
+        stats['connect_ms'].append((time.perf_counter() - connect_started) * 1000)
+        reader = asyncio.ensure_future(self.read_replies(ws, stats))
+        try:
+            if options['orders']:
+                await ws.send(json.dumps({'type': 'bind', 'orders': options['orders']}))
+            lat, lng = 12.97 + random.uniform(-0.1, 0.1), 77.59 + random.uniform(-0.1, 0.1)
+            per_frame = options['fixes_per_frame']
+            while time.perf_counter() < deadline:
+                fixes = []
+                for _ in range(per_frame):
+                    lat += random.uniform(-0.0002, 0.0002)
+                    lng += random.uniform(-0.0002, 0.0002)
+                    fixes.append((0, 0, lat, lng, time.time()))
+                await ws.send(encode_fixes(fixes))
+                stats['frames'] += 1
+                stats['fixes'] += per_frame
+                await asyncio.sleep(options['interval'] * random.uniform(0.9, 1.1))
+        except Exception:
+            stats['dropped'] += 1
+        finally:
+            reader.cancel()
+            await ws.close()
+
+    async def read_replies(self, ws, stats):
+        try:
+            async for message in ws:
+                if isinstance(message, str) and '"error"' in message:
+                    stats['server_errors'] += 1
+        except Exception:
+            pass
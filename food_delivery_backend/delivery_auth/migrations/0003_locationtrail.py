@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery_auth', '0002_deliveryuser_fcm_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationTrail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_number', models.CharField(max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('raw_point_count', models.PositiveIntegerField(default=0)),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('rider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trails', to='delivery_auth.deliveryuser')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order_number', 'started_at'], name='trail_order_started_idx'), models.Index(fields=['rider', 'started_at'], name='trail_rider_started_idx')],
+            },
+        ),
+    ]
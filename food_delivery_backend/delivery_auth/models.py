@@ -1,8 +1,23 @@
 from django.db import models
 import uuid
-import random
-from django.utils import timezone
-from datetime import timedelta
+
+
+class DeliveryUserQuerySet(models.QuerySet):
+    """
+    Bulk writes send no post_save, so they drop the cached auth principals of
+    the rows they touch themselves (e.g. .update(is_active=False)).
+    bulk_update() goes through update() as well.
+    """
+    def update(self, **kwargs):
+        from .authentication import PRINCIPAL_FIELDS, invalidate_principals
+
+        if not set(kwargs) & set(PRINCIPAL_FIELDS):
+            return super().update(**kwargs)
+        user_ids = list(self.values_list('id', flat=True))
+        updated = super().update(**kwargs)
+        invalidate_principals(user_ids)
+        return updated
+
 
 class DeliveryUser(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -19,38 +34,13 @@ class DeliveryUser(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    # OTP fields
-    otp = models.CharField(max_length=6, blank=True, null=True)
-    otp_expiry_time = models.DateTimeField(blank=True, null=True)
+    # OTPs live in core_app.otp (Redis), not on this table
+
+    objects = DeliveryUserQuerySet.as_manager()
 
     def __str__(self):
         return self.name if self.name else self.phone_number
 
-    def generate_otp(self):
-        """Generates a 6-digit OTP and sets its expiry time."""
-        self.otp = str(random.randint(100000, 999999))
-        # Ensure timezone awareness if USE_TZ=True
-        self.otp_expiry_time = timezone.now() + timedelta(minutes=10) # OTP valid for 10 minutes
-        self.save(update_fields=['otp', 'otp_expiry_time'])
-        print(f"Generated OTP {self.otp} for {self.phone_number}") # For debugging
-        # TODO: Implement actual OTP sending logic (e.g., SMS via Twilio, etc.)
-        # Consider using a background task (Celery) for sending OTPs
-
-    def is_otp_valid(self, provided_otp):
-        """Checks if the provided OTP is correct and not expired."""
-        if self.otp == provided_otp and self.otp_expiry_time and self.otp_expiry_time > timezone.now():
-            # OTP is valid, clear it after verification
-            self.otp = None
-            self.otp_expiry_time = None
-            self.save(update_fields=['otp', 'otp_expiry_time'])
-            return True
-        # Clear expired OTPs if checked
-        elif self.otp_expiry_time and self.otp_expiry_time <= timezone.now():
-            self.otp = None
-            self.otp_expiry_time = None
-            self.save(update_fields=['otp', 'otp_expiry_time'])
-        return False
-
     # Indicates if the user profile is complete (i.e., registered)
     @property
     def is_registered(self):
@@ -59,3 +49,26 @@ class DeliveryUser(models.Model):
     # Note: We are NOT adding password fields or manager methods like create_user,
     # create_superuser as we are not using Django's auth system directly.
     # Authentication relies solely on OTP verification and JWT issuance.
+
+
+class LocationTrail(models.Model):
+    """
+    A chunk of an order's route: simplified, delta-encoded points (see
+    delivery_auth/trail.py). An order's full trail is its chunks in order.
+    """
+    order_number = models.CharField(max_length=20)
+    rider = models.ForeignKey(DeliveryUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='trails')
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    raw_point_count = models.PositiveIntegerField(default=0)  # Fixes received, before simplification
+    point_count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_number', 'started_at'], name='trail_order_started_idx'),
+            models.Index(fields=['rider', 'started_at'], name='trail_rider_started_idx'),
+        ]
+
+    def __str__(self):
+        return f"Trail {self.order_number} {self.started_at:%Y-%m-%d %H:%M} ({self.point_count} pts)"
@@ -0,0 +1,319 @@
+"""
+Rider presence: who is online, where they last were, whether they are free
+and how many orders they carry.
+
+Riders heartbeat every few seconds (the heartbeat endpoint and every
+location update); a position that has not been refreshed for
+PRESENCE_TTL_SECONDS expires and the rider counts as offline. Status and
+load are kept apart from the position and outlive it (for
+PRESENCE_STATE_TTL_SECONDS), so a rider who drops out for a while and comes
+back still carries their orders. Positions are also indexed by grid cell
+(PRESENCE_CELL_DEGREES square) so "online riders in these cells" is one
+sorted-set range per cell rather than a scan of every rider. Heartbeats and
+status/load changes are each one Lua script call.
+
+Redis layout (an in-process equivalent is used without Redis):
+    presence:rider:{id}  hash lat, lng, ts, cell; expires after the TTL
+    presence:state:{id}  hash status, load; expires after the state TTL
+    presence:cell:{cell} sorted set rider -> last heartbeat in that cell
+    presence:online      sorted set rider -> last heartbeat anywhere
+Cell entries are not removed when a rider moves; readers skip members whose
+record points at another cell and old members are trimmed by score.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from core_app.redis_client import get_redis
+
+RIDER_KEY = 'presence:rider:{}'
+STATE_KEY = 'presence:state:{}'
+CELL_KEY = 'presence:cell:{}'
+ONLINE_KEY = 'presence:online'
+
+IDLE = 'idle'
+BUSY = 'busy'
+OFFLINE = 'offline'
+
+# KEYS: rider, state, cell, online. ARGV: rider id, lat, lng, now, cell, ttl, state ttl, only if online.
+# Returns 1, or 0 when only_if_online and the rider is offline.
+HEARTBEAT_SCRIPT = """
+if ARGV[8] == '1' and redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'lat', ARGV[2], 'lng', ARGV[3], 'ts', ARGV[4], 'cell', ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('HSETNX', KEYS[2], 'status', 'idle')
+redis.call('HSETNX', KEYS[2], 'load', 0)
+redis.call('EXPIRE', KEYS[2], ARGV[7])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+redis.call('ZADD', KEYS[4], ARGV[4], ARGV[1])
+return 1
+"""
+
+# KEYS: state. ARGV: status or '', load delta, state ttl. Load never drops below 0.
+# Returns {status, load}.
+UPDATE_SCRIPT = """
+redis.call('HSETNX', KEYS[1], 'status', 'idle')
+local load = redis.call('HINCRBY', KEYS[1], 'load', ARGV[2])
+if load < 0 then
+    load = 0
+    redis.call('HSET', KEYS[1], 'load', 0)
+end
+if ARGV[1] ~= '' then
+    redis.call('HSET', KEYS[1], 'status', ARGV[1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {redis.call('HGET', KEYS[1], 'status'), load}
+"""
+
+
+def _ttl():
+    return getattr(settings, 'PRESENCE_TTL_SECONDS', 30)
+
+
+def _state_ttl():
+    return getattr(settings, 'PRESENCE_STATE_TTL_SECONDS', 24 * 3600)
+
+
+def _cell_degrees():
+    return getattr(settings, 'PRESENCE_CELL_DEGREES', 0.01)
+
+
+def cell_of(lat, lng):
+    size = _cell_degrees()
+    return f"{math.floor(lat / size)}:{math.floor(lng / size)}"
+
+
+def cells_around(lat, lng, radius_m):
+    """Cells overlapping the square of side 2 * radius_m centred on a point."""
+    size = _cell_degrees()
+    dlat = radius_m / 111320.0
+    dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return [
+        f"{i}:{j}"
+        for i in range(math.floor((lat - dlat) / size), math.floor((lat + dlat) / size) + 1)
+        for j in range(math.floor((lng - dlng) / size), math.floor((lng + dlng) / size) + 1)
+    ]
+
+
+def _record(rider_id, position, state=None):
+    """The presence record from a position and a state hash; None unless the position is complete."""
+    if not position or not all(position.get(f) is not None for f in ('lat', 'lng', 'ts', 'cell')):
+        return None
+    state = state or {}
+    return {
+        'rider_id': str(rider_id),
+        'lat': float(position['lat']),
+        'lng': float(position['lng']),
+        'ts': float(position['ts']),
+        'cell': position['cell'],
+        'status': state.get('status') or IDLE,
+        'load': int(state.get('load') or 0),
+    }
+
+
+def _decode(raw):
+    return {k.decode() if isinstance(k, bytes) else k: v.decode() if isinstance(v, bytes) else v for k, v in raw.items()}
+
+
+class RedisPresenceStore:
+    def __init__(self, client):
+        self.client = client
+        self.heartbeat_script = client.register_script(HEARTBEAT_SCRIPT)
+        self.update_script = client.register_script(UPDATE_SCRIPT)
+
+    def heartbeat(self, rider_id, lat, lng, now, ttl, only_if_online=False):
+        rider_id = str(rider_id)
+        cell = cell_of(lat, lng)
+        keys = [RIDER_KEY.format(rider_id), STATE_KEY.format(rider_id), CELL_KEY.format(cell), ONLINE_KEY]
+        args = [rider_id, repr(lat), repr(lng), repr(now), cell, ttl, _state_ttl(), int(only_if_online)]
+        return bool(self.heartbeat_script(keys=keys, args=args))
+
+    def update(self, rider_id, status=None, load_delta=0):
+        """Change a rider's status and/or load, online or not. Returns the new {'status', 'load'}."""
+        status, load = self.update_script(keys=[STATE_KEY.format(rider_id)], args=[status or '', load_delta, _state_ttl()])
+        return {'status': status.decode() if isinstance(status, bytes) else status, 'load': int(load)}
+
+    def remove(self, rider_id):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(RIDER_KEY.format(rider_id))
+        pipe.zrem(ONLINE_KEY, str(rider_id))
+        pipe.execute()
+
+    def get(self, rider_id):
+        records = self._records([rider_id])
+        return records[0] if records else None
+
+    def _records(self, members):
+        members = [m.decode() if isinstance(m, bytes) else str(m) for m in members]
+        pipe = self.client.pipeline(transaction=False)
+        for rider_id in members:
+            pipe.hgetall(RIDER_KEY.format(rider_id))
+            pipe.hgetall(STATE_KEY.format(rider_id))
+        replies = pipe.execute()
+        records = (
+            _record(rider_id, _decode(position), _decode(state))
+            for rider_id, position, state in zip(members, replies[::2], replies[1::2])
+        )
+        return [r for r in records if r]
+
+    def in_cells(self, cells, since):
+        cells = list(cells)
+        pipe = self.client.pipeline(transaction=False)
+        for cell in cells:
+            pipe.zremrangebyscore(CELL_KEY.format(cell), '-inf', f'({since}')
+            pipe.zrangebyscore(CELL_KEY.format(cell), since, '+inf')
+        results = pipe.execute()[1::2]
+        wanted = set(cells)
+        members = {m for result in results for m in result}
+        return [r for r in self._records(members) if r['cell'] in wanted]
+
+    def all(self, since):
+        self.client.zremrangebyscore(ONLINE_KEY, '-inf', f'({since}')
+        return self._records(self.client.zrangebyscore(ONLINE_KEY, since, '+inf'))
+
+
+class MemoryPresenceStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.positions = {}
+        self.states = {}  # rider -> (expires_at, {'status', 'load'})
+        self.cells = {}
+
+    def _live(self, rider_id, since):
+        position = self.positions.get(str(rider_id))
+        return position if position and position['ts'] >= since else None
+
+    def _state(self, rider_id, now):
+        expires_at, state = self.states.get(rider_id, (0, None))
+        if state is None or expires_at < now:
+            state = {'status': IDLE, 'load': 0}
+        self.states[rider_id] = (now + _state_ttl(), state)
+        return state
+
+    def _record(self, rider_id, position):
+        expires_at, state = self.states.get(rider_id, (0, None))
+        return _record(rider_id, position, state if expires_at >= time.time() else None)
+
+    def heartbeat(self, rider_id, lat, lng, now, ttl, only_if_online=False):
+        rider_id = str(rider_id)
+        with self.lock:
+            position = self._live(rider_id, now - ttl)
+            if position is None and only_if_online:
+                return False
+            old_cell = position and position['cell']
+            self.positions[rider_id] = {'lat': float(lat), 'lng': float(lng), 'ts': now, 'cell': cell_of(lat, lng)}
+            self._state(rider_id, now)
+            if old_cell and old_cell != self.positions[rider_id]['cell']:
+                self.cells.get(old_cell, set()).discard(rider_id)
+            self.cells.setdefault(self.positions[rider_id]['cell'], set()).add(rider_id)
+        return True
+
+    def update(self, rider_id, status=None, load_delta=0):
+        with self.lock:
+            state = self._state(str(rider_id), time.time())
+            state['load'] = max(state['load'] + load_delta, 0)
+            if status:
+                state['status'] = status
+            return dict(state)
+
+    def remove(self, rider_id):
+        with self.lock:
+            position = self.positions.pop(str(rider_id), None)
+            if position:
+                self.cells.get(position['cell'], set()).discard(str(rider_id))
+
+    def get(self, rider_id):
+        rider_id = str(rider_id)
+        with self.lock:
+            return self._record(rider_id, self._live(rider_id, time.time() - _ttl()))
+
+    def in_cells(self, cells, since):
+        cells = set(cells)
+        with self.lock:
+            riders = {r for cell in cells for r in self.cells.get(cell, ())}
+            return [self._record(r, self.positions[r]) for r in riders if self._live(r, since) and self.positions[r]['cell'] in cells]
+
+    def all(self, since):
+        with self.lock:
+            return [self._record(r, p) for r, p in self.positions.items() if p['ts'] >= since]
+
+
+_memory_store = MemoryPresenceStore()
+
+
+def get_store():
+    client = get_redis()
+    return RedisPresenceStore(client) if client is not None else _memory_store
+
+
+def heartbeat(rider_id, lat, lng):
+    """Mark the rider online at a position; keeps its status and load. Returns the record."""
+    store = get_store()
+    store.heartbeat(rider_id, float(lat), float(lng), time.time(), _ttl())
+    return store.get(rider_id)
+
+
+def go_online(rider_id, lat, lng):
+    return heartbeat(rider_id, lat, lng)
+
+
+def go_offline(rider_id):
+    get_store().remove(rider_id)
+
+
+def update_position(rider_id, lat, lng):
+    """Refresh an online rider's position; ignored for offline riders."""
+    return get_store().heartbeat(rider_id, float(lat), float(lng), time.time(), _ttl(), only_if_online=True)
+
+
+def set_status(rider_id, status):
+    return get_store().update(rider_id, status=status)
+
+
+def add_load(rider_id, orders):
+    """Rider took `orders` more orders; marks them busy."""
+    return get_store().update(rider_id, status=BUSY, load_delta=orders)
+
+
+def finish_order(rider_id):
+    """Rider delivered or dropped one order; idle again once nothing is left."""
+    store = get_store()
+    state = store.update(rider_id, load_delta=-1)
+    if state['load'] == 0 and state['status'] == BUSY:
+        store.update(rider_id, status=IDLE)
+    return store.get(rider_id)
+
+
+def get_presence(rider_id):
+    return get_store().get(rider_id)
+
+
+def riders_in_cells(cells, status=None):
+    riders = get_store().in_cells(cells, time.time() - _ttl())
+    return [r for r in riders if status is None or r['status'] == status]
+
+
+def riders_near(lat, lng, radius_m, status=None):
+    return riders_in_cells(cells_around(lat, lng, radius_m), status)
+
+
+def online_riders(status=None):
+    riders = get_store().all(time.time() - _ttl())
+    return [r for r in riders if status is None or r['status'] == status]
+
+
+def available_riders(near=None, radius_m=None):
+    """
+    Idle riders, optionally only those in cells within radius_m of any of
+    the `near` (lat, lng) points.
+    """
+    if near is None:
+        return online_riders(IDLE)
+    cells = set()
+    for lat, lng in near:
+        cells.update(cells_around(lat, lng, radius_m))
+    return riders_in_cells(cells, IDLE)
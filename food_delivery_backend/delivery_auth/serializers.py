@@ -2,6 +2,8 @@ from rest_framework import serializers
 from .models import DeliveryUser
 from django.core.validators import RegexValidator
 from customer_app.models import Order # Assuming Order model is here
+from django.conf import settings
+from notification_app.coalesce import EVENT_MESSAGES
 
 # Simple validator for basic phone number format (adjust as needed)
 # Allows optional '+' and requires 9 to 15 digits
@@ -53,3 +55,25 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__' # Or list specific fields needed by the app
+
+
+class LocationFixSerializer(serializers.Serializer):
+    order_number = serializers.CharField(max_length=20)
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    ts = serializers.FloatField(help_text='Fix time, epoch seconds (milliseconds are accepted too)')
+    event = serializers.ChoiceField(choices=list(EVENT_MESSAGES), required=False)
+
+    def validate_ts(self, value):
+        # Android location APIs report milliseconds; normalise to seconds
+        return value / 1000.0 if value > 1e11 else value
+
+
+class LocationBatchSerializer(serializers.Serializer):
+    fixes = LocationFixSerializer(many=True, allow_empty=False)
+
+    def validate_fixes(self, value):
+        limit = getattr(settings, 'LOCATION_BATCH_MAX_FIXES', 500)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} fixes per batch.")
+        return value
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import invalidate_principals
+from .models import DeliveryUser
+
+
+@receiver([post_save, post_delete], sender=DeliveryUser)
+def invalidate_principal(sender, instance, **kwargs):
+    """Drop the cached auth projection so deactivation and edits apply as soon as they commit."""
+    invalidate_principals([instance.id])
@@ -1,3 +1,407 @@
-from django.test import TestCase
+import json
+import random
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from auth_app.models import Vendor
+from core_app.geo import LocalProjection
+from core_app.revocation import revoke_token
+from customer_app.models import Customer, Order
+from notification_app.models import OutboxMessage
+
+from . import batching, dispatch, geofence, live_location, presence, trail, ws
+from .authentication import principals, user_from_token
+from .models import DeliveryUser
+from .views import generate_delivery_jwt
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'delivery-auth-tests'}}
+
+
+def make_rider(n):
+    return DeliveryUser.objects.create(phone_number=f"70000000{n:02d}", name=f"Rider {n}")
+
+
+def make_order(rider=None, status='out_for_delivery'):
+    customer = Customer.objects.create_user(phone='9000000001', full_name='Customer', email='c@example.com')
+    vendor = Vendor.objects.create(phone='8000000001', restaurant_name='Restaurant', email='v@example.com',
+                                   address='Somewhere', contact_number='0', open_hours='9-5')
+    return Order.objects.create(customer=customer, vendor=vendor, total_amount=100, delivery_address='x',
+                                status=status, rider=rider)
+
+
+def client_for(rider):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {generate_delivery_jwt(rider)['access']}")
+    return client
+
+
+@override_settings(CACHES=LOCMEM, ID_WORKER_ID=1, RATE_LIMIT_ENABLED=False)
+class DeliveryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+
+class LocationOwnershipTests(DeliveryTestCase):
+    def test_rider_cannot_move_an_order_assigned_to_someone_else(self):
+        owner, intruder = make_rider(1), make_rider(2)
+        order = make_order(rider=owner)
+        url = f'/api/delivery/orders/{order.order_number}/location/'
+        response = client_for(intruder).patch(url, {'lat': 12.9, 'lng': 77.6}, format='json')
+        self.assertEqual(response.status_code, 404)
+        response = client_for(owner).patch(url, {'lat': 12.9, 'lng': 77.6}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class MemoryLiveStoreTests(DeliveryTestCase):
+    def test_late_batch_does_not_move_the_rider_back(self):
+        store = live_location.MemoryLiveStore()
+        now = time.time()
+        written = store.update_many([live_location._record('A1', 1, 12.0, 77.0, now)])
+        self.assertEqual(len(written), 1)
+        late = [live_location._record('A1', 1, 11.0, 76.0, now - 30), live_location._record('A1', 1, 11.5, 76.5, now - 10)]
+        self.assertEqual(store.update_many(late), [])
+        self.assertEqual(store.get_order('A1')['lat'], 12.0)
+        self.assertEqual(store.get_rider('1')['lat'], 12.0)
+        self.assertEqual(len(store.peek_trail('A1')), 3)
+
+
+class LocationSocketTests(DeliveryTestCase):
+    def run_socket(self, token, messages, before=None):
+        """Feed messages to a socket, calling before(i) ahead of the i-th one. Returns what was sent."""
+        sent = []
+        incoming = [{'type': 'websocket.connect'}] + messages + [{'type': 'websocket.disconnect'}]
+        received = []
+
+        async def receive():
+            if before is not None and 0 < len(received) <= len(messages):
+                await sync_to_async(before)(len(received) - 1)
+            received.append(incoming[len(received)])
+            return received[-1]
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'websocket', 'query_string': f'token={token}'.encode(), 'headers': []}
+        async_to_sync(ws.location_socket)(scope, receive, send)
+        return sent
+
+    @override_settings(WS_REVALIDATE_SECONDS=0)
+    def test_socket_is_closed_once_its_token_is_revoked(self):
+        token = generate_delivery_jwt(make_rider(1))['access']
+        ping = {'type': 'websocket.receive', 'text': json.dumps({'type': 'ping'})}
+
+        def revoke_after_first(i):
+            if i == 1:
+                revoke_token(token)
+
+        sent = self.run_socket(token, [ping, ping, ping], before=revoke_after_first)
+        replies = [json.loads(m['text'])['type'] for m in sent if m['type'] == 'websocket.send']
+        self.assertEqual(replies, ['hello', 'pong'])
+        self.assertEqual(sent[-1], {'type': 'websocket.close', 'code': ws.CLOSE_UNAUTHORIZED})
+
+
+class MemoryPresenceStoreTests(DeliveryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = presence.MemoryPresenceStore()
+
+    def test_position_expires_but_status_and_load_survive_the_gap(self):
+        now = time.time()
+        self.store.heartbeat('r1', 12.9, 77.6, now - 120, ttl=30)
+        self.store.update('r1', status=presence.BUSY, load_delta=2)
+        self.assertIsNone(self.store.get('r1'))
+        self.assertFalse(self.store.heartbeat('r1', 12.9, 77.6, now, ttl=30, only_if_online=True))
+        self.store.heartbeat('r1', 12.9, 77.6, now, ttl=30)
+        record = self.store.get('r1')
+        self.assertEqual((record['status'], record['load']), (presence.BUSY, 2))
+
+    def test_load_never_goes_negative(self):
+        self.store.heartbeat('r1', 12.9, 77.6, time.time(), ttl=30)
+        self.assertEqual(self.store.update('r1', load_delta=-1), {'status': presence.IDLE, 'load': 0})
+
+    def test_riders_are_found_in_their_current_cell_only(self):
+        now = time.time()
+        self.store.heartbeat('r1', 12.9, 77.6, now, ttl=30)
+        self.store.heartbeat('r1', 13.5, 78.2, now, ttl=30)
+        self.assertEqual(self.store.in_cells([presence.cell_of(12.9, 77.6)], now - 30), [])
+        self.assertEqual([r['rider_id'] for r in self.store.in_cells([presence.cell_of(13.5, 78.2)], now - 30)], ['r1'])
+
+
+class DepartureTests(DeliveryTestCase):
+    def setUp(self):
+        super().setUp()
+        geofence._fences.clear()
+        self.order = make_order(rider=make_rider(1), status='preparing')
+        Vendor.objects.filter(pk=self.order.vendor_id).update(latitude=12.9, longitude=77.6)
+        Order.objects.filter(pk=self.order.pk).update(delivery_latitude=12.95, delivery_longitude=77.65)
+
+    def ride(self):
+        fences = geofence.load_fences([self.order.order_number])[self.order.order_number]
+        arrived = geofence.check(fences, 12.9, 77.6)
+        return arrived + geofence.check(fences, 12.91, 77.61)
+
+    def test_leaving_before_the_order_is_ready_does_not_count(self):
+        self.assertEqual(self.ride(), [geofence.ARRIVED_AT_RESTAURANT])
+        self.assertIsNone(cache.get(geofence.FIRED_KEY.format(self.order.order_number, geofence.DEPARTED_RESTAURANT)))
+
+        Order.objects.filter(pk=self.order.pk).update(status='ready')
+        self.assertEqual(self.ride(), [geofence.DEPARTED_RESTAURANT])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'out_for_delivery')
+
+
+@override_settings(BATCHING_ENABLED=False, DISPATCH_MAX_RADIUS_M=5000)
+class DispatchTests(DeliveryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create_user(phone='9000000001', full_name='Customer', email='c@example.com')
+        self.vendor = Vendor.objects.create(phone='8000000001', restaurant_name='Restaurant', email='v@example.com',
+                                            address='Somewhere', contact_number='0', open_hours='9-5',
+                                            latitude=12.9, longitude=77.6)
+        patcher = mock.patch.object(presence, 'get_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(presence, '_memory_store', presence.MemoryPresenceStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ready_order(self, rider=None):
+        return Order.objects.create(customer=self.customer, vendor=self.vendor, total_amount=100,
+                                    delivery_address='x', status='ready', rider=rider,
+                                    delivery_latitude=12.92, delivery_longitude=77.62)
+
+    def test_assign_does_not_take_an_order_from_its_rider(self):
+        first, second = make_rider(1), make_rider(2)
+        order = self.ready_order()
+        [row] = dispatch.ready_orders()
+        self.assertTrue(dispatch.assign([row], first, 100))
+        self.assertFalse(dispatch.assign([row], second, 50))
+        order.refresh_from_db()
+        self.assertEqual(order.rider_id, first.id)
+        self.assertEqual(order.delivery_partner['id'], str(first.id))
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_batch_is_all_or_nothing(self):
+        rider, other = make_rider(1), make_rider(2)
+        free, taken = self.ready_order(), self.ready_order()
+        rows = dispatch.ready_orders()
+        Order.objects.filter(pk=taken.pk).update(rider=other)
+        jobs = [job for _, [job] in dispatch.plan_batches(rows)]
+        route, route_m = dispatch.batching.sequence(jobs)
+        self.assertFalse(dispatch.assign(rows, rider, 100, route, route_m))
+        free.refresh_from_db()
+        self.assertIsNone(free.rider_id)
+        self.assertEqual(OutboxMessage.objects.count(), 0)
+
+    def test_jobs_are_timed_by_when_the_order_became_ready(self):
+        old, recent = self.ready_order(), self.ready_order()
+        ready_at = timezone.now()
+        Order.objects.filter(pk=recent.pk).update(ready_at=ready_at)
+        jobs = {job.key: job for _, [job] in dispatch.plan_batches(dispatch.ready_orders())}
+        old.refresh_from_db()
+        self.assertEqual(jobs[recent.id].ready_ts, ready_at.timestamp())
+        self.assertEqual(jobs[old.id].ready_ts, old.created_at.timestamp())
+
+    def test_round_assigns_only_idle_riders_inside_the_search_cells(self):
+        far, busy, idle = make_rider(1), make_rider(2), make_rider(3)
+        presence.go_online(str(far.id), 13.4, 78.1)  # ~75 km away
+        presence.go_online(str(busy.id), 12.9, 77.6)
+        presence.set_status(str(busy.id), presence.BUSY)
+        presence.go_online(str(idle.id), 12.91, 77.61)
+        order = self.ready_order()
+
+        self.assertEqual(dispatch.run_once()[:2], (1, 1))
+        order.refresh_from_db()
+        self.assertEqual(order.rider_id, idle.id)
+        self.assertEqual(presence.get_presence(str(idle.id))['status'], presence.BUSY)
+        self.assertEqual(dispatch.run_once()[:2], (0, 0))
+
+    def test_round_without_nearby_idle_riders_assigns_nothing(self):
+        far, busy = make_rider(1), make_rider(2)
+        presence.go_online(str(far.id), 13.4, 78.1)
+        presence.go_online(str(busy.id), 12.9, 77.6)
+        presence.set_status(str(busy.id), presence.BUSY)
+        order = self.ready_order()
+
+        self.assertEqual(dispatch.run_once()[:2], (1, 0))
+        order.refresh_from_db()
+        self.assertIsNone(order.rider_id)
+
+
+class BatchingTests(SimpleTestCase):
+    def job(self, key, offset_m=0, ready_ts=0.0, drop_offset_m=0):
+        """A job near a fixed restaurant/customer pair: pickup shifted north, drop shifted east."""
+        shift = offset_m / 111320.0
+        drop_shift = drop_offset_m / 108500.0
+        return batching.Job(key, 12.9 + shift, 77.6, 12.92 + shift, 77.62 + drop_shift, ready_ts)
+
+    def group(self, jobs, **limits):
+        limits = {'max_orders': 3, 'pickup_radius_m': 1000, 'drop_radius_m': 3000,
+                  'window_s': 600, 'max_detour_m': 2000, **limits}
+        return [[job.key for job in members] for members, _, _ in batching.group(jobs, **limits)]
+
+    def test_batches_never_exceed_capacity(self):
+        jobs = [self.job(i, offset_m=10 * i) for i in range(7)]
+        self.assertEqual([len(b) for b in self.group(jobs, max_orders=3)], [3, 3, 1])
+        self.assertEqual([len(b) for b in self.group(jobs, max_orders=1)], [1] * 7)
+
+    def test_orders_ready_outside_the_window_are_not_batched(self):
+        jobs = [self.job('a', ready_ts=0), self.job('b', ready_ts=601), self.job('c', ready_ts=300)]
+        self.assertEqual(self.group(jobs), [['a', 'c'], ['b']])
+
+    def test_detour_limit_keeps_far_drops_apart(self):
+        jobs = [self.job('a'), self.job('b', drop_offset_m=2500)]
+        # Dropping a first carries b about 435 m further than driving it straight there
+        self.assertEqual(self.group(jobs, max_detour_m=300), [['a'], ['b']])
+        self.assertEqual(self.group(jobs, max_detour_m=1000), [['a', 'b']])
+
+    def test_ungeocoded_drops_ride_alone(self):
+        jobs = [self.job('a'), self.job('b')._replace(drop_lat=None, drop_lng=None)]
+        self.assertEqual(self.group(jobs), [['a'], ['b']])
+
+    def test_two_opt_never_lengthens_the_route(self):
+        rng = random.Random(11)
+        for _ in range(40):
+            jobs = [
+                batching.Job(i, 12.9 + rng.uniform(0, 0.02), 77.6 + rng.uniform(0, 0.02),
+                             12.9 + rng.uniform(0, 0.05), 77.6 + rng.uniform(0, 0.05), 0.0)
+                for i in range(rng.randint(2, 4))
+            ]
+            start = (12.9 + rng.uniform(-0.01, 0.01), 77.6 + rng.uniform(-0.01, 0.01))
+            for origin in (None, start):
+                route, improved = batching.sequence(jobs, start=origin)
+                _, greedy = batching.sequence(jobs, start=origin, improve=False)
+                self.assertLessEqual(improved, greedy + 1e-6)
+                picked = set()
+                for stop in route:
+                    if stop.action == batching.PICKUP:
+                        picked.add(stop.key)
+                    else:
+                        self.assertIn(stop.key, picked)
+
+
+class PrincipalCacheTests(DeliveryTestCase):
+    def setUp(self):
+        super().setUp()
+        principals.clear_local()
+        self.rider = make_rider(1)
+        self.token = generate_delivery_jwt(self.rider)['access']
+
+    def authenticate(self):
+        with mock.patch.object(principals, 'loader', wraps=principals.loader) as loader:
+            user = user_from_token(self.token)
+        return user, loader.call_count
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        self.assertEqual(self.authenticate()[1], 1)
+        self.assertEqual(self.authenticate()[1], 0)
+        principals.clear_local()  # Another process: shared cache only
+        self.assertEqual(self.authenticate()[1], 0)
+
+    def test_saved_changes_apply_once_committed(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.rider.name = 'Renamed'
+                self.rider.save()
+                # Not committed yet: the cached principal is still served
+                self.assertEqual(self.authenticate(), (mock.ANY, 0))
+        user, loads = self.authenticate()
+        self.assertEqual((user.name, loads), ('Renamed', 1))
+
+    def test_deactivated_rider_is_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rider.is_active = False
+            self.rider.save()
+        with self.assertRaisesMessage(AuthenticationFailed, 'disabled'):
+            user_from_token(self.token)
+
+    def test_bulk_deactivation_is_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            DeliveryUser.objects.filter(pk=self.rider.pk).update(is_active=False)
+        with self.assertRaisesMessage(AuthenticationFailed, 'disabled'):
+            user_from_token(self.token)
+
+    def test_deleted_rider_is_rejected(self):
+        self.authenticate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rider.delete()
+        with self.assertRaisesMessage(AuthenticationFailed, 'not found'):
+            user_from_token(self.token)
+
+
+class TrailCodecTests(SimpleTestCase):
+    def test_round_trip_with_negative_deltas(self):
+        points = [
+            (1700000000.0, 12.971599, 77.594566),
+            (1700000001.5, 12.960001, 77.580002),  # South-west: negative lat/lng deltas
+            (1700000001.25, -33.868820, 151.209296),  # Earlier timestamp, other hemisphere
+            (1700000090.0, 0.0, -0.000001),
+        ]
+        decoded = trail.decode(trail.encode(points))
+        self.assertEqual(len(decoded), len(points))
+        for got, want in zip(decoded, points):
+            self.assertAlmostEqual(got[0], want[0], places=3)
+            self.assertAlmostEqual(got[1], want[1], places=6)
+            self.assertAlmostEqual(got[2], want[2], places=6)
+
+    def test_empty_trail_round_trips(self):
+        self.assertEqual(trail.decode(trail.encode([])), [])
+
+    def test_unknown_format_is_rejected(self):
+        with self.assertRaises(ValueError):
+            trail.decode(b'\x7f\x00')
+
+
+class TrailSimplifyTests(SimpleTestCase):
+    def wander(self, count, seed=7):
+        rng = random.Random(seed)
+        ts, lat, lng = 1700000000.0, 12.97, 77.59
+        points = []
+        for _ in range(count):
+            points.append((ts, lat, lng))
+            ts += rng.uniform(1, 5)
+            lat += rng.uniform(-0.0002, 0.0002)
+            lng += rng.uniform(-0.0002, 0.0002)
+        return points
+
+    def test_short_inputs_are_returned_unchanged(self):
+        for points in ([], [(0.0, 12.0, 77.0)], [(0.0, 12.0, 77.0), (5.0, 12.0, 77.0)]):
+            self.assertEqual(trail.douglas_peucker(points, 5), points)
+            self.assertEqual(trail.threshold_filter(points, 10, 120), points)
+            self.assertEqual(trail.simplify(points), points)
+
+    def test_output_stays_within_tolerance_of_every_input_point(self):
+        points = self.wander(300)
+        tolerance = 5
+        kept = trail.douglas_peucker(points, tolerance)
+        self.assertLess(len(kept), len(points))
+        self.assertEqual((kept[0], kept[-1]), (points[0], points[-1]))
+
+        proj = LocalProjection(points[0][1], points[0][2])
+        segment = 0
+        for ts, lat, lng in points:
+            while kept[segment + 1][0] < ts:
+                segment += 1
+            (t1, lat1, lng1), (t2, lat2, lng2) = kept[segment], kept[segment + 1]
+            ratio = (ts - t1) / (t2 - t1)
+            # Where the rider would be at ts moving uniformly along the kept segment
+            expected = proj.project(lat1 + (lat2 - lat1) * ratio, lng1 + (lng2 - lng1) * ratio)
+            actual = proj.project(lat, lng)
+            error = ((expected[0] - actual[0]) ** 2 + (expected[1] - actual[1]) ** 2) ** 0.5
+            self.assertLessEqual(error, tolerance + 1e-6)
+
+    def test_wait_at_one_spot_survives_simplification(self):
+        # Stationary for a minute mid-route: perpendicular distance is zero, time-synchronised is not
+        points = [(0.0, 12.0, 77.0), (60.0, 12.001, 77.0), (120.0, 12.001, 77.0), (180.0, 12.002, 77.0)]
+        self.assertEqual(trail.douglas_peucker(points, 5), points)
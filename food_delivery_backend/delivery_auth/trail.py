@@ -0,0 +1,241 @@
+"""
+Compressed route history per order.
+
+Every accepted fix is appended to a small per-order buffer in the live
+store. flush_trails() (run by flush_live_locations) turns buffers that are
+old or large enough into LocationTrail chunks:
+
+1. a distance/time threshold drops jitter while the rider is stationary,
+   keeping at least one point every TRAIL_MAX_GAP_SECONDS for dwell times;
+2. Douglas-Peucker (time-synchronised) removes points within
+   TRAIL_SIMPLIFY_TOLERANCE_M of the simplified route;
+3. the survivors are delta-encoded as zigzag varints (ms timestamps,
+   microdegree coordinates), typically 5-8 bytes per point.
+"""
+import logging
+import struct
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+from core_app.geo import LocalProjection
+
+logger = logging.getLogger(__name__)
+
+RAW_POINT = struct.Struct('<ddd')  # ts, lat, lng as buffered in the live store
+FORMAT_VERSION = 1
+COORD_SCALE = 1_000_000
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# --- Simplification ---
+
+def threshold_filter(points, min_distance_m, max_gap_s):
+    """Keep a point only if it moved min_distance_m or max_gap_s passed since the last kept one."""
+    if len(points) <= 2:
+        return list(points)
+    proj = LocalProjection(points[0][1])
+    min_sq = min_distance_m * min_distance_m
+    kept = [points[0]]
+    for point in points[1:-1]:
+        last = kept[-1]
+        if point[0] - last[0] >= max_gap_s or proj.distance_sq(last[1], last[2], point[1], point[2]) >= min_sq:
+            kept.append(point)
+    kept.append(points[-1])
+    return kept
+
+
+def douglas_peucker(points, tolerance_m):
+    """
+    Iterative Douglas-Peucker on (ts, lat, lng) points; endpoints are always kept.
+
+    Uses the time-synchronised distance (from where the rider would be at
+    that timestamp moving uniformly along the segment) rather than the
+    perpendicular distance, so waits and speed changes survive.
+    """
+    if len(points) <= 2:
+        return list(points)
+    proj = LocalProjection(points[0][1], points[0][2])
+    xy = [proj.project(p[1], p[2]) for p in points]
+    tolerance_sq = tolerance_m * tolerance_m
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        t1, span = points[first][0], points[last][0] - points[first][0]
+        worst, worst_sq = None, tolerance_sq
+        for i in range(first + 1, last):
+            ratio = (points[i][0] - t1) / span if span else 0.0
+            px, py = xy[i]
+            ex = px - (x1 + (x2 - x1) * ratio)
+            ey = py - (y1 + (y2 - y1) * ratio)
+            d_sq = ex * ex + ey * ey
+            if d_sq > worst_sq:
+                worst, worst_sq = i, d_sq
+        if worst is not None:
+            keep[worst] = True
+            stack.append((first, worst))
+            stack.append((worst, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplify(points):
+    points = sorted(points)
+    points = threshold_filter(points, _setting('TRAIL_MIN_DISTANCE_M', 10), _setting('TRAIL_MAX_GAP_SECONDS', 120))
+    return douglas_peucker(points, _setting('TRAIL_SIMPLIFY_TOLERANCE_M', 5))
+
+
+# --- Encoding ---
+
+def _write_varint(out, value):
+    value = (value << 1) ^ (value >> 63)  # zigzag
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), pos
+
+
+def encode(points):
+    """Delta-encode (ts, lat, lng) points into bytes."""
+    out = bytearray([FORMAT_VERSION])
+    _write_varint(out, len(points))
+    prev = (0, 0, 0)
+    for ts, lat, lng in points:
+        current = (round(ts * 1000), round(lat * COORD_SCALE), round(lng * COORD_SCALE))
+        for value, before in zip(current, prev):
+            _write_varint(out, value - before)
+        prev = current
+    return bytes(out)
+
+
+def decode(data):
+    data = bytes(data)
+    if not data or data[0] != FORMAT_VERSION:
+        raise ValueError('Unknown trail format')
+    count, pos = _read_varint(data, 1)
+    points = []
+    ts = lat = lng = 0
+    for _ in range(count):
+        delta, pos = _read_varint(data, pos)
+        ts += delta
+        delta, pos = _read_varint(data, pos)
+        lat += delta
+        delta, pos = _read_varint(data, pos)
+        lng += delta
+        points.append((ts / 1000.0, lat / COORD_SCALE, lng / COORD_SCALE))
+    return points
+
+
+# --- Persistence ---
+
+def _to_datetime(ts):
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+
+
+def store_points(order_number, rider_id, points):
+    """Simplify and persist raw points as one chunk. Returns the chunk or None."""
+    from .models import LocationTrail
+
+    if not points:
+        return None
+    simplified = simplify(points)
+    return LocationTrail.objects.create(
+        order_number=order_number,
+        rider_id=rider_id,
+        started_at=_to_datetime(simplified[0][0]),
+        ended_at=_to_datetime(simplified[-1][0]),
+        raw_point_count=len(points),
+        point_count=len(simplified),
+        data=encode(simplified),
+    )
+
+
+def flush_trails(force=False):
+    """
+    Persist trail buffers that are older than TRAIL_CHUNK_SECONDS or longer
+    than TRAIL_CHUNK_MAX_POINTS (all of them with force=True).
+    Returns (chunks written, raw points, stored points).
+    """
+    from .live_location import get_store
+
+    store = get_store()
+    max_age = _setting('TRAIL_CHUNK_SECONDS', 300)
+    max_points = _setting('TRAIL_CHUNK_MAX_POINTS', 500)
+    now = time.time()
+    chunks = raw = stored = 0
+    for order_number, (length, first_ts) in store.trail_buffer_info().items():
+        if not force and length < max_points and now - first_ts < max_age:
+            continue
+        rider_id, buffered = store.take_trail(order_number)
+        if not buffered:
+            continue
+        points = [RAW_POINT.unpack(p) for p in buffered]
+        try:
+            chunk = store_points(order_number, rider_id, points)
+        except Exception as e:
+            logger.error(f"Failed to store trail chunk for {order_number}: {e}")
+            continue
+        chunks += 1
+        raw += chunk.raw_point_count
+        stored += chunk.point_count
+    return chunks, raw, stored
+
+
+# --- Query API ---
+
+def _points_from(chunks, start, end):
+    points = []
+    for chunk in chunks:
+        points.extend(p for p in decode(chunk.data)
+                      if (start is None or p[0] >= start) and (end is None or p[0] <= end))
+    return points
+
+
+def _range_filter(queryset, start, end):
+    if start is not None:
+        queryset = queryset.filter(ended_at__gte=_to_datetime(start))
+    if end is not None:
+        queryset = queryset.filter(started_at__lte=_to_datetime(end))
+    return queryset.order_by('started_at')
+
+
+def trail_for_order(order_number, start=None, end=None, include_pending=True):
+    """Decoded [(ts, lat, lng), ...] for an order, oldest first; start/end are epoch seconds."""
+    from .live_location import get_store
+    from .models import LocationTrail
+
+    points = _points_from(_range_filter(LocationTrail.objects.filter(order_number=order_number), start, end), start, end)
+    if include_pending:
+        # Not yet flushed: the tail of an active delivery
+        pending = (RAW_POINT.unpack(p) for p in get_store().peek_trail(order_number))
+        points.extend(p for p in pending if (start is None or p[0] >= start) and (end is None or p[0] <= end))
+    return sorted(points)
+
+
+def trail_for_rider(rider_id, start=None, end=None):
+    """Decoded points across all of a rider's orders: [(ts, lat, lng, order_number), ...]."""
+    from .models import LocationTrail
+
+    chunks = _range_filter(LocationTrail.objects.filter(rider_id=rider_id), start, end)
+    points = []
+    for chunk in chunks:
+        points.extend(p + (chunk.order_number,) for p in _points_from([chunk], start, end))
+    return sorted(points)
@@ -1,6 +1,7 @@
 from django.urls import path, re_path
 # Import ALL views used in paths
 from .views import *
+from core_app.views import TokenLogoutView
 print("--- Loading delivery_auth/urls.py ---") # DEBUG
 
 # Define an app_name for namespacing if needed, though not strictly required for API views
@@ -11,11 +12,16 @@ urlpatterns = [
     path('otp/send/', SendOTPView.as_view(), name='delivery_send_otp'),
     path('otp/verify/', VerifyOTPView.as_view(), name='delivery_verify_otp'),
     path('register/', RegisterView.as_view(), name='delivery_register'),
+    path('logout/', TokenLogoutView.as_view(), name='delivery_logout'),
 
     # Order endpoints - Make trailing slash optional
     re_path(r'^orders/?$', DeliveryOrderListView.as_view(), name='delivery_order_list'),
     path('orders/<str:order_number>/status/', DeliveryOrderStatusUpdateView.as_view(), name='delivery-order-status-update'),
     path('orders/<str:order_number>/location/', DeliveryOrderLocationUpdateView.as_view(), name='delivery-order-location-update'),
+    path('locations/batch/', DeliveryLocationBatchView.as_view(), name='delivery-location-batch'),
+    path('trail/', DeliveryTrailView.as_view(), name='delivery-trail'),
+    path('presence/', DeliveryPresenceView.as_view(), name='delivery-presence'),
+    path('heartbeat/', DeliveryHeartbeatView.as_view(), name='delivery-heartbeat'),
 
     # FCM/Notification endpoints
     path('fcm-token/update/', UpdateFCMTokenView.as_view(), name='delivery-fcm-token-update'),
@@ -4,41 +4,30 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from .models import DeliveryUser
 from .serializers import (
-    PhoneSerializer, VerifyOTPSerializer, RegisterSerializer, DeliveryUserSerializer, OrderSerializer
+    PhoneSerializer, VerifyOTPSerializer, RegisterSerializer, DeliveryUserSerializer, OrderSerializer,
+    LocationBatchSerializer
 )
 from django.conf import settings
 import jwt # Import PyJWT
+import uuid
+from core_app import otp as otp_service
 from datetime import datetime, timedelta, timezone # Import datetime and timezone
 from .authentication import DeliveryUserJWTAuthentication # Import custom authentication
 from customer_app.models import Order # Assuming Order model is here
+from customer_app import rollups
 from .permissions import IsAuthenticatedDeliveryUser # Import custom permission
+from django.db import transaction
+from notification_app.outbox import enqueue_push
+from customer_app.tracking import publish_status
+from notification_app.coalesce import EVENT_MESSAGES, ON_THE_MOVE, notify_order_event
 
 # --- FCM Notification Utility ---
-try:
-    from auth_app.views import send_notification_to_device
-except ImportError:
-    try:
-        from firebase_admin import messaging
-    except ImportError:
-        messaging = None
-    def send_notification_to_device(token, title, body):
-        if not messaging:
-            print("firebase_admin.messaging is not available.")
-            return False
-        try:
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body,
-                ),
-                token=token,
-            )
-            response = messaging.send(message)
-            print(f"FCM notification sent: {response}")
-            return True
-        except Exception as e:
-            print(f"Failed to send FCM notification: {e}")
-            return False
+from notification_app.dispatch import send_notification_to_device
+from notification_app.registry import register_token
+from .live_location import assigned_orders, ingest_fixes, update_location
+from .trail import trail_for_order, trail_for_rider
+from .geofence import check_fixes
+from . import presence
 
 # Custom JWT generation for DeliveryUser
 def generate_delivery_jwt(user: DeliveryUser):
@@ -49,16 +38,17 @@ def generate_delivery_jwt(user: DeliveryUser):
         'token_type': 'access',
         'exp': datetime.now(timezone.utc) + timedelta(minutes=settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds() / 60), # Use configured lifetime
         'iat': datetime.now(timezone.utc),
-        'jti': jwt.encode({}, settings.SECRET_KEY, algorithm=settings.SIMPLE_JWT['ALGORITHM']), # Simple unique ID
+        'jti': uuid.uuid4().hex, # Unique per token; revocation key (core_app.revocation)
         'user_id': user_id_str, # <-- Use string representation
         'phone_number': user.phone_number,
+        'name': user.name, # Lets DELIVERY_AUTH_CLAIM_ONLY skip the user lookup
         'user_type': 'delivery' # Explicitly set user type
     }
     refresh_payload = {
         'token_type': 'refresh',
         'exp': datetime.now(timezone.utc) + timedelta(days=settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds() / (60*60*24)), # Use configured lifetime
         'iat': datetime.now(timezone.utc),
-        'jti': jwt.encode({}, settings.SECRET_KEY, algorithm=settings.SIMPLE_JWT['ALGORITHM']), # Simple unique ID
+        'jti': uuid.uuid4().hex,
         'user_id': user_id_str, # <-- Use string representation
         'user_type': 'delivery'
     }
@@ -73,6 +63,7 @@ def generate_delivery_jwt(user: DeliveryUser):
 
 class SendOTPView(generics.GenericAPIView):
     serializer_class = PhoneSerializer
+    authentication_classes = []  # Issues tokens; a stale Authorization header must not block it
     permission_classes = [AllowAny]
 
     def post(self, request, *args, **kwargs):
@@ -86,14 +77,17 @@ class SendOTPView(generics.GenericAPIView):
         if not user.is_active:
              return Response({"message": "This account is inactive."}, status=status.HTTP_403_FORBIDDEN)
 
-        user.generate_otp()
+        code, error = otp_service.issue(otp_service.DELIVERY, phone_number)
+        if error:
+            return Response({"success": False, "message": error}, status=status.HTTP_429_TOO_MANY_REQUESTS)
         # TODO: Add actual SMS sending logic here
-        print(f"Generated OTP for {phone_number}: {user.otp}") # Debugging
+        print(f"Generated OTP for {phone_number}: {code}") # Debugging
 
         return Response({"success": True, "message": "OTP sent successfully."}, status=status.HTTP_200_OK)
 
 class VerifyOTPView(generics.GenericAPIView):
     serializer_class = VerifyOTPSerializer
+    authentication_classes = []  # Issues tokens; a stale Authorization header must not block it
     permission_classes = [AllowAny]
 
     def post(self, request, *args, **kwargs):
@@ -110,7 +104,8 @@ class VerifyOTPView(generics.GenericAPIView):
         if not user.is_active:
             return Response({"message": "This account is inactive."}, status=status.HTTP_403_FORBIDDEN)
 
-        if user.is_otp_valid(otp):
+        is_valid, error = otp_service.verify(otp_service.DELIVERY, phone_number, otp)
+        if is_valid:
             is_new_user = not user.is_registered
 
             if is_new_user:
@@ -132,10 +127,11 @@ class VerifyOTPView(generics.GenericAPIView):
                     "user": user_data
                 }, status=status.HTTP_200_OK)
         else:
-            return Response({"success": False, "message": "Invalid or expired OTP."}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({"success": False, "message": error}, status=status.HTTP_400_BAD_REQUEST)
 
 class RegisterView(generics.UpdateAPIView):
     serializer_class = RegisterSerializer
+    authentication_classes = []
     permission_classes = [AllowAny] # Permission handled by OTP check before this step
     queryset = DeliveryUser.objects.all()
     lookup_field = 'phone_number' # Find user by phone number
@@ -216,7 +212,7 @@ class DeliveryOrderListView(generics.ListAPIView):
              return Order.objects.none()
 
         print(f"--- Filtering orders for DeliveryUser ID: {user.id} ---") # DEBUG
-        queryset = Order.objects.filter(delivery_partner__id=str(user.id))
+        queryset = Order.objects.filter(rider=user)
 
         status_param = self.request.query_params.get('status', None)
         if status_param:
@@ -232,8 +228,6 @@ class DeliveryOrderListView(generics.ListAPIView):
         return queryset.order_by('-created_at')
 
 # --- Delivery Agent: Update Order Status ---
-from auth_app.models import Order
-from auth_app.views import send_notification_to_device
 
 class DeliveryOrderStatusUpdateView(views.APIView):
     authentication_classes = [DeliveryUserJWTAuthentication]
@@ -243,18 +237,22 @@ class DeliveryOrderStatusUpdateView(views.APIView):
             new_status = request.data.get('status')
             if not new_status:
                 return Response({'error': 'Missing status'}, status=status.HTTP_400_BAD_REQUEST)
-            order = Order.objects.get(order_number=order_number)
-            order.status = new_status
-            order.save()
-            # Notify customer via FCM if available
-            customer = getattr(order, 'customer', None)
-            if customer and hasattr(customer, 'fcm_token') and customer.fcm_token:
-                title = f"Order {order.order_number} Status Updated"
-                body = f"Your order status is now: {new_status}"
-                try:
-                    send_notification_to_device(customer.fcm_token, title, body)
-                except Exception as e:
-                    print(f"Failed to send FCM notification: {e}")
+            with transaction.atomic():
+                order = Order.objects.select_for_update().get(order_number=order_number)
+                old_status = order.status
+                order.status = new_status
+                order.save()
+                rollups.record_status_change(order, old_status, new_status)
+                # Queue customer push in the same transaction; drain_outbox delivers it
+                customer = getattr(order, 'customer', None)
+                if customer:
+                    title = f"Order {order.order_number} Status Updated"
+                    body = f"Your order status is now: {new_status}"
+                    enqueue_push('customer', customer.customer_id, title, body)
+                # Open tracking streams see the change once it is committed
+                transaction.on_commit(lambda: publish_status(order.order_number, new_status))
+            if new_status.lower() in ('delivered', 'cancelled'):
+                presence.finish_order(request.user.id)
             return Response({'order_no': order.order_number, 'status': order.status}, status=status.HTTP_200_OK)
         except Order.DoesNotExist:
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -272,31 +270,132 @@ class DeliveryOrderLocationUpdateView(views.APIView):
             lng = request.data.get('lng')
             if lat is None or lng is None:
                 return Response({'error': 'Missing lat/lng'}, status=status.HTTP_400_BAD_REQUEST)
-            order = Order.objects.get(order_number=order_number)
-            order.delivery_lat = lat
-            order.delivery_lng = lng
-            order.save()
-            # Notify customer via FCM if available (optional)
-            customer = getattr(order, 'customer', None)
-            if customer and hasattr(customer, 'fcm_token') and customer.fcm_token:
-                title = f"Order {order.order_number} Location Updated"
-                body = f"Your order is on the move!"
-                try:
-                    send_notification_to_device(customer.fcm_token, title, body)
-                except Exception as e:
-                    print(f"Failed to send FCM notification: {e}")
-            return Response({'order_no': order.order_number, 'delivery_lat': order.delivery_lat, 'delivery_lng': order.delivery_lng}, status=status.HTTP_200_OK)
-        except Order.DoesNotExist:
-            return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+            # Optional hint from the rider app: picked_up / nearby / arrived are always delivered
+            event = request.data.get('event') or ON_THE_MOVE
+            if event not in EVENT_MESSAGES:
+                return Response({'error': f'Unknown event: {event}'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                lat, lng = float(lat), float(lng)
+            except (TypeError, ValueError):
+                return Response({'error': 'Invalid lat/lng'}, status=status.HTTP_400_BAD_REQUEST)
+            # Only the rider the order is assigned to may move it (and trigger its geofences)
+            customer_id = assigned_orders(request.user.id, [order_number]).get(order_number)
+            if customer_id is None:
+                return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+            # Live store only; flush_live_locations persists the latest fix in batches
+            update_location(order_number, request.user.id, lat, lng)
+            presence.update_position(request.user.id, lat, lng)
+            # Debounced per order; most pings queue nothing
+            notify_order_event(order_number, 'customer', customer_id, event)
+            # Arrival / pickup detection; usually just a few comparisons
+            events = check_fixes([(order_number, lat, lng)]).get(order_number, [])
+            return Response({'order_no': order_number, 'delivery_lat': lat, 'delivery_lng': lng, 'events': events}, status=status.HTTP_200_OK)
         except Exception as e:
             print(f"Error updating order location for {order_number}: {str(e)}")
             return Response({"error": "Failed to update order location"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# --- Delivery Agent: Batch Location Upload ---
+class DeliveryLocationBatchView(views.APIView):
+    """
+    Accepts buffered GPS fixes for one or more assigned orders, e.g.
+    {"fixes": [{"order_number": "ORD...", "lat": 12.97, "lng": 77.59, "ts": 1760000000.5}]}
+    so the app can upload every few seconds instead of once per fix.
+    """
+    authentication_classes = [DeliveryUserJWTAuthentication]
+    permission_classes = [IsAuthenticatedDeliveryUser]
+
+    def post(self, request):
+        serializer = LocationBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = ingest_fixes(request.user.id, serializer.validated_data['fixes'])
+        except Exception as e:
+            print(f"Error ingesting location batch for {request.user.id}: {str(e)}")
+            return Response({"error": "Failed to record locations"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(result, status=status.HTTP_200_OK)
+
+# --- Delivery Agent: Go Online / Offline ---
+class DeliveryPresenceView(views.APIView):
+    """POST {"online": true, "lat": .., "lng": ..} to receive orders; {"online": false} to stop."""
+    authentication_classes = [DeliveryUserJWTAuthentication]
+    permission_classes = [IsAuthenticatedDeliveryUser]
+
+    def get(self, request):
+        record = presence.get_presence(request.user.id)
+        return Response(record or {'rider_id': str(request.user.id), 'status': presence.OFFLINE}, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        online = request.data.get('online', True)
+        if online in (False, 'false', 'False', '0', 0):
+            presence.go_offline(request.user.id)
+            return Response({'rider_id': str(request.user.id), 'status': presence.OFFLINE}, status=status.HTTP_200_OK)
+        try:
+            lat, lng = float(request.data.get('lat')), float(request.data.get('lng'))
+        except (TypeError, ValueError):
+            return Response({'error': 'lat and lng are required to go online'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(presence.go_online(request.user.id, lat, lng), status=status.HTTP_200_OK)
+
+# --- Delivery Agent: Heartbeat ---
+class DeliveryHeartbeatView(views.APIView):
+    """
+    POST {"lat": .., "lng": ..} every few seconds while online. A rider who
+    stops heartbeating for PRESENCE_TTL_SECONDS is treated as offline.
+    """
+    authentication_classes = [DeliveryUserJWTAuthentication]
+    permission_classes = [IsAuthenticatedDeliveryUser]
+
+    def post(self, request):
+        try:
+            lat, lng = float(request.data.get('lat')), float(request.data.get('lng'))
+        except (TypeError, ValueError):
+            return Response({'error': 'lat and lng are required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            record = presence.heartbeat(request.user.id, lat, lng)
+        except Exception as e:
+            print(f"Error recording heartbeat for {request.user.id}: {str(e)}")
+            return Response({"error": "Failed to record heartbeat"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        record['expires_in'] = getattr(settings, 'PRESENCE_TTL_SECONDS', 30)
+        return Response(record, status=status.HTTP_200_OK)
+
+# --- Delivery Agent: Route History ---
+class DeliveryTrailView(views.APIView):
+    """
+    Decoded route history. ?order_number=... returns that order's trail (if
+    it is assigned to the rider); otherwise the rider's own trail across
+    orders. Optional ?start= / ?end= are epoch seconds.
+    """
+    authentication_classes = [DeliveryUserJWTAuthentication]
+    permission_classes = [IsAuthenticatedDeliveryUser]
+
+    def get(self, request):
+        try:
+            start = float(request.query_params['start']) if request.query_params.get('start') else None
+            end = float(request.query_params['end']) if request.query_params.get('end') else None
+        except ValueError:
+            return Response({'error': 'start/end must be epoch seconds'}, status=status.HTTP_400_BAD_REQUEST)
+        order_number = request.query_params.get('order_number')
+        if order_number:
+            if not assigned_orders(request.user.id, [order_number]):
+                return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
+            points = trail_for_order(order_number, start, end)
+            return Response({
+                'order_no': order_number,
+                'points': [{'ts': ts, 'lat': lat, 'lng': lng} for ts, lat, lng in points],
+            }, status=status.HTTP_200_OK)
+        points = trail_for_rider(request.user.id, start, end)
+        return Response({
+            'rider_id': str(request.user.id),
+            'points': [{'ts': ts, 'lat': lat, 'lng': lng, 'order_no': n} for ts, lat, lng, n in points],
+        }, status=status.HTTP_200_OK)
+
 # TODO: Implement custom Authentication Class (DeliveryUserJWTAuthentication)
 # This class will be responsible for validating the custom JWT and attaching
 # the correct DeliveryUser object to request.user
 
 class UpdateFCMTokenView(views.APIView):
+    authentication_classes = [DeliveryUserJWTAuthentication]
+
     def get_permissions(self):
         # AllowAny for GET, original permissions for POST
         if self.request.method == 'GET':
@@ -313,8 +412,9 @@ class UpdateFCMTokenView(views.APIView):
         fcm_token = request.data.get('fcm_token')
         if not fcm_token:
             return Response({'success': False, 'message': 'No FCM token provided.'}, status=status.HTTP_400_BAD_REQUEST)
-        user.fcm_token = fcm_token
-        user.save()
+        register_token('delivery', user.id, fcm_token, request.data.get('platform'))
+        user.fcm_token = fcm_token  # Legacy single-token field, kept as "last registered device"
+        user.save(update_fields=['fcm_token'])
         return Response({'success': True, 'message': 'FCM token updated.'}, status=status.HTTP_200_OK)
 
 class TestNotificationView(views.APIView):
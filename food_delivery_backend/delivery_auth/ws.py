@@ -0,0 +1,209 @@
+"""
+WebSocket endpoint for rider location streaming (ws/delivery/location/).
+
+A rider keeps one connection open instead of sending an HTTP request per
+GPS fix. The handshake carries the delivery access token, either as
+`?token=<access>` or as an `Authorization: Bearer <access>` header.
+
+Text frames are JSON control messages:
+  {"type": "bind", "orders": ["ORD...", ...]}
+      -> {"type": "bound", "slots": {"ORD...": 0, ...}, "rejected": [...]}
+  {"type": "ping"} -> {"type": "pong"}
+
+Binary frames carry fixes for bound orders. The first byte selects the
+encoding:
+  0x01  packed records, RECORD = '<HBiid' (19 bytes each):
+        slot, event code, lat * 1e6, lng * 1e6, ts (epoch seconds)
+  0x02  msgpack array of [order_number, lat, lng, ts, event?]
+        (only when msgpack is installed)
+Fixes go straight into the live-location store; the server answers only
+when something was rejected.
+
+The token, its revocation, the rider's account and the bound orders are
+checked again before a message is handled once WS_REVALIDATE_SECONDS have
+passed since the last check. The socket is closed with 4401 when the token
+no longer authenticates; orders reassigned meanwhile are rejected.
+"""
+import json
+import logging
+import struct
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import exceptions
+
+from notification_app.coalesce import ARRIVED, NEARBY, ON_THE_MOVE, PICKED_UP
+
+from .authentication import user_from_token
+from .live_location import assigned_orders, record_fixes
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+FRAME_PACKED = 0x01
+FRAME_MSGPACK = 0x02
+RECORD = struct.Struct('<HBiid')
+COORD_SCALE = 1e6
+
+EVENT_CODES = (ON_THE_MOVE, PICKED_UP, NEARBY, ARRIVED)  # Index is the wire code
+
+CLOSE_UNAUTHORIZED = 4401
+
+
+def encode_fixes(fixes):
+    """Pack (slot, event_code, lat, lng, ts) tuples into a binary frame. Used by clients and tests."""
+    return bytes([FRAME_PACKED]) + b''.join(
+        RECORD.pack(slot, event, round(lat * COORD_SCALE), round(lng * COORD_SCALE), ts)
+        for slot, event, lat, lng, ts in fixes
+    )
+
+
+def _token_from_scope(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            auth_type, _, token = value.decode().partition(' ')
+            if auth_type.lower() == 'bearer' and token:
+                return token
+    return None
+
+
+class LocationSocket:
+    """One rider connection."""
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.rider_id = None
+        self.slots = []  # slot -> order_number
+        self.owned = {}  # order_number -> customer_id
+        self.max_fixes = getattr(settings, 'LOCATION_BATCH_MAX_FIXES', 500)
+        self.revalidate_every = getattr(settings, 'WS_REVALIDATE_SECONDS', 60)
+        self.token = None
+        self.validated_at = 0.0
+
+    async def send_json(self, payload):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(payload)})
+
+    async def revalidate(self):
+        """Re-check the token and the bound orders if it is time to; False if the socket was closed."""
+        if time.monotonic() - self.validated_at < self.revalidate_every:
+            return True
+        try:
+            await sync_to_async(user_from_token)(self.token)
+        except exceptions.AuthenticationFailed as e:
+            logger.info(f"Closing location socket of rider {self.rider_id}: {e.detail}")
+            await self.send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+            return False
+        if self.slots:
+            self.owned = await sync_to_async(assigned_orders, thread_sensitive=False)(self.rider_id, self.slots)
+        self.validated_at = time.monotonic()
+        return True
+
+    async def run(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        self.token = _token_from_scope(self.scope)
+        try:
+            if not self.token:
+                raise exceptions.AuthenticationFailed('Missing token')
+            user = await sync_to_async(user_from_token)(self.token)
+        except exceptions.AuthenticationFailed as e:
+            logger.info(f"Rejected location socket: {e.detail}")
+            await self.send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+            return
+        self.rider_id = str(user.id)
+        self.validated_at = time.monotonic()
+        await self.send({'type': 'websocket.accept'})
+        await self.send_json({'type': 'hello', 'rider_id': self.rider_id, 'record_size': RECORD.size})
+
+        while True:
+            message = await self.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if not await self.revalidate():
+                return
+            try:
+                if message.get('bytes') is not None:
+                    await self.handle_fixes(self.decode_frame(message['bytes']))
+                elif message.get('text') is not None:
+                    await self.handle_control(json.loads(message['text']))
+            except (ValueError, KeyError, TypeError, struct.error) as e:
+                await self.send_json({'type': 'error', 'error': f'Malformed frame: {e}'})
+            except Exception as e:
+                logger.error(f"Location socket error for rider {self.rider_id}: {e}")
+                await self.send_json({'type': 'error', 'error': 'Failed to record locations'})
+
+    async def handle_control(self, payload):
+        kind = payload.get('type')
+        if kind == 'ping':
+            await self.send_json({'type': 'pong'})
+        elif kind == 'bind':
+            orders = [str(n) for n in payload.get('orders', [])][:self.max_fixes]
+            self.owned = await sync_to_async(assigned_orders, thread_sensitive=False)(self.rider_id, orders)
+            self.slots = [n for n in orders if n in self.owned]
+            await self.send_json({
+                'type': 'bound',
+                'slots': {n: i for i, n in enumerate(self.slots)},
+                'rejected': [n for n in orders if n not in self.owned],
+            })
+        else:
+            await self.send_json({'type': 'error', 'error': f'Unknown message type: {kind}'})
+
+    def decode_frame(self, data):
+        if not data:
+            raise ValueError('empty frame')
+        kind, body = data[0], data[1:]
+        fixes = []
+        if kind == FRAME_PACKED:
+            if len(body) % RECORD.size:
+                raise ValueError(f'packed body is not a multiple of {RECORD.size} bytes')
+            for slot, event, lat, lng, ts in RECORD.iter_unpack(body):
+                fixes.append({
+                    'order_number': self.slots[slot] if slot < len(self.slots) else f'#slot{slot}',
+                    'lat': lat / COORD_SCALE,
+                    'lng': lng / COORD_SCALE,
+                    'ts': ts,
+                    'event': EVENT_CODES[event] if event < len(EVENT_CODES) else ON_THE_MOVE,
+                })
+        elif kind == FRAME_MSGPACK:
+            if msgpack is None:
+                raise ValueError('msgpack frames are not supported by this server')
+            for item in msgpack.unpackb(body):
+                order_number, lat, lng, ts = item[:4]
+                fixes.append({
+                    'order_number': str(order_number),
+                    'lat': float(lat),
+                    'lng': float(lng),
+                    'ts': float(ts),
+                    'event': item[4] if len(item) > 4 and item[4] in EVENT_CODES else ON_THE_MOVE,
+                })
+        else:
+            raise ValueError(f'unknown frame type {kind}')
+        if len(fixes) > self.max_fixes:
+            raise ValueError(f'at most {self.max_fixes} fixes per frame')
+        for fix in fixes:
+            if not (-90 <= fix['lat'] <= 90 and -180 <= fix['lng'] <= 180):
+                raise ValueError('coordinates out of range')
+        return fixes
+
+    async def handle_fixes(self, fixes):
+        if not fixes:
+            return
+        result = await sync_to_async(record_fixes, thread_sensitive=False)(self.rider_id, fixes, self.owned)
+        if result['rejected']:
+            await self.send_json({'type': 'rejected', 'rejected': result['rejected']})
+
+
+async def location_socket(scope, receive, send):
+    await LocationSocket(scope, receive, send).run()
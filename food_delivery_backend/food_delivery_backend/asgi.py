@@ -2,6 +2,9 @@
 ASGI config for food_delivery_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; WebSocket connections are routed by path to the
+handlers in WEBSOCKET_ROUTES. Serve with an ASGI server that speaks
+WebSockets, e.g. ``uvicorn food_delivery_backend.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +16,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'food_delivery_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up
+from delivery_auth.ws import location_socket  # noqa: E402
+
+WEBSOCKET_ROUTES = {
+    '/ws/delivery/location/': location_socket,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        path = scope['path'] if scope['path'].endswith('/') else scope['path'] + '/'
+        handler = WEBSOCKET_ROUTES.get(path)
+        if handler is None:
+            await receive()  # websocket.connect
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        return await handler(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -46,11 +46,14 @@ INSTALLED_APPS = [
     'auth_app',
     'customer_app',
     'delivery_auth',
+    'core_app',
+    'notification_app',
     'corsheaders',
 ]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'core_app.middleware.RateLimitMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -199,6 +202,16 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'notification_app': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+        'delivery_auth': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
         'django': { # Optional: Log Django specific messages
             'handlers': ['console'],
             'level': 'INFO',
@@ -213,6 +226,139 @@ RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', 'your_razorpay_key_s
 
 APPEND_SLASH = False
 
+# ID generation (core_app.ids). Give every host/container a distinct value
+# (0-1023); when unset, worker ids are leased from the shared cache.
+ID_WORKER_ID = os.environ.get('ID_WORKER_ID')
+ID_WORKER_LEASE_SECONDS = 600  # Leased worker ids are renewed while the process runs and freed this long after it stops
+
+# Transactional outbox worker (manage.py drain_outbox)
+OUTBOX_BATCH_SIZE = 500  # One full FCM send_each batch per claim
+OUTBOX_MAX_ATTEMPTS = 8  # Dead-letter after this many failed deliveries
+OUTBOX_RETRY_BASE_SECONDS = 5  # Backoff doubles per attempt from this base
+OUTBOX_RETRY_MAX_SECONDS = 900
+OUTBOX_LEASE_SECONDS = 60  # Claimed rows are retried if a worker dies mid-batch
+OUTBOX_POLL_INTERVAL = 1.0
+
+# Push delivery (notification_app.dispatch)
+FIREBASE_CREDENTIALS_PATH = os.environ.get(
+    'FIREBASE_CREDENTIALS_PATH', os.path.join(BASE_DIR, 'foodondoor-9d46b-fe4f07a4039b.json')
+)
+FCM_BATCH_SIZE = 500  # FCM send_each limit
+FCM_MAX_MESSAGES_PER_SECOND = 1000  # Pacing to stay under the project quota; 0 disables
+# Send to this FCM v1-compatible endpoint instead of Firebase (e.g. manage.py fake_fcm_server)
+FCM_ENDPOINT_URL = os.environ.get('FCM_ENDPOINT_URL')
+FCM_HTTP_CONCURRENCY = 50
+DEVICE_TOKEN_TTL_DAYS = 60  # expire_device_tokens drops devices that haven't re-registered in this long
+# Per-kind overrides for coalesced order notifications (notification_app.coalesce)
+NOTIFICATION_COALESCE_POLICIES = {
+    'on_the_move': {'debounce_seconds': 300, 'max_per_hour': 6},
+}
+
+# Live rider locations (delivery_auth.live_location)
+LIVE_LOCATION_FLUSH_INTERVAL = 10  # Seconds between flush_live_locations passes
+LIVE_LOCATION_FLUSH_BATCH_SIZE = 500
+LIVE_LOCATION_TTL_SECONDS = 6 * 3600
+LOCATION_BATCH_MAX_FIXES = 500  # Per upload to locations/batch/
+WS_REVALIDATE_SECONDS = 60  # Location sockets re-check the token, account and bound orders this often
+LOCATION_FIX_MAX_AGE_SECONDS = 3600  # Older buffered fixes are rejected
+LOCATION_FIX_MAX_CLOCK_SKEW_SECONDS = 60  # Tolerated device clock drift into the future
+# Route trail compression (delivery_auth.trail)
+TRAIL_MIN_DISTANCE_M = 10  # Drop fixes closer than this to the last kept one...
+TRAIL_MAX_GAP_SECONDS = 120  # ...unless this long has passed (keeps dwell times)
+TRAIL_SIMPLIFY_TOLERANCE_M = 5  # Douglas-Peucker tolerance
+TRAIL_CHUNK_SECONDS = 300  # Buffered fixes are written as a chunk after this long...
+TRAIL_CHUNK_MAX_POINTS = 500  # ...or once this many are buffered
+
+# Rider dispatch (delivery_auth.dispatch)
+DISPATCH_READY_STATUSES = ['ready', 'Ready for Pickup']  # Vendor app sends 'ready'
+DISPATCH_INTERVAL_SECONDS = 5
+DISPATCH_BATCH_SIZE = 500  # Ready orders considered per round
+DISPATCH_MAX_RADIUS_M = 5000  # Riders further than this from the restaurant are not offered the order
+DISPATCH_CANDIDATES_PER_ORDER = 8
+DISPATCH_CELL_SIZE_M = 1000  # Grid cell size of the rider spatial index
+
+# Principal cache for token authentication (core_app.principals)
+AUTH_PRINCIPAL_LOCAL_TTL_SECONDS = 5  # Per-process LRU; other workers see a deactivation within this
+AUTH_PRINCIPAL_SHARED_TTL_SECONDS = 300
+AUTH_PRINCIPAL_LOCAL_SIZE = 10000
+DELIVERY_AUTH_CLAIM_ONLY = False  # True: trust access token claims, no user lookup at all
+
+# Rate limiting (core_app.ratelimit). Each policy allows `limit` requests per
+# `period` seconds per key: 'ip', 'subject' (token owner, else IP) or 'phone'
+# (from the request body, else IP). A request must pass every policy it matches.
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_TRUST_FORWARDED_FOR = False  # True behind a proxy that sets X-Forwarded-For
+_OTP_SEND_PATHS = r'^/(customer/send-otp|auth/send-otp|api/delivery/otp/send)/$'
+_OTP_VERIFY_PATHS = r'^/(customer/verify-otp|auth/verify-otp|api/delivery/otp/verify)/$'
+RATE_LIMITS = [
+    {'name': 'otp-send-phone', 'path': _OTP_SEND_PATHS, 'methods': ['POST'], 'key': 'phone', 'limit': 5, 'period': 900},
+    {'name': 'otp-send-ip', 'path': _OTP_SEND_PATHS, 'methods': ['POST'], 'key': 'ip', 'limit': 20, 'period': 3600},
+    {'name': 'otp-verify-phone', 'path': _OTP_VERIFY_PATHS, 'methods': ['POST'], 'key': 'phone', 'limit': 10, 'period': 900},
+    {'name': 'search', 'path': r'^/(customer|auth)/search/', 'key': 'subject', 'limit': 60, 'period': 60},
+    {'name': 'nearby', 'path': r'^/(customer|auth)/nearby-restaurants/', 'key': 'subject', 'limit': 60, 'period': 60},
+    # These call out to the geocoder
+    {'name': 'geocode', 'path': r'^/customer/(reverse-geocode|check-delivery|delivery-fee)/', 'key': 'subject', 'limit': 30, 'period': 60},
+]
+
+# Carts (customer_app.cart)
+CART_TTL_SECONDS = 7 * 24 * 3600  # Untouched carts leave Redis after this; the Cart table keeps them
+CART_FLUSH_INTERVAL = 5  # Seconds between write-behind flushes (flush_carts)
+CART_FLUSH_BATCH_SIZE = 500
+CART_RECONCILE_CHECK_SECONDS = 5  # How often each process looks for carts changed while Redis was down
+MENU_PRICE_CACHE_SECONDS = 600  # Cached price table; edits invalidate it immediately
+
+# Promotions (auth_app.promotions)
+PROMOTION_INDEX_DAYS = 30  # Days ahead covered by the per-day buckets
+PROMOTION_INDEX_CHECK_SECONDS = 5  # How often each process checks for promotion changes
+
+# Popular items (customer_app.popularity)
+POPULARITY_CAPACITY = 64  # Counters per summary; rankings beyond the top ~20 get approximate
+POPULARITY_HALF_LIFE_SECONDS = 6 * 3600  # An order counts half as much after this long
+POPULARITY_AREA_DEGREES = 0.1  # Grid cell size for areas, about 11 km
+POPULARITY_CACHE_SECONDS = 7 * 24 * 3600
+POPULARITY_FLUSH_SECONDS = 5  # How often each process merges its pending counts into the shared summaries
+
+# One-time passwords (core_app.otp)
+OTP_TTL_SECONDS = 300
+OTP_MAX_ATTEMPTS = 3  # Wrong guesses before the code is discarded
+OTP_RESEND_SECONDS = 60  # Cooldown between codes for one phone
+OTP_MAX_SENDS = 5  # Codes per phone per send window
+OTP_SEND_WINDOW_SECONDS = 3600
+OTP_MEMORY_FALLBACK = False  # Per-process codes when Redis is down; single-process only. Always on under DEBUG
+
+# Token revocation (core_app.revocation)
+REVOCATION_SYNC_SECONDS = 5  # How often each process pulls new revocations; the cross-worker lag
+REVOCATION_SYNC_OVERLAP_SECONDS = 60  # Each pull re-reads this much before the last one, for late commits
+REVOCATION_REBUILD_SECONDS = 3600  # Full rebuild, dropping ids of tokens that have expired
+REVOCATION_BLOOM_CAPACITY = 100000  # Grows on rebuild if more tokens are revoked
+REVOCATION_BLOOM_ERROR_RATE = 0.001  # False positives cost one indexed lookup
+
+# Rider presence (delivery_auth.presence)
+PRESENCE_TTL_SECONDS = 30  # Riders that have not heartbeated for this long are offline
+PRESENCE_STATE_TTL_SECONDS = 24 * 3600  # Status and load outlive the position for riders who drop out
+PRESENCE_CELL_DEGREES = 0.01  # Presence grid cell, about 1.1 km
+
+# Geofences around restaurants and customers (delivery_auth.geofence)
+GEOFENCE_RESTAURANT_RADIUS_M = 75
+GEOFENCE_EXIT_FACTOR = 1.5  # Leaving the restaurant means going beyond 1.5x its radius
+GEOFENCE_CUSTOMER_RADIUS_M = 60
+GEOFENCE_NEARBY_RADIUS_M = 500
+GEOFENCE_PICKED_UP_STATUS = 'out_for_delivery'  # Set on ready orders when the rider leaves the restaurant
+GEOFENCE_CACHE_SIZE = 10000  # Orders whose fences are kept in memory per process
+GEOFENCE_SHARED_CHECK_SECONDS = 10  # How often a worker asks the cache whether another worker saw the arrival
+
+# Multi-order batching (delivery_auth.batching)
+BATCHING_ENABLED = True
+BATCH_MAX_ORDERS = 3
+BATCH_PICKUP_RADIUS_M = 1000  # Restaurants at most this far apart
+BATCH_DROP_RADIUS_M = 3000  # Customers at most this far apart
+BATCH_TIME_WINDOW_SECONDS = 600  # Orders placed at most this far apart
+BATCH_MAX_DETOUR_M = 2000  # Extra distance any one order may ride compared to a direct delivery
+
+# Order tracking SSE streams (customer_app.tracking)
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = 1800  # Clients reconnect after this; bounds stale connections
+
 # --- IMPORTANT: Define Custom User Model ---
 # If your 'Customer' model should be used for authentication
 AUTH_USER_MODEL = 'customer_app.Customer'
@@ -222,6 +368,9 @@ AUTH_USER_MODEL = 'customer_app.Customer'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Stateless: request.user is a principal built from the token claims
+        'customer_app.authentication.CustomerJWTAuthentication',
+        'auth_app.authentication.VendorJWTAuthentication',
         # 'rest_framework_simplejwt.authentication.JWTAuthentication',
         # Keep others if needed, e.g., for admin panel:
         # 'rest_framework.authentication.SessionAuthentication',
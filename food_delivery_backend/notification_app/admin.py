@@ -0,0 +1,7 @@
+from django.contrib import admin
+
+# Register your models here.
+from .models import *
+
+admin.site.register(OutboxMessage)
+admin.site.register(DeviceToken)
@@ -0,0 +1,139 @@
+"""
+Coalescing layer for high-frequency order notifications.
+
+Location pings arrive every few seconds; the customer only needs an
+occasional "on the move" push. Each (order, kind) gets a debounce window
+and an hourly cap, tracked in the shared cache so every web worker sees the
+same state. Promoted events (picked up, nearby, arrived) skip the debounce
+and the cap, fire at most once per order, and restart the "on the move"
+window so they are not immediately followed by a repetitive push.
+
+Keys are claimed atomically when the event is decided (so concurrent
+requests cannot both send), but only for PENDING_CLAIM_SECONDS; the full
+window is set once the surrounding transaction commits. If it rolls back,
+no push was queued and the claim lapses on its own.
+
+Sent/suppressed counters are kept per kind; see stats() or
+`manage.py notification_stats`.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .outbox import enqueue_push
+
+logger = logging.getLogger(__name__)
+
+ON_THE_MOVE = 'on_the_move'
+PICKED_UP = 'picked_up'
+NEARBY = 'nearby'
+ARRIVED = 'arrived'
+
+PROMOTED_EVENTS = (PICKED_UP, NEARBY, ARRIVED)
+
+EVENT_MESSAGES = {
+    ON_THE_MOVE: ('Order {order_number} Location Updated', 'Your order is on the move!'),
+    PICKED_UP: ('Order {order_number} Picked Up', 'Your order has been picked up and is on its way.'),
+    NEARBY: ('Order {order_number} Nearby', 'Your delivery partner is almost there.'),
+    ARRIVED: ('Order {order_number} Arrived', 'Your delivery partner has arrived.'),
+}
+
+DEFAULT_POLICIES = {
+    ON_THE_MOVE: {'debounce_seconds': 300, 'max_per_hour': 6},
+}
+DEFAULT_POLICY = {'debounce_seconds': 60, 'max_per_hour': 20}
+
+PROMOTED_TTL = 6 * 3600  # Longer than any delivery
+PENDING_CLAIM_SECONDS = 10  # Longer than the transaction that queues the push
+
+SENT = 'sent'
+SUPPRESSED = 'suppressed'
+
+
+def _policy(kind):
+    policies = {**DEFAULT_POLICIES, **getattr(settings, 'NOTIFICATION_COALESCE_POLICIES', {})}
+    return policies.get(kind, DEFAULT_POLICY)
+
+
+def _count(outcome, kind):
+    key = f"notif:stats:{outcome}:{kind}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)  # Evicted between add and incr
+
+
+def _claim(key, ttl):
+    """Atomically claim key; it is held for ttl once the current transaction commits."""
+    if not cache.add(key, 1, timeout=min(ttl, PENDING_CLAIM_SECONDS)):
+        return False
+    transaction.on_commit(lambda: cache.set(key, 1, timeout=ttl))
+    return True
+
+
+def _count_sent_this_hour(rate_key):
+    cache.add(rate_key, 0, timeout=3600)
+    try:
+        cache.incr(rate_key)
+    except ValueError:
+        cache.set(rate_key, 1, timeout=3600)
+
+
+def should_send(order_number, kind):
+    """Decide (and record, on commit) whether a notification of this kind may go out now."""
+    if kind in PROMOTED_EVENTS:
+        # cache.add is atomic: only the first request for this event wins
+        if not _claim(f"notif:once:{order_number}:{kind}", PROMOTED_TTL):
+            return False
+        window = _policy(ON_THE_MOVE)['debounce_seconds']
+        debounce_key = f"notif:debounce:{order_number}:{ON_THE_MOVE}"
+        transaction.on_commit(lambda: cache.set(debounce_key, 1, timeout=window))
+        return True
+
+    policy = _policy(kind)
+    if policy['debounce_seconds'] and not _claim(f"notif:debounce:{order_number}:{kind}", policy['debounce_seconds']):
+        return False
+
+    hour = int(time.time() // 3600)
+    rate_key = f"notif:rate:{order_number}:{kind}:{hour}"
+    if (cache.get(rate_key) or 0) >= policy['max_per_hour']:
+        return False
+    transaction.on_commit(lambda: _count_sent_this_hour(rate_key))
+    return True
+
+
+def notify_order_event(order_number, recipient_type, recipient_id, kind, data=None):
+    """
+    Queue the push for an order event unless it is coalesced away.
+    Call inside the view's transaction.atomic() block, like enqueue_push().
+    Returns True when a push was queued.
+    """
+    if not should_send(order_number, kind):
+        _count(SUPPRESSED, kind)
+        logger.debug(f"Suppressed {kind} notification for order {order_number}")
+        return False
+    title, body = EVENT_MESSAGES[kind]
+    enqueue_push(
+        recipient_type,
+        recipient_id,
+        title.format(order_number=order_number),
+        body.format(order_number=order_number),
+        {'order_number': str(order_number), 'event': kind, **(data or {})},
+    )
+    transaction.on_commit(lambda: _count(SENT, kind))
+    return True
+
+
+def stats():
+    """Return {kind: {'sent': n, 'suppressed': n}} for every known event kind."""
+    keys = {(outcome, kind): f"notif:stats:{outcome}:{kind}"
+            for kind in EVENT_MESSAGES for outcome in (SENT, SUPPRESSED)}
+    values = cache.get_many(keys.values())
+    return {
+        kind: {outcome: values.get(keys[(outcome, kind)], 0) for outcome in (SENT, SUPPRESSED)}
+        for kind in EVENT_MESSAGES
+    }
@@ -0,0 +1,258 @@
+"""
+Single entry point for push notification delivery.
+
+Messages are grouped into FCM send_each batches of up to FCM_BATCH_SIZE
+(500, the FCM limit), paced by a token bucket so bursts stay inside the
+project quota, and reported back per token. The Firebase app, and with it
+the messaging client's pooled HTTP session, is created once per process.
+
+Setting FCM_ENDPOINT_URL switches to a plain HTTP transport that speaks the
+FCM v1 wire format to another endpoint, e.g. the local fake server started
+by `manage.py fake_fcm_server`, so throughput can be benchmarked offline.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+try:
+    import firebase_admin
+    from firebase_admin import credentials, messaging
+except ImportError:
+    firebase_admin = None
+    messaging = None
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+logger = logging.getLogger(__name__)
+
+FCM_MAX_BATCH_SIZE = 500
+
+# Errors after which a token will never work again
+PERMANENT_ERROR_CODES = {'UNREGISTERED', 'SENDER_ID_MISMATCH'}
+
+# INVALID_ARGUMENT also covers bad payloads; it only condemns the token when FCM says the token is at fault
+INVALID_TOKEN_MARKER = 'registration token'
+
+
+@dataclass
+class PushMessage:
+    token: str
+    title: str
+    body: str
+    data: dict = field(default_factory=dict)
+    android_channel_id: str = None
+    sound: str = None
+
+
+@dataclass
+class SendResult:
+    token: str
+    success: bool
+    message_id: str = None
+    error_code: str = None
+    error: str = None
+
+    @property
+    def is_permanent_failure(self):
+        if self.success:
+            return False
+        if self.error_code == 'INVALID_ARGUMENT':
+            return INVALID_TOKEN_MARKER in (self.error or '').lower()
+        return self.error_code in PERMANENT_ERROR_CODES
+
+
+_firebase_app = None
+_firebase_lock = threading.Lock()
+
+
+def get_firebase_app():
+    """Initialise the Firebase Admin SDK once and reuse it for every send."""
+    global _firebase_app
+    if _firebase_app is None:
+        with _firebase_lock:
+            if _firebase_app is None:
+                if firebase_admin is None:
+                    raise RuntimeError('firebase_admin is not installed')
+                try:
+                    _firebase_app = firebase_admin.get_app()
+                except ValueError:
+                    cred_path = os.path.abspath(settings.FIREBASE_CREDENTIALS_PATH)
+                    _firebase_app = firebase_admin.initialize_app(credentials.Certificate(cred_path))
+    return _firebase_app
+
+
+class TokenBucket:
+    """Blocking token bucket used to pace sends to a messages-per-second quota."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class FirebaseTransport:
+    """Sends batches through firebase_admin.messaging.send_each."""
+
+    def _build(self, message):
+        android = None
+        if message.android_channel_id or message.sound:
+            android = messaging.AndroidConfig(
+                priority='high',
+                notification=messaging.AndroidNotification(
+                    channel_id=message.android_channel_id,
+                    sound=message.sound,
+                ),
+            )
+        return messaging.Message(
+            notification=messaging.Notification(title=message.title, body=message.body),
+            data={k: str(v) for k, v in message.data.items()} or None,
+            android=android,
+            token=message.token,
+        )
+
+    @staticmethod
+    def _error_code(exc):
+        if isinstance(exc, messaging.UnregisteredError):
+            return 'UNREGISTERED'
+        if isinstance(exc, messaging.SenderIdMismatchError):
+            return 'SENDER_ID_MISMATCH'
+        if isinstance(exc, messaging.QuotaExceededError):
+            return 'QUOTA_EXCEEDED'
+        code = getattr(exc, 'code', None)
+        return str(code).upper() if code else 'UNKNOWN'
+
+    def send_batch(self, messages):
+        if messaging is None:
+            raise RuntimeError('firebase_admin.messaging is not available')
+        response = messaging.send_each([self._build(m) for m in messages], app=get_firebase_app())
+        results = []
+        for message, resp in zip(messages, response.responses):
+            if resp.success:
+                results.append(SendResult(message.token, True, message_id=resp.message_id))
+            else:
+                results.append(SendResult(
+                    message.token, False,
+                    error_code=self._error_code(resp.exception),
+                    error=str(resp.exception),
+                ))
+        return results
+
+
+class HttpTransport:
+    """
+    Minimal FCM v1 client over a shared requests.Session.
+
+    Used against FCM_ENDPOINT_URL (fake server / emulator); no OAuth.
+    """
+
+    def __init__(self, endpoint, project_id='fake-project', concurrency=50, timeout=10):
+        if requests is None:
+            raise RuntimeError('requests is not installed')
+        self.url = f"{endpoint.rstrip('/')}/v1/projects/{project_id}/messages:send"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def _send_one(self, message):
+        body = {'message': {
+            'token': message.token,
+            'notification': {'title': message.title, 'body': message.body},
+            'data': {k: str(v) for k, v in message.data.items()},
+        }}
+        try:
+            resp = self.session.post(self.url, json=body, timeout=self.timeout)
+        except requests.RequestException as e:
+            return SendResult(message.token, False, error_code='UNAVAILABLE', error=str(e))
+        if resp.status_code == 200:
+            return SendResult(message.token, True, message_id=resp.json().get('name'))
+        error = resp.json().get('error', {}) if resp.content else {}
+        code = error.get('status', 'UNKNOWN')
+        for detail in error.get('details', []):
+            code = detail.get('errorCode', code)
+        return SendResult(message.token, False, error_code=code, error=error.get('message'))
+
+    def send_batch(self, messages):
+        return list(self.executor.map(self._send_one, messages))
+
+
+class NotificationDispatcher:
+    def __init__(self, transport, batch_size=FCM_MAX_BATCH_SIZE, max_per_second=0):
+        self.transport = transport
+        self.batch_size = min(batch_size, FCM_MAX_BATCH_SIZE)
+        self.bucket = TokenBucket(max_per_second) if max_per_second else None
+
+    def send(self, messages):
+        """Send messages in quota-paced batches. Returns one SendResult per message, in order."""
+        results = []
+        for start in range(0, len(messages), self.batch_size):
+            chunk = messages[start:start + self.batch_size]
+            if self.bucket:
+                self.bucket.acquire(len(chunk))
+            try:
+                results.extend(self.transport.send_batch(chunk))
+            except Exception as e:
+                logger.error(f"FCM batch of {len(chunk)} failed: {e}")
+                results.extend(SendResult(m.token, False, error_code='UNAVAILABLE', error=str(e)) for m in chunk)
+        return results
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def build_transport():
+    endpoint = getattr(settings, 'FCM_ENDPOINT_URL', None)
+    if endpoint:
+        return HttpTransport(endpoint, concurrency=getattr(settings, 'FCM_HTTP_CONCURRENCY', 50))
+    return FirebaseTransport()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = NotificationDispatcher(
+                    build_transport(),
+                    batch_size=getattr(settings, 'FCM_BATCH_SIZE', FCM_MAX_BATCH_SIZE),
+                    max_per_second=getattr(settings, 'FCM_MAX_MESSAGES_PER_SECOND', 0),
+                )
+    return _dispatcher
+
+
+def send_notification_to_device(token, title, body):
+    """Send a single push. Returns True on success; errors are logged, not raised."""
+    result = get_dispatcher().send([PushMessage(token=token, title=title, body=body)])[0]
+    if result.success:
+        logger.info(f"FCM notification sent: {result.message_id}")
+    else:
+        logger.error(f"Failed to send FCM notification: {result.error_code} {result.error}")
+    return result.success
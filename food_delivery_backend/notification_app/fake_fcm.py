@@ -0,0 +1,74 @@
+"""
+Local stand-in for the FCM v1 send endpoint, for offline benchmarking.
+
+Tokens starting with 'stale' answer 404 UNREGISTERED and tokens starting
+with 'bad' answer 400 INVALID_ARGUMENT, so token pruning paths can be
+exercised too.
+"""
+import json
+import itertools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _error(code, status, error_code, message):
+    return code, {'error': {
+        'code': code,
+        'message': message,
+        'status': status,
+        'details': [{
+            '@type': 'type.googleapis.com/google.firebase.fcm.v1.FcmError',
+            'errorCode': error_code,
+        }],
+    }}
+
+
+class FakeFCMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency_ms=0):
+        super().__init__(address, FakeFCMHandler)
+        self.latency = latency_ms / 1000.0
+        self.counter = itertools.count(1)
+        self.stats = {'sent': 0, 'failed': 0}
+        self.stats_lock = threading.Lock()
+
+    def respond(self, message):
+        token = message.get('token') or ''
+        if token.startswith('stale'):
+            return _error(404, 'NOT_FOUND', 'UNREGISTERED', 'Requested entity was not found.')
+        if token.startswith('bad') or not token:
+            return _error(400, 'INVALID_ARGUMENT', 'INVALID_ARGUMENT', 'The registration token is not valid.')
+        return 200, {'name': f'projects/fake-project/messages/{next(self.counter)}'}
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeFCMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real endpoint
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            message = json.loads(self.rfile.read(length) or b'{}').get('message', {})
+        except ValueError:
+            message = {}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        code, body = self.server.respond(message)
+        with self.server.stats_lock:
+            self.server.stats['sent' if code == 200 else 'failed'] += 1
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # Per-request logging would dominate benchmark time
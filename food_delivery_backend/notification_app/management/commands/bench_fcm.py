@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notification_app.dispatch import HttpTransport, NotificationDispatcher, PushMessage
+from notification_app.fake_fcm import FakeFCMServer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark batched push delivery against a fake FCM endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=5000)
+        parser.add_argument('--endpoint', default=None,
+                            help='Existing fake endpoint; by default one is started in-process.')
+        parser.add_argument('--latency-ms', type=float, default=5, help='Latency of the in-process fake server.')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--rate', type=float, default=0, help='Messages per second cap (0 = unpaced).')
+        parser.add_argument('--stale-ratio', type=float, default=0.01, help='Fraction of unregistered tokens.')
+
+    def handle(self, *args, **options):
+        server = None
+        endpoint = options['endpoint']
+        if not endpoint:
+            server = FakeFCMServer(('127.0.0.1', 0), latency_ms=options['latency_ms'])
+            server.start_in_thread()
+            endpoint = f'http://127.0.0.1:{server.server_address[1]}'
+
+        count = options['messages']
+        stale_every = int(1 / options['stale_ratio']) if options['stale_ratio'] else 0
+        messages = [
+            PushMessage(
+                token=f"stale-{i}" if stale_every and i % stale_every == 0 else f"token-{i}",
+                title='Benchmark',
+                body=f'Message {i}',
+            )
+            for i in range(count)
+        ]
+        dispatcher = NotificationDispatcher(
+            HttpTransport(endpoint, concurrency=options['concurrency']),
+            batch_size=options['batch_size'],
+            max_per_second=options['rate'],
+        )
+
+        started = time.perf_counter()
+        results = dispatcher.send(messages)
+        elapsed = time.perf_counter() - started
+
+        ok = sum(1 for r in results if r.success)
+        pruned = sum(1 for r in results if r.is_permanent_failure)
+        self.stdout.write(
+            f"{count} messages in {elapsed:.2f}s ({count / elapsed:.0f} msg/s): "
+            f"{ok} delivered, {pruned} permanent failures, {count - ok - pruned} transient failures"
+        )
+        if server:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notification_app.outbox import drain_once
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbox side effects (push notifications) with retries and dead-lettering.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'OUTBOX_BATCH_SIZE', 500))
+        parser.add_argument('--max-attempts', type=int, default=getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8))
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'OUTBOX_POLL_INTERVAL', 1.0),
+                            help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--once', action='store_true', help='Drain until empty, then exit.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_attempts = options['max_attempts']
+        self.stdout.write(f"Draining outbox (batch size {batch_size}, max attempts {max_attempts})")
+        try:
+            while True:
+                sent, failed = drain_once(batch_size, max_attempts)
+                if sent or failed:
+                    self.stdout.write(f"Processed batch: {sent} sent, {failed} failed")
+                    continue  # More may be waiting; don't sleep between full batches
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping outbox worker')
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notification_app.registry import expire_inactive
+
+
+class Command(BaseCommand):
+    help = 'Delete device tokens whose app has not re-registered recently. Run daily (cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'DEVICE_TOKEN_TTL_DAYS', 60))
+
+    def handle(self, *args, **options):
+        deleted = expire_inactive(options['days'])
+        self.stdout.write(f"Expired {deleted} device tokens inactive for {options['days']}+ days")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from notification_app.fake_fcm import FakeFCMServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake FCM v1 endpoint. Point FCM_ENDPOINT_URL at it to benchmark offline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=0, help='Artificial per-request latency.')
+
+    def handle(self, *args, **options):
+        server = FakeFCMServer((options['host'], options['port']), latency_ms=options['latency_ms'])
+        self.stdout.write(f"Fake FCM listening on http://{options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(f"Stopping fake FCM: {server.stats}")
+        finally:
+            server.server_close()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from notification_app.coalesce import stats
+
+
+class Command(BaseCommand):
+    help = 'Show how many coalesced order notifications were sent vs suppressed.'
+
+    def handle(self, *args, **options):
+        total_sent = total_suppressed = 0
+        for kind, counts in stats().items():
+            sent, suppressed = counts['sent'], counts['suppressed']
+            total_sent += sent
+            total_suppressed += suppressed
+            self.stdout.write(f"{kind:<12} sent={sent:<8} suppressed={suppressed}")
+        attempted = total_sent + total_suppressed
+        saved = (100.0 * total_suppressed / attempted) if attempted else 0.0
+        self.stdout.write(f"Total: {total_sent} sent, {total_suppressed} suppressed ({saved:.1f}% of sends saved)")
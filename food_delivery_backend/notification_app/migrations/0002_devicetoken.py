@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_type', models.CharField(choices=[('customer', 'Customer'), ('vendor', 'Vendor'), ('delivery', 'Delivery Partner')], max_length=20)),
+                ('user_id', models.CharField(max_length=64)),
+                ('token', models.CharField(max_length=256, unique=True)),
+                ('platform', models.CharField(blank=True, default='', max_length=20)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_type', 'user_id'], name='devicetoken_user_idx'), models.Index(fields=['last_seen'], name='devicetoken_last_seen_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:53
+
+from django.db import migrations
+
+
+def backfill_device_tokens(apps, schema_editor):
+    """Copy the legacy single fcm_token fields into the registry."""
+    DeviceToken = apps.get_model('notification_app', 'DeviceToken')
+    sources = [
+        ('vendor', apps.get_model('auth_app', 'Vendor'), 'vendor_id'),
+        ('customer', apps.get_model('customer_app', 'Customer'), 'customer_id'),
+        ('delivery', apps.get_model('delivery_auth', 'DeliveryUser'), 'id'),
+    ]
+    seen = set()
+    rows = []
+    for user_type, model, id_field in sources:
+        for user_id, token in model.objects.exclude(fcm_token__isnull=True).exclude(fcm_token='').values_list(id_field, 'fcm_token'):
+            if token in seen:
+                continue
+            seen.add(token)
+            rows.append(DeviceToken(user_type=user_type, user_id=str(user_id), token=token))
+    DeviceToken.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification_app', '0002_devicetoken'),
+        ('auth_app', '0011_alter_vendor_vendor_id'),
+        ('customer_app', '0005_alter_customer_customer_id'),
+        ('delivery_auth', '0002_deliveryuser_fcm_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_device_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxMessage(models.Model):
+    """
+    Side effect (push notification etc.) recorded in the same transaction as
+    the state change that caused it. Drained by the drain_outbox command.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_DEAD, 'Dead'),
+    ]
+
+    kind = models.CharField(max_length=50)  # Handler key, e.g. 'push'
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)  # Lease held by a worker while processing
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+
+class DeviceToken(models.Model):
+    """One row per device; a user may have several. Pruned when FCM rejects the token."""
+    USER_TYPE_CUSTOMER = 'customer'
+    USER_TYPE_VENDOR = 'vendor'
+    USER_TYPE_DELIVERY = 'delivery'
+    USER_TYPE_CHOICES = [
+        (USER_TYPE_CUSTOMER, 'Customer'),
+        (USER_TYPE_VENDOR, 'Vendor'),
+        (USER_TYPE_DELIVERY, 'Delivery Partner'),
+    ]
+
+    user_type = models.CharField(max_length=20, choices=USER_TYPE_CHOICES)
+    user_id = models.CharField(max_length=64)  # customer_id, vendor_id or DeliveryUser UUID
+    token = models.CharField(max_length=256, unique=True)
+    platform = models.CharField(max_length=20, blank=True, default='')  # android / ios / web
+    last_seen = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_type', 'user_id'], name='devicetoken_user_idx'),
+            models.Index(fields=['last_seen'], name='devicetoken_last_seen_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_type}:{self.user_id} ({self.platform or 'unknown'})"
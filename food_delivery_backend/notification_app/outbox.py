@@ -0,0 +1,223 @@
+"""
+Transactional outbox.
+
+Views call enqueue()/enqueue_push() inside the same transaction.atomic()
+block as the state change, so a side effect is recorded if and only if the
+change commits. A separate worker (manage.py drain_outbox) claims pending
+rows in batches, hands them to the handler registered for their kind and
+retries failures with exponential backoff until they are dead-lettered.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .dispatch import PushMessage, get_dispatcher
+from .models import OutboxMessage
+from .registry import remove_tokens, tokens_for_many
+
+logger = logging.getLogger(__name__)
+
+PUSH = 'push'
+
+_handlers = {}
+
+
+def register_handler(kind):
+    """
+    Register a batch handler for an outbox kind.
+
+    The handler receives a list of OutboxMessage rows and returns a dict of
+    message id -> error string for the messages that failed. Messages missing
+    from the dict are treated as delivered.
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(kind, payload, delay_seconds=0):
+    """Record a side effect. Call inside the caller's transaction.atomic() block."""
+    return OutboxMessage.objects.create(
+        kind=kind,
+        payload=payload,
+        next_attempt_at=timezone.now() + timedelta(seconds=delay_seconds),
+    )
+
+
+def enqueue_push(recipient_type, recipient_id, title, body, data=None):
+    """
+    Queue a push notification for a customer, vendor or delivery partner.
+
+    Device tokens are resolved from the registry at delivery time, so the
+    push reaches every device the recipient has registered by then.
+    """
+    return enqueue(PUSH, {
+        'recipient_type': recipient_type,
+        'recipient_id': str(recipient_id),
+        'title': title,
+        'body': body,
+        'data': data or {},
+    })
+
+
+def claim_batch(batch_size, lease_seconds=None):
+    """
+    Lease up to batch_size due messages to this worker.
+
+    Rows stuck in 'processing' past their lease (crashed worker) are picked
+    up again. On databases with SKIP LOCKED several workers can drain
+    concurrently without blocking each other; elsewhere each row is leased
+    with an update conditioned on the state it was selected in, so when two
+    workers race for a row only the one whose update matched processes it.
+    """
+    lease_seconds = lease_seconds or _setting('OUTBOX_LEASE_SECONDS', 60)
+    now = timezone.now()
+    lease = {
+        'status': OutboxMessage.STATUS_PROCESSING,
+        'locked_until': now + timedelta(seconds=lease_seconds),
+    }
+    claimable = {
+        OutboxMessage.STATUS_PENDING: Q(status=OutboxMessage.STATUS_PENDING, next_attempt_at__lte=now),
+        OutboxMessage.STATUS_PROCESSING: Q(status=OutboxMessage.STATUS_PROCESSING, locked_until__lte=now),
+    }
+    with transaction.atomic():
+        due = OutboxMessage.objects.filter(
+            claimable[OutboxMessage.STATUS_PENDING] | claimable[OutboxMessage.STATUS_PROCESSING]
+        ).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+            ids = list(due.values_list('id', flat=True)[:batch_size])
+            if ids:
+                OutboxMessage.objects.filter(id__in=ids).update(**lease)
+        else:
+            ids = []
+            for message_id, status in due.values_list('id', 'status')[:batch_size]:
+                if OutboxMessage.objects.filter(claimable[status], id=message_id).update(**lease):
+                    ids.append(message_id)
+    if not ids:
+        return []
+    return list(OutboxMessage.objects.filter(id__in=ids).order_by('id'))
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped at OUTBOX_RETRY_MAX_SECONDS."""
+    base = _setting('OUTBOX_RETRY_BASE_SECONDS', 5)
+    cap = _setting('OUTBOX_RETRY_MAX_SECONDS', 900)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _mark_failed(message, error, max_attempts):
+    message.attempts += 1
+    message.last_error = error
+    message.locked_until = None
+    if message.attempts >= max_attempts:
+        message.status = OutboxMessage.STATUS_DEAD
+        message.processed_at = timezone.now()
+        logger.error(f"Outbox message {message.id} dead-lettered after {message.attempts} attempts: {error}")
+    else:
+        message.status = OutboxMessage.STATUS_PENDING
+        message.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(message.attempts))
+    message.save(update_fields=['attempts', 'last_error', 'locked_until', 'status', 'next_attempt_at', 'processed_at'])
+
+
+def process_batch(messages, max_attempts=None):
+    """Run handlers for a claimed batch. Returns (sent, failed) counts."""
+    max_attempts = max_attempts or _setting('OUTBOX_MAX_ATTEMPTS', 8)
+    by_kind = {}
+    for message in messages:
+        by_kind.setdefault(message.kind, []).append(message)
+
+    sent_ids = []
+    failed = 0
+    for kind, group in by_kind.items():
+        handler = _handlers.get(kind)
+        if handler is None:
+            errors = {m.id: f"No handler registered for kind '{kind}'" for m in group}
+        else:
+            try:
+                errors = handler(group) or {}
+            except Exception as e:
+                logger.error(f"Outbox handler for '{kind}' failed: {e}")
+                errors = {m.id: str(e) for m in group}
+        for message in group:
+            if message.id in errors:
+                _mark_failed(message, errors[message.id], max_attempts)
+                failed += 1
+            else:
+                sent_ids.append(message.id)
+
+    if sent_ids:
+        OutboxMessage.objects.filter(id__in=sent_ids).update(
+            status=OutboxMessage.STATUS_SENT,
+            locked_until=None,
+            processed_at=timezone.now(),
+        )
+    return len(sent_ids), failed
+
+
+def drain_once(batch_size=None, max_attempts=None):
+    """Claim and process one batch. Returns (sent, failed) counts."""
+    batch_size = batch_size or _setting('OUTBOX_BATCH_SIZE', 500)
+    messages = claim_batch(batch_size)
+    if not messages:
+        return 0, 0
+    return process_batch(messages, max_attempts)
+
+
+@register_handler(PUSH)
+def deliver_push(messages):
+    """
+    Fan each push out to all of the recipient's registered devices.
+
+    A message counts as delivered once any device accepts it; it is retried
+    only when no device accepted it and at least one failure was transient.
+    Tokens FCM rejects as unregistered/invalid are removed from the registry.
+    """
+    devices = tokens_for_many(
+        (m.payload['recipient_type'], m.payload['recipient_id'])
+        for m in messages if m.payload.get('recipient_type')
+    )
+    fanout = []  # (message, PushMessage)
+    for message in messages:
+        payload = message.payload
+        tokens = devices.get((payload.get('recipient_type'), str(payload.get('recipient_id'))), [])
+        if not tokens and payload.get('token'):
+            tokens = [payload['token']]  # Queued before the registry existed
+        for token in tokens:
+            fanout.append((message, PushMessage(
+                token=token,
+                title=payload['title'],
+                body=payload['body'],
+                data=payload.get('data') or {},
+            )))
+    if not fanout:
+        return {}  # No live devices: nothing to deliver
+
+    results = get_dispatcher().send([push for _, push in fanout])
+
+    delivered = set()
+    transient = {}
+    stale_tokens = []
+    for (message, push), result in zip(fanout, results):
+        if result.success:
+            delivered.add(message.id)
+        elif result.is_permanent_failure:
+            stale_tokens.append(push.token)
+        else:
+            transient[message.id] = f"{result.error_code}: {result.error}"
+
+    if stale_tokens:
+        logger.warning(f"FCM rejected {len(stale_tokens)} tokens; removing them from the registry")
+        remove_tokens(stale_tokens)
+    return {message_id: error for message_id, error in transient.items() if message_id not in delivered}
@@ -0,0 +1,70 @@
+"""
+Multi-device FCM token registry.
+
+Apps register their token on every launch/refresh, which bumps last_seen.
+Tokens FCM reports as unregistered or invalid are removed as soon as the
+dispatcher sees the error, and tokens not seen for DEVICE_TOKEN_TTL_DAYS
+are expired by `manage.py expire_device_tokens`.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DeviceToken
+
+logger = logging.getLogger(__name__)
+
+
+def register_token(user_type, user_id, token, platform=''):
+    """Add or refresh a device token. A token moves to whoever registered it last."""
+    device, _ = DeviceToken.objects.update_or_create(
+        token=token,
+        defaults={
+            'user_type': user_type,
+            'user_id': str(user_id),
+            'platform': platform or '',
+            'last_seen': timezone.now(),
+        },
+    )
+    return device
+
+
+def tokens_for(user_type, user_id):
+    return list(
+        DeviceToken.objects.filter(user_type=user_type, user_id=str(user_id)).values_list('token', flat=True)
+    )
+
+
+def tokens_for_many(recipients):
+    """Resolve {(user_type, user_id), ...} to {(user_type, user_id): [tokens]} in one query."""
+    recipients = {(t, str(i)) for t, i in recipients}
+    if not recipients:
+        return {}
+    query = Q()
+    for user_type, user_id in recipients:
+        query |= Q(user_type=user_type, user_id=user_id)
+    result = {recipient: [] for recipient in recipients}
+    for user_type, user_id, token in DeviceToken.objects.filter(query).values_list('user_type', 'user_id', 'token'):
+        result[(user_type, user_id)].append(token)
+    return result
+
+
+def remove_tokens(tokens):
+    tokens = list(set(tokens))
+    if not tokens:
+        return 0
+    deleted, _ = DeviceToken.objects.filter(token__in=tokens).delete()
+    if deleted:
+        logger.info(f"Pruned {deleted} stale device tokens")
+    return deleted
+
+
+def expire_inactive(days=None):
+    """Delete tokens whose app has not checked in for `days` days."""
+    days = days if days is not None else getattr(settings, 'DEVICE_TOKEN_TTL_DAYS', 60)
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = DeviceToken.objects.filter(last_seen__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,178 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import coalesce, outbox
+from .dispatch import FCM_MAX_BATCH_SIZE, NotificationDispatcher, PushMessage, SendResult
+from .models import OutboxMessage
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'notification-app-tests'}}
+
+
+class Rollback(Exception):
+    pass
+
+
+@override_settings(CACHES=LOCMEM)
+class CoalesceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def notify(self, kind):
+        with self.captureOnCommitCallbacks(execute=True):
+            return coalesce.notify_order_event('ORD1', 'customer', 'C1', kind)
+
+    def test_promoted_event_fires_once(self):
+        self.assertTrue(self.notify(coalesce.NEARBY))
+        self.assertFalse(self.notify(coalesce.NEARBY))
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_rolled_back_event_does_not_hold_the_window(self):
+        try:
+            with transaction.atomic():
+                self.assertTrue(coalesce.notify_order_event('ORD1', 'customer', 'C1', coalesce.ARRIVED))
+                raise Rollback
+        except Rollback:
+            pass
+        self.assertEqual(OutboxMessage.objects.count(), 0)
+        # The pending claim lapses within PENDING_CLAIM_SECONDS instead of lasting PROMOTED_TTL
+        self.assertLessEqual(self.expires_in('notif:once:ORD1:arrived'), coalesce.PENDING_CLAIM_SECONDS)
+
+    def test_committed_claim_holds_the_full_window(self):
+        self.assertTrue(self.notify(coalesce.ON_THE_MOVE))
+        self.assertFalse(self.notify(coalesce.ON_THE_MOVE))
+        self.assertGreater(self.expires_in('notif:debounce:ORD1:on_the_move'), coalesce.PENDING_CLAIM_SECONDS)
+
+    def expires_in(self, key):
+        return cache._expire_info[cache.make_and_validate_key(key)] - time.time()
+
+
+@override_settings(OUTBOX_RETRY_BASE_SECONDS=5, OUTBOX_RETRY_MAX_SECONDS=900)
+class OutboxTests(TestCase):
+    def test_claim_skips_live_leases(self):
+        due = outbox.enqueue('test', {})
+        leased = OutboxMessage.objects.create(
+            kind='test', status=OutboxMessage.STATUS_PROCESSING,
+            locked_until=timezone.now() + timedelta(minutes=1),
+        )
+        expired = OutboxMessage.objects.create(
+            kind='test', status=OutboxMessage.STATUS_PROCESSING,
+            locked_until=timezone.now() - timedelta(seconds=1),
+        )
+        self.assertEqual([m.id for m in outbox.claim_batch(10)], [due.id, expired.id])
+        self.assertEqual(outbox.claim_batch(10), [])
+        leased.refresh_from_db()
+        self.assertEqual(leased.status, OutboxMessage.STATUS_PROCESSING)
+
+    def test_row_claimed_by_another_worker_is_not_processed(self):
+        first = outbox.enqueue('test', {})
+        second = outbox.enqueue('test', {})
+        real_filter = OutboxMessage.objects.filter
+        calls = []
+
+        def racing_filter(*args, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                # Another worker leases the first row between our select and our update
+                OutboxMessage._base_manager.filter(id=first.id).update(
+                    status=OutboxMessage.STATUS_PROCESSING,
+                    locked_until=timezone.now() + timedelta(minutes=1),
+                )
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(OutboxMessage.objects, 'filter', side_effect=racing_filter):
+            claimed = outbox.claim_batch(10)
+        self.assertEqual([m.id for m in claimed], [second.id])
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        with mock.patch('notification_app.outbox.random.uniform', return_value=1.0):
+            delays = [outbox.retry_delay(attempt) for attempt in range(1, 10)]
+        self.assertEqual(delays, [5, 10, 20, 40, 80, 160, 320, 640, 900])
+
+    def test_backoff_jitter_stays_within_twenty_percent(self):
+        for _ in range(50):
+            self.assertTrue(8 <= outbox.retry_delay(2) <= 12)
+
+    def test_failure_is_rescheduled_then_dead_lettered(self):
+        message = outbox.enqueue('unregistered-kind', {})
+
+        self.assertEqual(outbox.process_batch(outbox.claim_batch(10), max_attempts=2), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertEqual(outbox.claim_batch(10), [])  # Not due until the backoff elapses
+
+        OutboxMessage.objects.filter(id=message.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.process_batch(outbox.claim_batch(10), max_attempts=2), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_DEAD)
+        self.assertEqual(message.attempts, 2)
+        self.assertIsNotNone(message.processed_at)
+        self.assertEqual(outbox.claim_batch(10), [])
+
+
+class FakeTransport:
+    """Records batch sizes; fails tokens listed in errors, or the whole batch when told to."""
+
+    def __init__(self, errors=None, fail_batches=()):
+        self.errors = errors or {}
+        self.fail_batches = set(fail_batches)
+        self.batches = []
+
+    def send_batch(self, messages):
+        self.batches.append(len(messages))
+        if len(self.batches) - 1 in self.fail_batches:
+            raise ConnectionError('connection reset')
+        results = []
+        for message in messages:
+            if message.token in self.errors:
+                code, error = self.errors[message.token]
+                results.append(SendResult(message.token, False, error_code=code, error=error))
+            else:
+                results.append(SendResult(message.token, True, message_id=f"id-{message.token}"))
+        return results
+
+
+def pushes(count):
+    return [PushMessage(token=f"t{i}", title='Hi', body='There') for i in range(count)]
+
+
+class DispatcherTests(TestCase):
+    def test_chunks_at_the_fcm_limit(self):
+        transport = FakeTransport()
+        results = NotificationDispatcher(transport, batch_size=1000).send(pushes(1201))
+        self.assertEqual(transport.batches, [FCM_MAX_BATCH_SIZE, FCM_MAX_BATCH_SIZE, 201])
+        self.assertEqual(len(results), 1201)
+
+    def test_results_map_back_to_their_tokens(self):
+        transport = FakeTransport(errors={
+            't1': ('UNREGISTERED', 'Requested entity was not found.'),
+            't2': ('QUOTA_EXCEEDED', 'Quota exceeded'),
+        })
+        results = NotificationDispatcher(transport, batch_size=2).send(pushes(4))
+        self.assertEqual([r.token for r in results], ['t0', 't1', 't2', 't3'])
+        self.assertEqual([r.success for r in results], [True, False, False, True])
+        self.assertEqual(results[3].message_id, 'id-t3')
+        self.assertEqual([r.is_permanent_failure for r in results], [False, True, False, False])
+
+    def test_batch_exception_marks_every_token_unavailable(self):
+        transport = FakeTransport(fail_batches={0})
+        results = NotificationDispatcher(transport, batch_size=2).send(pushes(3))
+        self.assertEqual([r.error_code for r in results[:2]], ['UNAVAILABLE', 'UNAVAILABLE'])
+        self.assertEqual([r.token for r in results[:2]], ['t0', 't1'])
+        self.assertFalse(any(r.is_permanent_failure for r in results[:2]))
+        self.assertTrue(results[2].success)
+
+    def test_invalid_argument_prunes_only_bad_tokens(self):
+        bad_token = SendResult('t0', False, error_code='INVALID_ARGUMENT',
+                               error='The registration token is not a valid FCM registration token')
+        bad_payload = SendResult('t1', False, error_code='INVALID_ARGUMENT',
+                                 error='Invalid value at \'message.data[0].value\'')
+        self.assertTrue(bad_token.is_permanent_failure)
+        self.assertFalse(bad_payload.is_permanent_failure)